@@ -0,0 +1,238 @@
+"""
+异步网页爬虫 - s 模式下的 asyncio 抓取引擎
+
+线程版每个 worker 一次只做一个阻塞请求，之后还要 sleep REQUEST_DELAY，
+吞吐上限约为 NUM_WORKERS / (抓取耗时 + 5s)。这里在一个进程内用 FETCH_CONCURRENCY
+个协程共享一个 aiohttp 连接池，同时进行数百个抓取；礼貌性由每主机并发上限和
+URLManager 的按域名令牌桶调度保证。
+
+流程与线程版相同: URLManager 取任务/去重 → 抓取 → ContentExtractor 提取 → 索引 → 链接入队。
+内容提取和同步的 Redis 调用放在线程池中执行；索引（分词、CLIP 向量化、写库）在单独线程的
+event loop 上执行（与线程版共享 event loop 的做法相同），都不阻塞抓取的 event loop。
+"""
+import asyncio
+import logging
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from url_manager import URLManager
+from content_extractor import ContentExtractor
+from async_fetcher import AsyncFetcher
+from crawler import index_page
+from crawler_config import (
+    DEFAULT_SEED_URLS, MAX_DEPTH, FETCH_CONCURRENCY, FETCH_CPU_THREADS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCrawler:
+    """单进程高并发爬虫"""
+
+    def __init__(self, concurrency: int = FETCH_CONCURRENCY, seed_urls: Optional[List[str]] = None):
+        self.concurrency = concurrency
+        self.seed_urls = seed_urls or DEFAULT_SEED_URLS
+        self.url_manager = URLManager()
+        self.content_extractor = ContentExtractor()
+        self.fetcher = AsyncFetcher(concurrency=concurrency)
+        self.queue: Optional[asyncio.Queue] = None
+        self.stop_event: Optional[asyncio.Event] = None
+        self.index_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight: Dict[int, dict] = {}  # slot -> 已开始处理（可能已标记为访问过）的任务
+
+        self.processed = 0
+        self.indexed = 0
+        self.index_failed = 0
+
+    def stop(self):
+        if self.stop_event and not self.stop_event.is_set():
+            logger.info("Stopping async crawler...")
+            self.stop_event.set()
+
+    async def run(self):
+        """启动爬虫，直到收到停止信号"""
+        event_loop = asyncio.get_running_loop()
+        event_loop.set_default_executor(ThreadPoolExecutor(max_workers=FETCH_CPU_THREADS))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            event_loop.add_signal_handler(sig, self.stop)
+
+        self.stop_event = asyncio.Event()
+        self.queue = asyncio.Queue(maxsize=self.concurrency)
+        self.index_loop = asyncio.new_event_loop()
+        threading.Thread(target=self.index_loop.run_forever, name="index-loop", daemon=True).start()
+        logger.info(f"Starting async crawler with {self.concurrency} concurrent fetches")
+
+        await self._initialize_seeds()
+        async with self.fetcher:
+            feeder = asyncio.create_task(self._feed())
+            workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+            try:
+                await self._monitor()
+            finally:
+                self.stop()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                # feeder 看到停止标志后自行退出，避免丢掉刚从 Redis 取出的任务
+                await asyncio.gather(feeder, return_exceptions=True)
+                await self._requeue_pending()
+                self.index_loop.call_soon_threadsafe(self.index_loop.stop)
+        logger.info("Async crawler stopped")
+
+    async def _initialize_seeds(self):
+        queue_size = await asyncio.to_thread(self.url_manager.get_queue_size)
+        if queue_size == 0:
+            logger.info(f"Initializing with {len(self.seed_urls)} seed URLs")
+            added = await asyncio.to_thread(self.url_manager.add_urls, self.seed_urls, 0)
+            logger.info(f"Added {added} seed URLs to queue")
+        else:
+            logger.info(f"Queue already has {queue_size} URLs, skipping seed initialization")
+
+    async def _feed(self):
+        """从 Redis 批量取任务，保持本地队列有货"""
+        while not self.stop_event.is_set():
+            room = self.queue.maxsize - self.queue.qsize()
+            if room < max(1, self.queue.maxsize // 4):
+                await asyncio.sleep(0.05)
+                continue
+            tasks = await asyncio.to_thread(self.url_manager.get_next_urls, room)
+            if not tasks:
+                # 队列为空，或候选URL的主机都未就绪
+                ready_in = await asyncio.to_thread(self.url_manager.next_ready_in)
+                logger.debug("No ready URL, waiting...")
+                await asyncio.sleep(1 if ready_in is None else min(1, max(0.05, ready_in)))
+                continue
+            for task in tasks:
+                await self.queue.put(task)
+
+    async def _requeue_pending(self):
+        """
+        停止时把未完成的任务放回 frontier
+
+        本地队列中的任务尚未标记为访问过，原样放回；被取消的正在处理的任务已经标记过，
+        作为重爬任务放回（跳过已访问检查）
+        """
+        tasks = []
+        while not self.queue.empty():
+            tasks.append(self.queue.get_nowait())
+        interrupted = list(self.in_flight.values())
+        self.in_flight.clear()
+        if tasks or interrupted:
+            await asyncio.to_thread(self.url_manager.frontier.push, tasks + interrupted)
+            logger.info(f"Requeued {len(tasks)} queued and {len(interrupted)} interrupted tasks")
+
+    async def _worker(self, slot: int):
+        while True:
+            task = await self.queue.get()
+            try:
+                await self.process_url(task, slot)
+            except asyncio.CancelledError:
+                raise  # in_flight 中的任务由 _requeue_pending 放回
+            except Exception as e:
+                logger.error(f"Slot {slot}: Error processing {task.get('url')}: {e}")
+            finally:
+                self.queue.task_done()
+            self.in_flight.pop(slot, None)
+
+    def _extract(self, html: str, url: str, depth: int):
+        """内容、图片和链接提取（在线程池中执行）"""
+        extracted = self.content_extractor.extract(html, url)
+        if not extracted:
+            return None, [], []
+
+        images = []
+        try:
+            from image_extractor import get_image_extractor
+            images = get_image_extractor().extract_images(html, url)
+        except Exception as e:
+            logger.warning(f"Failed to extract images from {url}: {e}")
+
+        links = []
+        if MAX_DEPTH == 0 or depth < MAX_DEPTH:
+            links = self.url_manager.extract_links(url, html)
+        return extracted, images, links
+
+    async def process_url(self, task: dict, slot: int = 0):
+        """处理单个URL"""
+        url = task['url']
+        depth = task.get('depth', 0)
+
+        # 在标记之前登记：停止时即使标记已经生效，也会作为重爬任务放回
+        self.in_flight[slot] = dict(task, recrawl=True)
+
+        # 检查+标记一次完成，避免重复处理（重爬任务不检查）
+        if not await asyncio.to_thread(self.url_manager.mark_visited, url) and not task.get('recrawl'):
+            logger.debug(f"Slot {slot}: URL already visited (skipping): {url}")
+            self.in_flight.pop(slot, None)
+            return
+
+        html = await self.fetcher.fetch(url)
+        self.processed += 1
+        if not html:
+            return
+
+        extracted, images, links = await asyncio.to_thread(self._extract, html, url, depth)
+        if not extracted:
+            logger.debug(f"Slot {slot}: No content extracted from {url}")
+            return
+
+        metadata = {
+            "crawled_at": time.time(),
+            "worker_id": slot,
+            "crawler_mode": "s-async"
+        }
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                await self._index(extracted['title'], extracted['content'], url, images, metadata, slot)
+                self.indexed += 1
+                break
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    logger.warning(f"Slot {slot}: Retrying index {url} (attempt {attempt+1}/{max_retries}) due to error: {e}")
+                    await asyncio.sleep(1 + attempt + random.random())  # 随机退避，减少再次死锁概率
+                else:
+                    self.index_failed += 1
+                    logger.error(f"Slot {slot}: Failed to index {url} after {max_retries} attempts: {e}")
+
+        if links:
+            added = await asyncio.to_thread(self.url_manager.add_urls, links, depth + 1)
+            logger.debug(f"Slot {slot}: Added {added} new links from {url}")
+
+    async def _index(self, title: str, content: str, url: str, images: list, metadata: dict, slot: int):
+        """在索引线程的 event loop 上执行 index_page（其中的同步向量化不会阻塞抓取）"""
+        future = asyncio.run_coroutine_threadsafe(
+            index_page(title, content, url, images, metadata, label=f"Slot {slot}"),
+            self.index_loop
+        )
+        return await asyncio.wrap_future(future)
+
+    async def _monitor(self, interval: float = 30):
+        while not self.stop_event.is_set():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            stats = await asyncio.to_thread(self.get_stats)
+            fetch = stats['fetch']
+            logger.info(
+                f"Status: {fetch['in_flight']} in flight, fetched {fetch['fetched']} "
+                f"({fetch['fetches_per_sec']}/s), failed {fetch['failed']}, indexed {self.indexed}, "
+                f"Queue: {stats['queue_size']}, Visited: {stats['visited_count']}"
+            )
+
+    def get_stats(self) -> dict:
+        """获取爬虫统计信息"""
+        return {
+            'concurrency': self.concurrency,
+            'queue_size': self.url_manager.get_queue_size(),
+            'visited_count': self.url_manager.get_visited_count(),
+            'processed': self.processed,
+            'indexed': self.indexed,
+            'index_failed': self.index_failed,
+            'fetch': self.fetcher.get_stats(),
+        }
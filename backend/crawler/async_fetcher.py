@@ -0,0 +1,142 @@
+"""
+异步 HTTP 抓取器 - aiohttp 连接池（s 模式的异步抓取引擎使用）
+
+- 一个 ClientSession 复用所有连接（keep-alive），DNS 结果缓存
+- 连接池总大小 FETCH_CONCURRENCY，每个主机最多 FETCH_PER_HOST 个并发连接
+- 自动协商并解压 gzip/deflate（安装 Brotli 时还有 br）
+- 5xx/429 和网络错误按 MAX_RETRIES 指数退避重试，4xx 直接放弃
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+
+from crawler_config import (
+    USER_AGENT, REQUEST_TIMEOUT, MAX_RETRIES,
+    FETCH_CONCURRENCY, FETCH_PER_HOST, FETCH_KEEPALIVE, FETCH_MAX_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncFetcher:
+    """共享连接池的异步页面抓取器"""
+
+    def __init__(
+        self,
+        concurrency: int = FETCH_CONCURRENCY,
+        per_host: int = FETCH_PER_HOST,
+        timeout: float = REQUEST_TIMEOUT,
+        max_bytes: int = FETCH_MAX_BYTES,
+        retries: int = MAX_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.retries = max(1, retries)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        self.in_flight = 0
+        self.fetched = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started_at = time.time()
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=FETCH_KEEPALIVE
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={
+                'User-Agent': USER_AGENT,
+                'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+            }
+        )
+        self.started_at = time.time()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """获取网页 HTML（失败、非 HTML、过大或过短时返回 None）"""
+        self.in_flight += 1
+        try:
+            for attempt in range(self.retries):
+                try:
+                    html = await self._get(url, last_attempt=attempt == self.retries - 1)
+                    if html is not None:
+                        self.fetched += 1
+                    else:
+                        self.failed += 1
+                    return html
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Failed to fetch {url} (attempt {attempt + 1}/{self.retries}): {e!r}")
+                    if attempt < self.retries - 1:
+                        await asyncio.sleep(2 ** (attempt + 1))  # 指数退避
+            self.failed += 1
+            return None
+        finally:
+            self.in_flight -= 1
+
+    async def _get(self, url: str, last_attempt: bool) -> Optional[str]:
+        async with self.session.get(url, allow_redirects=True, max_redirects=5) as response:
+            if response.status in RETRY_STATUSES and not last_attempt:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message=response.reason or ""
+                )
+            if response.status >= 400:
+                logger.debug(f"HTTP {response.status} from {url}")
+                return None
+
+            content_type = response.headers.get('Content-Type', '').lower()
+            if content_type and 'html' not in content_type:
+                logger.debug(f"Skipping non-HTML content ({content_type}) from {url}")
+                return None
+
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    logger.warning(f"Page too large (> {self.max_bytes} bytes), skipping: {url}")
+                    return None
+            self.bytes += len(body)
+
+            try:
+                html = body.decode(response.charset or 'utf-8', errors='replace')
+            except LookupError:
+                html = body.decode('utf-8', errors='replace')
+
+            if len(html) < 100:
+                logger.warning(f"Empty or too short HTML from {url}")
+                return None
+            return html
+
+    def get_stats(self) -> dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            'in_flight': self.in_flight,
+            'fetched': self.fetched,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'fetches_per_sec': round(self.fetched / elapsed, 2),
+        }
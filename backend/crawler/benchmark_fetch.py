@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+抓取吞吐基准测试（本地测试 HTTP 服务器）
+
+在后台线程启动若干个本地 aiohttp 服务器（每个端口相当于一个主机），
+页面带 gzip 压缩和可配置的响应延迟，然后比较:
+- threads: NUM_WORKERS 个线程，每个线程一次一个阻塞请求（相当于 SessionPage worker，不含 REQUEST_DELAY）
+- async:   AsyncFetcher，单进程 --concurrency 个并发抓取，共享连接池
+
+使用方式:
+    python benchmark_fetch.py
+    python benchmark_fetch.py --requests 5000 --hosts 50 --latency 100 --concurrency 300
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from aiohttp import web
+
+from async_fetcher import AsyncFetcher
+from crawler_config import NUM_WORKERS, REQUEST_DELAY
+
+
+def make_page(size: int) -> str:
+    words = ["search", "index", "crawler", "document", "ranking", "vector", "query", "page"]
+    body = " ".join(random.choice(words) for _ in range(size // 7))
+    links = "".join(f'<a href="/page/{i}">link {i}</a>' for i in range(50))
+    return f"<html><head><title>Benchmark</title></head><body><p>{body}</p>{links}</body></html>"
+
+
+def start_servers(hosts: int, latency_ms: float, page_size: int) -> list:
+    """在后台线程启动测试服务器，返回端口列表"""
+    page = make_page(page_size)
+    ports = []
+    ready = threading.Event()
+
+    async def handler(request):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        response = web.Response(text=page, content_type="text/html")
+        response.enable_compression()
+        return response
+
+    async def serve():
+        for _ in range(hosts):
+            app = web.Application()
+            app.router.add_get("/page/{id}", handler)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            ports.append(site._server.sockets[0].getsockname()[1])
+        ready.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+    return ports
+
+
+def bench_threads(urls: list, workers: int) -> float:
+    """阻塞式基线: 每个线程一个 Session，一次一个请求"""
+    chunks = [urls[i::workers] for i in range(workers)]
+
+    def run(chunk):
+        session = requests.Session()
+        ok = 0
+        for url in chunk:
+            if session.get(url, timeout=30).ok:
+                ok += 1
+        return ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        ok = sum(executor.map(run, chunks))
+    elapsed = time.perf_counter() - start
+    print(f"  threads: {ok}/{len(urls)} pages in {elapsed:.2f}s -> {ok / elapsed:.1f} fetches/s")
+    return ok / elapsed
+
+
+async def bench_async(urls: list, concurrency: int, per_host: int) -> float:
+    async with AsyncFetcher(concurrency=concurrency, per_host=per_host) as fetcher:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(url):
+            async with semaphore:
+                return await fetcher.fetch(url)
+
+        start = time.perf_counter()
+        pages = await asyncio.gather(*(one(url) for url in urls))
+        elapsed = time.perf_counter() - start
+    ok = sum(1 for page in pages if page)
+    print(f"  async:   {ok}/{len(urls)} pages in {elapsed:.2f}s -> {ok / elapsed:.1f} fetches/s "
+          f"({fetcher.bytes / max(ok, 1) / 1024:.1f} KB/page decompressed)")
+    return ok / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch throughput: blocking threads vs the async fetch engine")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=20, help="Local test servers (one per port)")
+    parser.add_argument("--latency", type=float, default=50, help="Server response delay in ms")
+    parser.add_argument("--page-size", type=int, default=20000, help="Approximate page size in bytes")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Threads for the blocking baseline")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--per-host", type=int, default=4)
+    args = parser.parse_args()
+
+    ports = start_servers(args.hosts, args.latency, args.page_size)
+    urls = [f"http://127.0.0.1:{ports[i % len(ports)]}/page/{i}" for i in range(args.requests)]
+
+    print("=" * 72)
+    print(f"{args.requests} requests over {args.hosts} hosts, {args.latency:.0f}ms latency, "
+          f"~{args.page_size // 1000}KB pages (gzip)")
+    print("-" * 72)
+    thread_rate = bench_threads(urls, args.workers)
+    async_rate = asyncio.run(bench_async(urls, args.concurrency, args.per_host))
+    print("-" * 72)
+    print(f"  speedup: {async_rate / thread_rate:.1f}x "
+          f"(threaded crawler with REQUEST_DELAY={REQUEST_DELAY}s is capped near "
+          f"{args.workers / (1 / (thread_rate / args.workers) + REQUEST_DELAY):.2f} fetches/s)")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
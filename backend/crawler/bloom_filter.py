@@ -0,0 +1,177 @@
+"""
+服务端 Bloomfilter - URL 去重完全在 Redis 内完成
+
+两种后端（BLOOMFILTER_BACKEND）:
+- redisbloom: RedisBloom 模块的 BF.MADD / BF.MEXISTS
+- lua:        普通 Redis 的位图 + Lua 脚本（SETBIT / GETBIT）
+
+客户端只发送每个 URL 的两个 32 位哈希（double hashing 在 Lua 中展开为 k 个位），
+一个页面的所有链接只需一次检查、一次写入，各一个往返，不再下载/上传整个过滤器。
+"""
+import hashlib
+import logging
+import math
+from typing import List, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] 位图, KEYS[2] 计数; ARGV: k, m, h1, h2, h1, h2, ...
+# 返回每个 URL 是否为新加入（任一位原本为 0）
+_LUA_MADD = """
+local k = tonumber(ARGV[1])
+local m = tonumber(ARGV[2])
+local result = {}
+local added = 0
+for j = 3, #ARGV, 2 do
+    local h1 = tonumber(ARGV[j])
+    local h2 = tonumber(ARGV[j + 1])
+    local new = 0
+    for i = 0, k - 1 do
+        if redis.call('SETBIT', KEYS[1], (h1 + i * h2) % m, 1) == 0 then
+            new = 1
+        end
+    end
+    result[#result + 1] = new
+    added = added + new
+end
+if added > 0 then
+    redis.call('INCRBY', KEYS[2], added)
+end
+return result
+"""
+
+# KEYS[1] 位图; ARGV: k, m, h1, h2, ...; 返回每个 URL 是否可能存在
+_LUA_MEXISTS = """
+local k = tonumber(ARGV[1])
+local m = tonumber(ARGV[2])
+local result = {}
+for j = 3, #ARGV, 2 do
+    local h1 = tonumber(ARGV[j])
+    local h2 = tonumber(ARGV[j + 1])
+    local found = 1
+    for i = 0, k - 1 do
+        if redis.call('GETBIT', KEYS[1], (h1 + i * h2) % m) == 0 then
+            found = 0
+            break
+        end
+    end
+    result[#result + 1] = found
+end
+return result
+"""
+
+
+def _text(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+class RedisBloomFilter:
+    """多个爬虫进程共享的服务端 Bloomfilter"""
+
+    def __init__(self, redis_client: redis.Redis, key: str, capacity: int, error_rate: float, backend: str = "auto"):
+        self.redis_client = redis_client
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count_key = f"{key}:count"
+        self.meta_key = f"{key}:meta"
+
+        self._size()
+        self._madd = redis_client.register_script(_LUA_MADD)
+        self._mexists = redis_client.register_script(_LUA_MEXISTS)
+        self.backend = self._select_backend(backend)
+        logger.info(
+            f"Bloomfilter '{key}' using {self.backend} backend "
+            f"(capacity={capacity}, error_rate={error_rate})"
+        )
+
+    def _select_backend(self, backend: str) -> str:
+        """按 key 的现有类型和服务器能力选择后端（auto 时优先 RedisBloom）"""
+        if backend == "lua":
+            self._reserve_bitmap()
+            return "lua"
+
+        key_type = _text(self.redis_client.type(self.key))
+        if key_type == "string" and backend == "auto":
+            # 已有 Lua 位图，继续使用
+            self._reserve_bitmap()
+            return "lua"
+        try:
+            self._reserve_redisbloom()
+            return "redisbloom"
+        except redis.ResponseError as e:
+            if backend == "redisbloom":
+                raise
+            logger.info(f"RedisBloom unavailable ({e}), falling back to Lua bitmap Bloomfilter")
+            self._reserve_bitmap()
+            return "lua"
+
+    def _size(self):
+        """位图参数: m = -n·ln(p) / ln(2)², k = m/n·ln(2)"""
+        self.num_bits = int(math.ceil(-self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+
+    def _reserve_redisbloom(self):
+        try:
+            self.redis_client.execute_command("BF.RESERVE", self.key, self.error_rate, self.capacity)
+        except redis.ResponseError as e:
+            if "exists" not in str(e).lower():
+                raise
+
+    def _reserve_bitmap(self):
+        """记录位图参数；已存在的位图沿用创建时的 m/k，避免配置变更后位置错乱"""
+        self.redis_client.hsetnx(self.meta_key, "num_bits", self.num_bits)
+        self.redis_client.hsetnx(self.meta_key, "num_hashes", self.num_hashes)
+        num_bits, num_hashes = self.redis_client.hmget(self.meta_key, "num_bits", "num_hashes")
+        self.num_bits, self.num_hashes = int(num_bits), int(num_hashes)
+
+    @staticmethod
+    def _hashes(item: str) -> Tuple[int, int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+        # h2 取奇数，保证 k 个位置互不相同的概率最大
+        return int.from_bytes(digest[:4], 'big'), int.from_bytes(digest[4:], 'big') | 1
+
+    def _args(self, items: List[str]) -> List[int]:
+        args = [self.num_hashes, self.num_bits]
+        for item in items:
+            args.extend(self._hashes(item))
+        return args
+
+    def add_many(self, items: List[str]) -> List[bool]:
+        """批量加入，返回每一项是否为新加入（一次往返）"""
+        if not items:
+            return []
+        if self.backend == "redisbloom":
+            result = self.redis_client.execute_command("BF.MADD", self.key, *items)
+        else:
+            result = self._madd(keys=[self.key, self.count_key], args=self._args(items))
+        return [bool(r) for r in result]
+
+    def contains_many(self, items: List[str]) -> List[bool]:
+        """批量检查，返回每一项是否可能已存在（一次往返）"""
+        if not items:
+            return []
+        if self.backend == "redisbloom":
+            result = self.redis_client.execute_command("BF.MEXISTS", self.key, *items)
+        else:
+            result = self._mexists(keys=[self.key], args=self._args(items))
+        return [bool(r) for r in result]
+
+    def count(self) -> int:
+        """已加入的元素数量"""
+        if self.backend == "redisbloom":
+            info = self.redis_client.execute_command("BF.INFO", self.key)
+            fields = {_text(info[i]): info[i + 1] for i in range(0, len(info) - 1, 2)}
+            return int(fields.get("Number of items inserted", 0))
+        return int(self.redis_client.get(self.count_key) or 0)
+
+    def clear(self):
+        """删除过滤器并按当前配置重新创建"""
+        self.redis_client.delete(self.key, self.count_key, self.meta_key)
+        if self.backend == "redisbloom":
+            self._reserve_redisbloom()
+        else:
+            self._size()
+            self._reserve_bitmap()
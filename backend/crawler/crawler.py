@@ -17,7 +17,7 @@ from content_extractor import ContentExtractor
 from crawler_config import (
     USER_AGENT, REQUEST_TIMEOUT, MAX_RETRIES, REQUEST_DELAY,
     NUM_WORKERS, DEFAULT_SEED_URLS, MAX_DEPTH,
-    DRISSION_MODE, HEADLESS, BROWSER_PATH
+    DRISSION_MODE, HEADLESS, BROWSER_PATH, INGEST_ASYNC
 )
 
 # 配置日志
@@ -43,6 +43,51 @@ def get_event_loop():
         return loop
 
 
+async def index_page(title: str, content: str, url: str, images: list, metadata: dict, label: str = "Crawler"):
+    """索引一个页面（直接写库，或写入 API 的异步索引队列）"""
+    import os
+    
+    # 添加 Python 目录到路径
+    python_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python')
+    if python_dir not in sys.path:
+        sys.path.insert(0, python_dir)
+    
+    if INGEST_ASYNC:
+        # 写入异步索引队列，由 API 的索引 worker 批量写库
+        from ingest_queue import get_ingest_queue
+        ingestion_id = get_ingest_queue().enqueue([{
+            "title": title,
+            "content": content,
+            "url": url,
+            "source_type": "web",
+            "images": images,
+            "metadata": metadata
+        }])
+        logger.info(f"{label}: Queued {url} for indexing (ingestion {ingestion_id})")
+        return ingestion_id
+    
+    from database import AsyncSessionLocal
+    from index_service import get_index_service
+    
+    # 创建数据库会话
+    async with AsyncSessionLocal() as session:
+        index_service = get_index_service()
+        
+        # 索引文档
+        doc_id = await index_service.index_document(
+            title=title,
+            content=content,
+            url=url,
+            source_type="web",
+            images=images,  # 传递图片数据
+            metadata=metadata,
+            session=session
+        )
+        
+        logger.info(f"{label}: Indexed document {doc_id} from {url}")
+        return doc_id
+
+
 class CrawlerWorker:
     """爬虫工作线程 - 使用 DrissionPage"""
     
@@ -141,39 +186,12 @@ class CrawlerWorker:
 
     # 需要完整包含 CrawlerWorker 类的方法，因为我要修改 run 中的清理逻辑
     async def index_document(self, title: str, content: str, url: str, images: list = None):
-         # ... (same as before)
-            import sys
-            import os
-            
-            # 添加 Python 目录到路径
-            python_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python')
-            if python_dir not in sys.path:
-                sys.path.insert(0, python_dir)
-            
-            from database import AsyncSessionLocal
-            from index_service import get_index_service
-            
-            # 创建数据库会话
-            async with AsyncSessionLocal() as session:
-                index_service = get_index_service()
-                
-                # 索引文档
-                doc_id = await index_service.index_document(
-                    title=title,
-                    content=content,
-                    url=url,
-                    source_type="web",
-                    images=images,  # 传递图片数据
-                    metadata={
-                        "crawled_at": time.time(),
-                        "worker_id": self.worker_id,
-                        "crawler_mode": self.mode
-                    },
-                    session=session
-                )
-                
-                logger.info(f"Worker {self.worker_id}: Indexed document {doc_id} from {url}")
-                return doc_id
+        metadata = {
+            "crawled_at": time.time(),
+            "worker_id": self.worker_id,
+            "crawler_mode": self.mode
+        }
+        return await index_page(title, content, url, images, metadata, label=f"Worker {self.worker_id}")
         
     def process_url(self, task: dict):
         # ... (same as before)
@@ -183,12 +201,11 @@ class CrawlerWorker:
         
         logger.info(f"Worker {self.worker_id}: Processing {url} (depth={depth})")
         
-        if self.url_manager.is_visited(url):
+        # 检查+标记一次完成，避免两个 worker 同时处理同一个 URL（重爬任务不检查）
+        if not self.url_manager.mark_visited(url) and not task.get('recrawl'):
             logger.debug(f"Worker {self.worker_id}: URL already visited (skipping): {url}")
             return
         
-        self.url_manager.mark_visited(url)
-        self.url_manager.check_and_rest_if_needed()
         
         html = self.fetch_page(url)
         if not html:
@@ -270,8 +287,10 @@ class CrawlerWorker:
                     task = self.url_manager.get_next_url()
                     
                     if task is None:
-                        logger.debug(f"Worker {self.worker_id}: Queue empty, waiting...")
-                        time.sleep(5)
+                        # 队列为空，或所有候选URL的主机都未就绪（等到最早的主机就绪）
+                        ready_in = self.url_manager.next_ready_in()
+                        logger.debug(f"Worker {self.worker_id}: No ready URL, waiting...")
+                        time.sleep(5 if ready_in is None else min(5, max(0.1, ready_in)))
                         continue
                     
                     self._report_status("processing", task['url'])
@@ -414,10 +433,14 @@ class WebCrawler:
                 # 获取统计信息
                 queue_size = self.url_manager.get_queue_size()
                 visited_count = self.url_manager.get_visited_count()
+                admission = self.url_manager.get_admission_stats()
                 
                 logger.info(
                     f"Status: {alive_workers}/{self.num_workers} workers alive, "
-                    f"Queue: {queue_size}, Visited: {visited_count}"
+                    f"Queue: {queue_size}, Visited: {visited_count}, "
+                    f"Links admitted: {admission['admitted']} "
+                    f"(rejected visited={admission['visited']}, queued={admission['queued']}, duplicate={admission['duplicate']}, "
+                    f"invalid={admission['invalid']}, error={admission['error']})"
                 )
                 
                 # 如果所有worker都停止了，退出
@@ -466,5 +489,7 @@ class WebCrawler:
             'num_workers': self.num_workers,
             'queue_size': self.url_manager.get_queue_size(),
             'visited_count': self.url_manager.get_visited_count(),
+            'admission': self.url_manager.get_admission_stats(),
+            'frontier': self.url_manager.frontier.get_stats(),
             'alive_workers': sum(1 for w in self.workers if w.is_alive()),
         }
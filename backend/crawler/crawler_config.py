@@ -2,7 +2,7 @@
 爬虫配置文件
 """
 import os
-from typing import List
+from typing import Dict, List
 
 # Redis 配置（与主项目保持一致）
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -10,13 +10,30 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_CRAWLER_DB = int(os.getenv("REDIS_CRAWLER_DB", 1))  # 使用DB 1，避免与缓存(DB 0)冲突
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
 
-# Bloomfilter 配置
-BLOOMFILTER_KEY = "crawler:visited_urls"
+# Bloomfilter 配置（服务端过滤器，检查/标记都在 Redis 内完成）
+BLOOMFILTER_KEY = "crawler:visited_bloom"
+LEGACY_BLOOMFILTER_KEY = "crawler:visited_urls"  # 旧版 pickle 格式的过滤器，已不再使用
 BLOOMFILTER_ERROR_RATE = 0.001  # 错误率
 BLOOMFILTER_CAPACITY = 10000000  # 预计爬取1000万个URL
+# 后端: auto（优先 RedisBloom，不可用时用 Lua 位图）/ redisbloom / lua
+BLOOMFILTER_BACKEND = os.getenv("CRAWLER_BLOOMFILTER_BACKEND", "auto")
 
-# 任务队列配置
+# 任务队列配置（优先级 frontier，见 frontier.py）
+FRONTIER_PREFIX = "crawler:{frontier}:"  # {frontier} 为 Redis Cluster hash tag，frontier 的所有键在同一个 slot
+FRONTIER_TIERS = 3  # 优先级层: 0 种子/重爬, 1 普通, 2 深层/低质量
+FRONTIER_DEEP_DEPTH = int(os.getenv("CRAWLER_DEEP_DEPTH", 3))  # 深度达到此值的链接进入最低层
+FRONTIER_LOW_QUALITY = 0.2  # 域名质量低于此值的链接进入最低层
+FRONTIER_SCAN_HOSTS = 64  # 每次领取时每层最多检查的就绪域名数
+# 层内得分权重（越高越优先）: 1/(1+深度)、域名质量、新鲜度、log(1+入链数)
+FRONTIER_WEIGHTS = {'depth': 1.0, 'quality': 1.0, 'freshness': 0.5, 'inlinks': 0.3}
+FRESHNESS_HALF_LIFE = 7 * 86400  # 重爬任务: 距上次抓取这么久后新鲜度得分达到一半（秒）
+DEFAULT_DOMAIN_QUALITY = 0.5
+# 域名质量 0~1（注册域名），也可在运行时写入 Redis hash crawler:{frontier}:quality 覆盖
+DOMAIN_QUALITY: Dict[str, float] = {}
+# 旧版队列（FIFO 列表 / 延后队列），启动时自动迁移到 frontier
 TASK_QUEUE_KEY = "crawler:task_queue"
+DEFERRED_QUEUE_KEY = "crawler:deferred"
+ADMISSION_STATS_KEY = "crawler:admission_stats"  # 链接准入统计（所有worker累计）
 
 # 爬虫配置
 # DrissionPage 模式: 's' (session/快速) 或 'd' (driver/浏览器)
@@ -34,10 +51,21 @@ REQUEST_TIMEOUT = 30  # 秒
 MAX_RETRIES = 3
 REQUEST_DELAY = 5.0  # 请求间隔（秒）- 增加以减少数据库竞争
 
-# 全局限速配置
-ENABLE_RATE_LIMIT = True
-REQUESTS_PER_BATCH = int(os.getenv("REQUESTS_PER_BATCH", 10))  # 每批请求数
-BATCH_REST_DURATION = int(os.getenv("BATCH_REST_DURATION", 50))  # 休息时长（秒）
+# 异步抓取引擎（仅 s 模式）: 单进程内用 asyncio + aiohttp 并发抓取数百个页面
+ASYNC_FETCH = os.getenv("CRAWLER_ASYNC_FETCH", "true").lower() == "true"
+FETCH_CONCURRENCY = int(os.getenv("CRAWLER_FETCH_CONCURRENCY", 200))  # 同时进行的抓取数（连接池总大小）
+FETCH_PER_HOST = int(os.getenv("CRAWLER_FETCH_PER_HOST", 2))  # 每个主机的最大并发连接
+FETCH_KEEPALIVE = 30  # 空闲 keep-alive 连接保留秒数
+FETCH_MAX_BYTES = 5 * 1024 * 1024  # 单个页面最大字节数（解压后），超出则丢弃
+FETCH_CPU_THREADS = int(os.getenv("CRAWLER_FETCH_CPU_THREADS", 8))  # 内容提取/Redis 调用的线程数
+
+# 礼貌性调度（按注册域名的令牌桶，worker 只取主机已就绪的URL）
+ENABLE_RATE_LIMIT = os.getenv("ENABLE_RATE_LIMIT", "true").lower() in ("true", "1", "yes")
+HOST_CRAWL_DELAY = float(os.getenv("CRAWLER_HOST_DELAY", 2.0))  # 同一域名两次请求的最小间隔（秒）
+HOST_BURST = int(os.getenv("CRAWLER_HOST_BURST", 2))  # 空闲域名允许连续请求的次数
+RESPECT_ROBOTS_CRAWL_DELAY = True  # 遵守 robots.txt 中更大的 Crawl-delay
+ROBOTS_CACHE_TTL = 86400  # robots.txt Crawl-delay 缓存时间（秒）
+ROBOTS_TIMEOUT = 5  # 获取 robots.txt 的超时（秒）
 
 # 是否自动切换模式（遇到 JS 渲染页面时切换到 d 模式）
 AUTO_SWITCH_MODE = True  # 暂时关闭，避免复杂度
@@ -46,6 +74,9 @@ AUTO_SWITCH_MODE = True  # 暂时关闭，避免复杂度
 MIN_CONTENT_LENGTH = 100  # 最小内容长度
 MAX_CONTENT_LENGTH = 50000  # 最大内容长度
 
+# 索引方式: true 时写入 API 的异步索引队列（Redis Stream），不再在爬虫进程中直接写库
+INGEST_ASYNC = os.getenv("CRAWLER_INGEST_ASYNC", "false").lower() == "true"
+
 # 进程配置
 NUM_WORKERS = int(os.getenv("CRAWLER_WORKERS", 3))  # 并发进程数（降低以减少数据库竞争）
 
@@ -0,0 +1,289 @@
+"""
+优先级爬取前沿（frontier）- Redis sorted set
+
+结构（前缀 FRONTIER_PREFIX，带 hash tag {frontier}，所有键落在同一个 Cluster slot）:
+- t{tier}:q:{domain}  每个优先级层、每个注册域名一个 URL 子队列（zset，score 越小越优先）
+- t{tier}:hosts       该层有待抓 URL 的域名（zset，score 为域名令牌桶预计就绪的时间）
+- tasks / inlinks     URL -> 任务 JSON / 被发现次数（URL 被领取后删除）
+- bucket:{domain}     域名令牌桶；rates 为各域名的令牌补充速率（1 / crawl_delay）
+- size                队列中的 URL 总数
+
+固定的键通过 KEYS 传入；按域名的子队列和令牌桶键在脚本内由前缀拼出（数量不固定），
+靠同一个 hash tag 保证与 KEYS 同槽，因此也能在 Redis Cluster / 按键路由的代理上运行。
+
+优先级:
+- 层: 0 = 种子和手动重爬，1 = 普通链接，2 = 深层链接（depth >= FRONTIER_DEEP_DEPTH）或低质量域名
+- 层内得分 = 深度、域名质量、新鲜度的加权和，再加上入链数（log）；同一 URL 再次被发现时只会提升
+
+领取: 一次 Lua 调用按层从高到低扫描已就绪的域名（等待最久的优先，保证域名间轮转），
+每个域名按剩余令牌数取出最优的若干个 URL（每个消耗一个令牌），直到取满 N 个。
+深层链接农场只会占满自己的子队列，不会挤掉其他站点和高优先级层的页面。
+令牌桶和就绪时间都用 Redis 服务器时间（TIME），与各 worker 的本地时钟无关。
+"""
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from politeness import registered_domain
+from crawler_config import (
+    FRONTIER_PREFIX, FRONTIER_TIERS, FRONTIER_DEEP_DEPTH, FRONTIER_SCAN_HOSTS,
+    FRONTIER_WEIGHTS, FRONTIER_LOW_QUALITY, FRESHNESS_HALF_LIFE,
+    DOMAIN_QUALITY, DEFAULT_DOMAIN_QUALITY, HOST_CRAWL_DELAY, HOST_BURST
+)
+
+logger = logging.getLogger(__name__)
+
+TIER_SEED = 0
+TIER_NORMAL = 1
+TIER_LOW = FRONTIER_TIERS - 1
+
+# 服务器时间（秒，浮点）；Redis 5 之前的版本需要先切换到命令复制才能在 TIME 之后写入
+_LUA_NOW = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+"""
+
+# KEYS: tasks, inlinks, rates, size, t0:hosts .. t{tiers-1}:hosts
+# ARGV: prefix, w_inlinks, tiers, 然后每个 URL (url, domain, tier, base, task, rate)
+# 返回每个 URL: 1 新加入，0 已在队列中（记一次入链，可能提升优先级）
+_LUA_PUSH = _LUA_NOW + """
+local p = ARGV[1]
+local w = tonumber(ARGV[2])
+local tiers = tonumber(ARGV[3])
+local tasks_key, inlinks_key, rates_key, size_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local result = {}
+for j = 4, #ARGV, 6 do
+    local url, domain = ARGV[j], ARGV[j + 1]
+    local tier, base = tonumber(ARGV[j + 2]), tonumber(ARGV[j + 3])
+    local inlinks = redis.call('HINCRBY', inlinks_key, url, 1)
+    local score = base - w * math.log(1 + inlinks)
+    redis.call('HSET', rates_key, domain, ARGV[j + 5])
+
+    local current = nil
+    for t = 0, tiers - 1 do
+        if redis.call('ZSCORE', p .. 't' .. t .. ':q:' .. domain, url) then
+            current = t
+            break
+        end
+    end
+
+    if current == nil or tier < current then
+        if current == nil then
+            redis.call('INCR', size_key)
+        else
+            redis.call('ZREM', p .. 't' .. current .. ':q:' .. domain, url)
+        end
+        redis.call('HSET', tasks_key, url, ARGV[j + 4])
+        redis.call('ZADD', p .. 't' .. tier .. ':q:' .. domain, score, url)
+        redis.call('ZADD', KEYS[5 + tier], 'NX', now, domain)
+        result[#result + 1] = current == nil and 1 or 0
+    else
+        local queue_key = p .. 't' .. current .. ':q:' .. domain
+        local old = tonumber(redis.call('ZSCORE', queue_key, url))
+        local rescored = math.min(score, old - w * (math.log(1 + inlinks) - math.log(inlinks)))
+        if rescored < old then
+            redis.call('ZADD', queue_key, rescored, url)
+        end
+        result[#result + 1] = 0
+    end
+end
+return result
+"""
+
+# KEYS: tasks, inlinks, rates, size, t0:hosts .. t{tiers-1}:hosts
+# ARGV: prefix, count, tiers, default_rate, burst, scan, polite
+# 返回 url, task, url, task, ...
+_LUA_CLAIM = _LUA_NOW + """
+local p = ARGV[1]
+local count = tonumber(ARGV[2])
+local tiers = tonumber(ARGV[3])
+local default_rate = tonumber(ARGV[4])
+local burst = tonumber(ARGV[5])
+local scan = tonumber(ARGV[6])
+local polite = ARGV[7] == '1'
+local tasks_key, inlinks_key, rates_key, size_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local out = {}
+local claimed = 0
+for t = 0, tiers - 1 do
+    if claimed >= count then
+        break
+    end
+    local hosts_key = KEYS[5 + t]
+    -- 不限速时忽略域名的就绪时间
+    local hosts = redis.call('ZRANGEBYSCORE', hosts_key, '-inf', polite and now or '+inf', 'LIMIT', 0, scan)
+    for _, domain in ipairs(hosts) do
+        if claimed >= count then
+            break
+        end
+        local queue_key = p .. 't' .. t .. ':q:' .. domain
+        local bucket_key = p .. 'bucket:' .. domain
+        local take = count - claimed
+        local tokens, rate
+        if polite then
+            rate = tonumber(redis.call('HGET', rates_key, domain)) or default_rate
+            local state = redis.call('HMGET', bucket_key, 'tokens', 'ts')
+            tokens = tonumber(state[1]) or burst
+            local ts = tonumber(state[2]) or now
+            tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+            take = math.min(take, math.floor(tokens))
+        end
+
+        if take >= 1 then
+            local items = redis.call('ZPOPMIN', queue_key, take)
+            local popped = #items / 2
+            for i = 1, #items, 2 do
+                out[#out + 1] = items[i]
+                out[#out + 1] = redis.call('HGET', tasks_key, items[i]) or ''
+                redis.call('HDEL', tasks_key, items[i])
+                redis.call('HDEL', inlinks_key, items[i])
+            end
+            if popped > 0 then
+                claimed = claimed + popped
+                redis.call('DECRBY', size_key, popped)
+                if polite then
+                    tokens = tokens - popped
+                end
+            end
+        end
+
+        -- 更新域名的就绪时间（其他层里该域名的就绪时间在扫描到时再修正）
+        if redis.call('ZCARD', queue_key) == 0 then
+            redis.call('ZREM', hosts_key, domain)
+        elseif not polite or tokens >= 1 then
+            redis.call('ZADD', hosts_key, now, domain)
+        else
+            redis.call('ZADD', hosts_key, now + (1 - tokens) / rate, domain)
+        end
+        if polite then
+            redis.call('HSET', bucket_key, 'tokens', tostring(tokens), 'ts', tostring(now))
+            redis.call('EXPIRE', bucket_key, math.ceil(burst / rate) + 60)
+        end
+    end
+end
+return out
+"""
+
+
+class Frontier:
+    """多层优先级 + 按域名子队列的爬取前沿"""
+
+    def __init__(self, redis_client, politeness):
+        self.redis_client = redis_client
+        self.politeness = politeness
+        self._push = redis_client.register_script(_LUA_PUSH)
+        self._claim = redis_client.register_script(_LUA_CLAIM)
+        self._keys = [
+            f"{FRONTIER_PREFIX}tasks", f"{FRONTIER_PREFIX}inlinks",
+            f"{FRONTIER_PREFIX}rates", f"{FRONTIER_PREFIX}size",
+        ] + [f"{FRONTIER_PREFIX}t{tier}:hosts" for tier in range(FRONTIER_TIERS)]
+        self._quality: Dict[str, float] = {}
+        self._quality_loaded_at = 0.0
+
+    def domain_quality(self, domain: str) -> float:
+        """域名质量 0~1: crawler_config.DOMAIN_QUALITY，可用 Redis hash {prefix}quality 在运行时覆盖"""
+        if time.time() - self._quality_loaded_at > 60:
+            try:
+                overrides = self.redis_client.hgetall(f"{FRONTIER_PREFIX}quality")
+                self._quality = {
+                    (k.decode('utf-8') if isinstance(k, bytes) else k): float(v)
+                    for k, v in overrides.items()
+                }
+            except Exception as e:
+                logger.warning(f"Failed to load domain quality overrides: {e}")
+            self._quality_loaded_at = time.time()
+        return self._quality.get(domain, DOMAIN_QUALITY.get(domain, DEFAULT_DOMAIN_QUALITY))
+
+    def score(self, task: dict, domain: str, now: float):
+        """
+        (层, 基础得分)；得分越小越优先，入链数在 Lua 中叠加
+
+        新鲜度: 从未抓过的 URL 为 1；重爬任务按上次抓取距今的时间增长（越旧越需要重爬）
+        """
+        depth = task.get('depth', 0)
+        quality = self.domain_quality(domain)
+        last_crawled_at = task.get('last_crawled_at')
+        if last_crawled_at is None:
+            freshness = 1.0
+        else:
+            freshness = 1 - 0.5 ** (max(0.0, now - last_crawled_at) / FRESHNESS_HALF_LIFE)
+
+        priority = (
+            FRONTIER_WEIGHTS['depth'] / (1 + depth)
+            + FRONTIER_WEIGHTS['quality'] * quality
+            + FRONTIER_WEIGHTS['freshness'] * freshness
+        )
+        if task.get('recrawl') or depth == 0:
+            tier = TIER_SEED
+        elif depth >= FRONTIER_DEEP_DEPTH or quality < FRONTIER_LOW_QUALITY:
+            tier = TIER_LOW
+        else:
+            tier = TIER_NORMAL
+        return tier, -priority
+
+    def push(self, tasks: List[dict]) -> List[bool]:
+        """批量加入（一次 Lua 调用），返回每个任务是否为新加入"""
+        if not tasks:
+            return []
+        now = time.time()
+        args = [FRONTIER_PREFIX, FRONTIER_WEIGHTS['inlinks'], FRONTIER_TIERS]
+        for task in tasks:
+            domain = registered_domain(task['url'])
+            tier, base = self.score(task, domain, now)
+            rate = 1.0 / max(self.politeness.crawl_delay(task['url']), 0.001)
+            args.extend([task['url'], domain, tier, base, json.dumps(task), rate])
+        return [bool(r) for r in self._push(keys=self._keys, args=args)]
+
+    def claim(self, count: int, polite: bool = True) -> List[dict]:
+        """原子地领取最多 count 个主机已就绪的 URL（一次 Lua 调用）"""
+        result = self._claim(keys=self._keys, args=[
+            FRONTIER_PREFIX, count, FRONTIER_TIERS,
+            1.0 / max(HOST_CRAWL_DELAY, 0.001), HOST_BURST, FRONTIER_SCAN_HOSTS, 1 if polite else 0
+        ])
+        tasks = []
+        for i in range(0, len(result), 2):
+            url = result[i].decode('utf-8') if isinstance(result[i], bytes) else result[i]
+            try:
+                task = json.loads(result[i + 1]) if result[i + 1] else {}
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                task = {}
+            task.setdefault('url', url)
+            task.setdefault('depth', 0)
+            tasks.append(task)
+        return tasks
+
+    def size(self) -> int:
+        return max(0, int(self.redis_client.get(f"{FRONTIER_PREFIX}size") or 0))
+
+    def next_ready_in(self) -> Optional[float]:
+        """最早就绪的域名还需等待的秒数（队列为空时为 None）"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for tier in range(FRONTIER_TIERS):
+            pipe.zrange(f"{FRONTIER_PREFIX}t{tier}:hosts", 0, 0, withscores=True)
+        pipe.time()
+        *heads, (seconds, microseconds) = pipe.execute()
+        heads = [head[0][1] for head in heads if head]
+        return max(0.0, min(heads) - (seconds + microseconds / 1e6)) if heads else None
+
+    def get_stats(self) -> dict:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for tier in range(FRONTIER_TIERS):
+            pipe.zcard(f"{FRONTIER_PREFIX}t{tier}:hosts")
+        hosts = pipe.execute()
+        return {
+            'size': self.size(),
+            'hosts_by_tier': {tier: count for tier, count in enumerate(hosts)},
+        }
+
+    def clear(self):
+        """删除所有队列状态（保留运行时设置的域名质量）"""
+        quality_key = f"{FRONTIER_PREFIX}quality".encode('utf-8')
+        keys = [
+            key for key in self.redis_client.scan_iter(match=f"{FRONTIER_PREFIX}*", count=1000)
+            if key != quality_key and key != quality_key.decode('utf-8')
+        ]
+        for i in range(0, len(keys), 1000):
+            self.redis_client.delete(*keys[i:i + 1000])
@@ -6,9 +6,10 @@ import argparse
 import logging
 from typing import List
 
+import asyncio
 from crawler import WebCrawler
 from url_manager import URLManager
-from crawler_config import DEFAULT_SEED_URLS, NUM_WORKERS
+from crawler_config import DEFAULT_SEED_URLS, NUM_WORKERS, DRISSION_MODE, ASYNC_FETCH, FETCH_CONCURRENCY
 
 logging.basicConfig(
     level=logging.INFO,
@@ -35,6 +36,13 @@ def main():
         help=f'并发工作进程数（默认: {NUM_WORKERS}）'
     )
     
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=FETCH_CONCURRENCY,
+        help=f'异步抓取引擎的并发抓取数（s 模式，默认: {FETCH_CONCURRENCY}）'
+    )
+    
     parser.add_argument(
         '--clear',
         action='store_true',
@@ -71,6 +79,15 @@ def main():
     # 获取种子URL
     seed_urls: List[str] = args.seeds if args.seeds else DEFAULT_SEED_URLS
     
+    if DRISSION_MODE == 's' and ASYNC_FETCH:
+        # Session 模式使用异步抓取引擎（单进程数百个并发抓取）
+        from async_crawler import AsyncCrawler
+        logger.info("=== Starting Async Web Crawler ===")
+        logger.info(f"Concurrency: {args.concurrency}")
+        logger.info(f"Seed URLs: {seed_urls}")
+        asyncio.run(AsyncCrawler(concurrency=args.concurrency, seed_urls=seed_urls).run())
+        return
+    
     logger.info("=== Starting Web Crawler ===")
     logger.info(f"Workers: {args.workers}")
     logger.info(f"Seed URLs: {seed_urls}")
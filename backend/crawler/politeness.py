@@ -0,0 +1,96 @@
+"""
+按主机的礼貌性参数 - 注册域名和抓取间隔
+
+- 每个注册域名一个令牌桶（由 frontier 的领取脚本维护，状态在 Redis，所有 worker 共享），
+  令牌以 1 / crawl_delay 的速率补充，最多 HOST_BURST 个；每次抓取消耗一个令牌
+- crawl_delay 取 HOST_CRAWL_DELAY 与 robots.txt 中 Crawl-delay 的较大值
+  （robots.txt 在后台线程获取，结果在 Redis 缓存 ROBOTS_CACHE_TTL 秒，获取前先用默认值）
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from crawler_config import (
+    USER_AGENT, HOST_CRAWL_DELAY,
+    RESPECT_ROBOTS_CRAWL_DELAY, ROBOTS_CACHE_TTL, ROBOTS_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_PREFIX = "crawler:robots_delay:"
+
+# 常见的二级公共后缀（example.co.uk、example.com.cn 的注册域名取最后三段）
+_SECOND_LEVEL = {'co', 'com', 'net', 'org', 'gov', 'edu', 'ac'}
+
+
+def registered_domain(url: str) -> str:
+    """URL 的注册域名（近似 eTLD+1），礼貌性按它计算"""
+    host = (urlparse(url).hostname or '').lower().rstrip('.')
+    labels = host.split('.')
+    if len(labels) <= 2 or host.replace('.', '').isdigit():
+        return host
+    if labels[-2] in _SECOND_LEVEL and len(labels[-1]) == 2:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+class PolitenessScheduler:
+    """按主机的抓取间隔（含 robots.txt Crawl-delay）"""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._delays: Dict[str, float] = {}  # host -> crawl delay（本地缓存）
+        self._pending_robots: Set[str] = set()
+        self._lock = threading.Lock()
+        self._robots_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="robots")
+
+    def crawl_delay(self, url: str) -> float:
+        """主机的抓取间隔（秒）；robots.txt 未知时先返回默认值并在后台获取"""
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        delay = self._delays.get(host)
+        if delay is not None:
+            return delay
+        if not RESPECT_ROBOTS_CRAWL_DELAY:
+            return HOST_CRAWL_DELAY
+
+        cached = self.redis_client.get(f"{ROBOTS_PREFIX}{host}")
+        if cached is not None:
+            delay = max(HOST_CRAWL_DELAY, float(cached))
+            self._delays[host] = delay
+            return delay
+
+        with self._lock:
+            if host not in self._pending_robots:
+                self._pending_robots.add(host)
+                self._robots_executor.submit(self._fetch_robots, parsed.scheme or 'http', host)
+        return HOST_CRAWL_DELAY
+
+    def _fetch_robots(self, scheme: str, host: str):
+        robots_delay = 0.0
+        try:
+            response = requests.get(
+                f"{scheme}://{host}/robots.txt",
+                headers={'User-Agent': USER_AGENT},
+                timeout=ROBOTS_TIMEOUT
+            )
+            if response.ok:
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+                robots_delay = float(parser.crawl_delay(USER_AGENT) or 0)
+        except Exception as e:
+            logger.debug(f"Failed to fetch robots.txt for {host}: {e}")
+        try:
+            self.redis_client.set(f"{ROBOTS_PREFIX}{host}", robots_delay, ex=ROBOTS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache robots.txt crawl delay for {host}: {e}")
+        self._delays[host] = max(HOST_CRAWL_DELAY, robots_delay)
+        if robots_delay > HOST_CRAWL_DELAY:
+            logger.info(f"robots.txt Crawl-delay for {host}: {robots_delay}s")
+        with self._lock:
+            self._pending_robots.discard(host)
@@ -5,27 +5,20 @@
 功能:
 1. 从数据库找到所有 title="The heart of the internet" 的文档
 2. 提取这些文档的 URL
-3. 将 URL 添加到 Redis 爬虫队列的**头部**（优先爬取）
+3. 将 URL 加入爬虫 frontier 的**最高优先级层**（优先爬取）
 4. 从数据库**彻底删除**这些文档及相关数据
 """
 
 import asyncio
 import sys
 import os
-import redis
-import json
 
 # 添加 python 目录到路径
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
 
 from sqlalchemy import text
 from database import AsyncSessionLocal
-
-# Redis 配置
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
-REDIS_CRAWLER_DB = 1
-TASK_QUEUE_KEY = "crawler:task_queue"
+from url_manager import URLManager
 
 
 async def find_bad_documents():
@@ -55,66 +48,35 @@ async def find_bad_documents():
         ]
 
 
-async def delete_document_completely(doc_id: int, session):
-    """完全删除文档及其所有相关数据"""
-    # 1. 删除 postings (会自动通过 CASCADE 删除)
-    # 2. 删除 embeddings (会自动通过 CASCADE 删除)
-    # 3. 删除 document
-    
-    delete_query = text("""
-        DELETE FROM documents WHERE id = :doc_id
-    """)
-    
-    await session.execute(delete_query, {"doc_id": doc_id})
-
-
 async def delete_bad_documents(doc_ids: list):
-    """批量删除文档"""
+    """批量删除文档及其 posting / 向量（一个事务）
+
+    这些文档的近似重复文档（其他 URL）会被保留，并重新挂到其他规范文档或升为规范文档建索引
+    """
+    from index_service import get_index_service
+    
     print(f"🗑️  开始删除 {len(doc_ids)} 个文档...")
     
     async with AsyncSessionLocal() as session:
-        deleted = 0
-        for doc_id in doc_ids:
-            try:
-                await delete_document_completely(doc_id, session)
-                deleted += 1
-                if deleted % 10 == 0:
-                    print(f"   已删除 {deleted}/{len(doc_ids)}...")
-            except Exception as e:
-                print(f"   ❌ 删除文档 {doc_id} 失败: {e}")
-        
-        await session.commit()
+        try:
+            deleted = await get_index_service().delete_documents(doc_ids, session)
+        except Exception as e:
+            print(f"   ❌ 删除文档失败: {e}")
+            raise
         print(f"✅ 成功删除 {deleted} 个文档")
 
 
-def add_urls_to_queue_head(urls: list):
-    """将 URL 添加到 Redis 队列头部（使用 LPUSH）"""
-    print(f"📥 将 {len(urls)} 个 URL 添加到爬虫队列头部...")
+def add_urls_to_recrawl(urls: list):
+    """将 URL 加入 frontier 的最高优先级层（重爬任务，跳过已访问检查）"""
+    print(f"📥 将 {len(urls)} 个 URL 加入最高优先级重爬队列...")
     
     try:
-        r = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            db=REDIS_CRAWLER_DB,
-            decode_responses=True
-        )
-        
-        # 使用 LPUSH 添加到队列头部（优先爬取）
-        added = 0
-        for url in urls:
-            if url:  # 确保 URL 不为空
-                task = json.dumps({
-                    'url': url,
-                    'depth': 0  # 重置深度
-                })
-                r.lpush(TASK_QUEUE_KEY, task)
-                added += 1
-        
-        print(f"✅ 成功添加 {added} 个 URL 到队列头部")
+        url_manager = URLManager()
+        added = url_manager.add_recrawl_urls(urls)
+        print(f"✅ 成功添加 {added} 个 URL（其余已在队列中，已提升为最高优先级）")
         
         # 显示队列状态
-        queue_size = r.llen(TASK_QUEUE_KEY)
-        print(f"📊 当前队列大小: {queue_size}")
+        print(f"📊 当前队列大小: {url_manager.get_queue_size()}")
         
     except Exception as e:
         print(f"❌ 添加到 Redis 失败: {e}")
@@ -159,8 +121,8 @@ async def main():
     urls = [doc['url'] for doc in bad_docs if doc.get('url')]
     print(f"📋 提取了 {len(urls)} 个有效 URL")
     
-    # 3. 添加到 Redis 队列头部
-    add_urls_to_queue_head(urls)
+    # 3. 加入最高优先级重爬队列
+    add_urls_to_recrawl(urls)
     print()
     
     # 4. 删除文档
@@ -173,7 +135,7 @@ async def main():
     print()
     print("📌 下一步:")
     print("   1. 启动爬虫: cd /home/lancelot/verdant_search/backend/crawler && ./start_crawler.sh")
-    print("   2. 爬虫会优先处理这些 URL（它们在队列头部）")
+    print("   2. 爬虫会优先处理这些 URL（它们在最高优先级层）")
     print("   3. 浏览器会显示（headful 模式），可以看到爬取过程")
     print("=" * 70)
 
@@ -44,12 +44,12 @@ if ! python3 -c "
 from DrissionPage import SessionPage
 import trafilatura
 import redis
-from pybloom_live import BloomFilter
+import aiohttp
 print('OK')
 " > /dev/null 2>&1; then
     echo -e "${RED}错误: 缺少依赖包!${NC}"
     echo -e "${YELLOW}正在安装依赖...${NC}"
-    pip install DrissionPage trafilatura readability-lxml redis pybloom-live lxml
+    pip install DrissionPage trafilatura readability-lxml redis aiohttp lxml
 fi
 echo -e "${GREEN}✓ 依赖检查完成${NC}"
 echo ""
@@ -59,7 +59,15 @@ WORKERS=${CRAWLER_WORKERS:-3}
 
 # 检查 Redis 队列是否有任务
 echo -e "${YELLOW}检查任务队列...${NC}"
-QUEUE_SIZE=$(docker exec verdant_redis redis-cli -n 1 LLEN crawler:task_queue 2>/dev/null || echo "0")
+# 任务在优先级 frontier 中（crawler:{frontier}:size 为总数）；
+# 旧版本留下的 crawler:task_queue / crawler:deferred 会在爬虫启动时迁移进 frontier
+FRONTIER_SIZE=$(docker exec verdant_redis redis-cli -n 1 GET "crawler:{frontier}:size" 2>/dev/null)
+LEGACY_SIZE=$(docker exec verdant_redis redis-cli -n 1 LLEN crawler:task_queue 2>/dev/null)
+DEFERRED_SIZE=$(docker exec verdant_redis redis-cli -n 1 ZCARD crawler:deferred 2>/dev/null)
+[[ "$FRONTIER_SIZE" =~ ^-?[0-9]+$ ]] || FRONTIER_SIZE=0
+[[ "$LEGACY_SIZE" =~ ^[0-9]+$ ]] || LEGACY_SIZE=0
+[[ "$DEFERRED_SIZE" =~ ^[0-9]+$ ]] || DEFERRED_SIZE=0
+QUEUE_SIZE=$(( (FRONTIER_SIZE > 0 ? FRONTIER_SIZE : 0) + LEGACY_SIZE + DEFERRED_SIZE ))
 
 if [ "$QUEUE_SIZE" -gt 0 ]; then
     echo -e "${GREEN}✓ 发现队列中有 ${QUEUE_SIZE} 个任务${NC}"
@@ -1,23 +1,30 @@
 """
-URL管理器 - 使用Redis Bloomfilter去重和任务队列
+URL管理器 - 使用Redis服务端Bloomfilter去重和优先级爬取前沿（frontier）
 """
 import redis
-from typing import List, Optional
+import json
+from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse, urljoin
 import logging
-from pybloom_live import BloomFilter
 import pickle
 
+from bloom_filter import RedisBloomFilter
+from politeness import PolitenessScheduler
+from frontier import Frontier
+
 from crawler_config import (
     REDIS_HOST, REDIS_PORT, REDIS_CRAWLER_DB, REDIS_PASSWORD,
-    BLOOMFILTER_KEY, TASK_QUEUE_KEY,
-    BLOOMFILTER_ERROR_RATE, BLOOMFILTER_CAPACITY,
+    BLOOMFILTER_KEY, LEGACY_BLOOMFILTER_KEY, TASK_QUEUE_KEY, ADMISSION_STATS_KEY,
+    BLOOMFILTER_ERROR_RATE, BLOOMFILTER_CAPACITY, BLOOMFILTER_BACKEND,
     EXCLUDED_EXTENSIONS, ALLOWED_DOMAINS,
-    ENABLE_RATE_LIMIT, REQUESTS_PER_BATCH, BATCH_REST_DURATION
+    DEFERRED_QUEUE_KEY, ENABLE_RATE_LIMIT
 )
 
 logger = logging.getLogger(__name__)
 
+# 链接被拒绝的原因
+ADMISSION_REASONS = ('invalid', 'duplicate', 'visited', 'queued', 'error')
+
 
 class URLManager:
     """URL管理器 - 使用Redis Bloomfilter去重"""
@@ -29,37 +36,29 @@ class URLManager:
             port=REDIS_PORT,
             db=REDIS_CRAWLER_DB,
             password=REDIS_PASSWORD if REDIS_PASSWORD else None,
-            decode_responses=False  # Bloomfilter需要bytes
+            decode_responses=False  # 任务队列兼容旧的 pickle 数据
         )
         
-        # 初始化或加载Bloomfilter
-        self.bloom_filter = self._load_or_create_bloom_filter()
+        # 服务端Bloomfilter（所有worker共享，检查/标记都在Redis内完成）
+        self.bloom_filter = RedisBloomFilter(
+            self.redis_client,
+            BLOOMFILTER_KEY,
+            capacity=BLOOMFILTER_CAPACITY,
+            error_rate=BLOOMFILTER_ERROR_RATE,
+            backend=BLOOMFILTER_BACKEND
+        )
+        # 按域名的礼貌性参数 + 优先级前沿（按域名令牌桶领取）
+        self.politeness = PolitenessScheduler(self.redis_client)
+        self.frontier = Frontier(self.redis_client, self.politeness)
+        self._migrate_legacy_queue()
         
-        logger.info(f"URLManager initialized with Redis at {REDIS_HOST}:{REDIS_PORT}/{REDIS_CRAWLER_DB}")
-    
-    def _load_or_create_bloom_filter(self) -> BloomFilter:
-        """从Redis加载或创建新的Bloomfilter"""
-        try:
-            bloom_data = self.redis_client.get(BLOOMFILTER_KEY)
-            if bloom_data:
-                bloom_filter = pickle.loads(bloom_data)
-                logger.info(f"Loaded existing Bloomfilter with {bloom_filter.count} items")
-                return bloom_filter
-        except Exception as e:
-            logger.warning(f"Failed to load Bloomfilter: {e}")
+        if self.redis_client.exists(LEGACY_BLOOMFILTER_KEY):
+            logger.warning(
+                f"Found legacy pickled Bloomfilter at '{LEGACY_BLOOMFILTER_KEY}', it is no longer used "
+                f"(visited URLs are now tracked in '{BLOOMFILTER_KEY}'); delete it to free memory"
+            )
         
-        # 创建新的Bloomfilter
-        bloom_filter = BloomFilter(capacity=BLOOMFILTER_CAPACITY, error_rate=BLOOMFILTER_ERROR_RATE)
-        logger.info(f"Created new Bloomfilter (capacity={BLOOMFILTER_CAPACITY}, error_rate={BLOOMFILTER_ERROR_RATE})")
-        return bloom_filter
-    
-    def _save_bloom_filter(self):
-        """保存Bloomfilter到Redis"""
-        try:
-            bloom_data = pickle.dumps(self.bloom_filter)
-            self.redis_client.set(BLOOMFILTER_KEY, bloom_data)
-        except Exception as e:
-            logger.error(f"Failed to save Bloomfilter: {e}")
+        logger.info(f"URLManager initialized with Redis at {REDIS_HOST}:{REDIS_PORT}/{REDIS_CRAWLER_DB}")
     
     def normalize_url(self, url: str) -> str:
         """标准化URL"""
@@ -98,188 +97,200 @@ class URLManager:
         except Exception:
             return False
     
-    def is_visited(self, url: str) -> bool:
-        """检查URL是否已访问（实时从Redis加载）"""
-        normalized_url = self.normalize_url(url)
-        
-        # 实时从 Redis 加载最新的 Bloomfilter
+    def are_visited(self, urls: List[str]) -> List[bool]:
+        """批量检查URL是否已访问（一次Redis往返）"""
+        if not urls:
+            return []
         try:
-            bloom_data = self.redis_client.get(BLOOMFILTER_KEY)
-            if bloom_data:
-                bloom_filter = pickle.loads(bloom_data)
-                return normalized_url in bloom_filter
+            return self.bloom_filter.contains_many([self.normalize_url(url) for url in urls])
         except Exception as e:
-            logger.warning(f"Failed to load Bloomfilter for check: {e}")
-        
-        # 如果加载失败，使用本地缓存
-        return normalized_url in self.bloom_filter
+            logger.warning(f"Failed to check Bloomfilter: {e}")
+            return [False] * len(urls)
     
-    def mark_visited(self, url: str):
-        """标记URL为已访问（实时保存到Redis）"""
-        normalized_url = self.normalize_url(url)
-        
-        # 使用 Redis 锁确保原子性
-        lock_key = f"{BLOOMFILTER_KEY}:lock"
-        lock = self.redis_client.lock(lock_key, timeout=5)
+    def mark_visited_many(self, urls: List[str]) -> List[bool]:
+        """
+        批量标记URL为已访问（一次Redis往返）
         
+        Returns:
+            每个URL是否为首次标记（False 表示已被其他worker标记过）
+        """
+        if not urls:
+            return []
         try:
-            # 获取锁
-            if lock.acquire(blocking=True, blocking_timeout=10):
-                try:
-                    # 从 Redis 加载最新的 Bloomfilter
-                    bloom_data = self.redis_client.get(BLOOMFILTER_KEY)
-                    if bloom_data:
-                        bloom_filter = pickle.loads(bloom_data)
-                    else:
-                        bloom_filter = BloomFilter(capacity=BLOOMFILTER_CAPACITY, error_rate=BLOOMFILTER_ERROR_RATE)
-                    
-                    # 添加 URL
-                    bloom_filter.add(normalized_url)
-                    
-                    # 保存回 Redis
-                    bloom_data = pickle.dumps(bloom_filter)
-                    self.redis_client.set(BLOOMFILTER_KEY, bloom_data)
-                    
-                    # 更新本地缓存
-                    self.bloom_filter = bloom_filter
-                    
-                finally:
-                    # 释放锁
-                    lock.release()
-            else:
-                logger.warning(f"Failed to acquire lock for marking URL as visited: {url}")
+            return self.bloom_filter.add_many([self.normalize_url(url) for url in urls])
         except Exception as e:
-            logger.error(f"Failed to mark URL as visited: {e}")
+            logger.error(f"Failed to mark URLs as visited: {e}")
+            return [True] * len(urls)
+    
+    def is_visited(self, url: str) -> bool:
+        """检查URL是否已访问"""
+        return self.are_visited([url])[0]
+    
+    def mark_visited(self, url: str) -> bool:
+        """标记URL为已访问，返回是否为首次标记（检查+标记是原子的）"""
+        return self.mark_visited_many([url])[0]
     
-    def check_and_rest_if_needed(self):
+    def admit_urls(self, urls: List[str], depth: int = 0) -> Dict[str, Any]:
         """
-        检查全局请求计数，必要时休息
+        批量准入一页的链接
         
-        每处理 REQUESTS_PER_BATCH 个请求后，所有worker统一休息 BATCH_REST_DURATION 秒
-        使用 Redis 实现分布式计数和同步
+        1. 验证并标准化，页内去重
+        2. 一次批量查询 Bloomfilter 过滤已访问的URL
+        3. 剩余URL一次写入 frontier（一次 Lua 调用），并累加全局准入统计
+        
+        Returns:
+            {'admitted': int, 'rejected': {原因: 数量}}
+            原因: invalid（无效/被过滤）、duplicate（页内重复）、visited（已访问）、
+                  queued（已在队列中，入链数 +1）、error（入队失败）
         """
-        # 如果限速功能被禁用，直接返回
-        if not ENABLE_RATE_LIMIT:
-            return
+        rejected = {reason: 0 for reason in ADMISSION_REASONS}
         
-        import time
+        candidates = []
+        seen = set()
+        for url in urls:
+            if not self.is_valid_url(url):
+                rejected['invalid'] += 1
+                continue
+            normalized_url = self.normalize_url(url)
+            if normalized_url in seen:
+                rejected['duplicate'] += 1
+                continue
+            seen.add(normalized_url)
+            candidates.append(normalized_url)
         
-        # Redis keys
-        request_counter_key = "crawler:request_counter"
-        rest_until_key = "crawler:rest_until"
+        fresh = [url for url, is_visited in zip(candidates, self.are_visited(candidates)) if not is_visited]
+        rejected['visited'] = len(candidates) - len(fresh)
         
-        # 检查是否正在休息
-        rest_until = self.redis_client.get(rest_until_key)
-        if rest_until:
-            rest_until_time = float(rest_until.decode('utf-8'))
-            now = time.time()
-            if now < rest_until_time:
-                # 正在休息中
-                sleep_time = rest_until_time - now
-                logger.info(f"🛑 全局限速: 休息中，还需等待 {int(sleep_time)} 秒...")
-                time.sleep(sleep_time)
-                return
+        try:
+            added = self.frontier.push([{'url': url, 'depth': depth} for url in fresh])
+            admitted = sum(added)
+            rejected['queued'] = len(fresh) - admitted  # 已在队列中（记为一次入链）
+        except Exception as e:
+            logger.error(f"Failed to add URLs to frontier: {e}")
+            admitted = 0
+            rejected['error'] = len(fresh)
         
-        # 原子性递增请求计数
-        current_count = self.redis_client.incr(request_counter_key)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hincrby(ADMISSION_STATS_KEY, 'admitted', admitted)
+            for reason, count in rejected.items():
+                if count:
+                    pipe.hincrby(ADMISSION_STATS_KEY, reason, count)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to update admission stats: {e}")
         
-        # 检查是否达到批次限制
-        if current_count >= REQUESTS_PER_BATCH:
-            # 设置休息时间
-            rest_until_time = time.time() + BATCH_REST_DURATION
-            self.redis_client.set(rest_until_key, str(rest_until_time), ex=BATCH_REST_DURATION + 10)
-            
-            # 重置计数器
-            self.redis_client.set(request_counter_key, "0")
-            
-            logger.warning(
-                f"⏸️  全局限速: 已处理 {current_count} 个请求，"
-                f"休息 {BATCH_REST_DURATION} 秒..."
-            )
-            time.sleep(BATCH_REST_DURATION)
-            logger.info("▶️  全局限速: 休息结束，继续爬取")
+        return {'admitted': admitted, 'rejected': rejected}
     
-    def add_urls(self, urls: List[str], depth: int = 0):
-        """批量添加URL到任务队列"""
-        added_count = 0
-        for url in urls:
-            if self.add_url(url, depth):
-                added_count += 1
-        
-        logger.info(f"Added {added_count}/{len(urls)} URLs to task queue")
-        return added_count
+    def add_urls(self, urls: List[str], depth: int = 0) -> int:
+        """批量添加URL到任务队列，返回实际入队数量"""
+        result = self.admit_urls(urls, depth)
+        rejected = ", ".join(f"{reason}={count}" for reason, count in result['rejected'].items() if count)
+        logger.info(
+            f"Added {result['admitted']}/{len(urls)} URLs to task queue"
+            + (f" (rejected: {rejected})" if rejected else "")
+        )
+        return result['admitted']
     
     def add_url(self, url: str, depth: int = 0) -> bool:
         """添加单个URL到任务队列"""
-        # 验证URL
-        if not self.is_valid_url(url):
-            return False
-        
-        normalized_url = self.normalize_url(url)
-        
-        # 检查是否已访问
-        if self.is_visited(normalized_url):
-            return False
-        
-        # 添加到任务队列（使用 JSON 格式）
+        return self.admit_urls([url], depth)['admitted'] == 1
+    
+    def get_admission_stats(self) -> Dict[str, int]:
+        """所有worker累计的链接准入统计"""
+        stats = {'admitted': 0, **{reason: 0 for reason in ADMISSION_REASONS}}
         try:
-            import json
-            task_data = {
-                'url': normalized_url,
-                'depth': depth
-            }
-            # 统一使用 JSON 格式（更通用、易调试）
-            self.redis_client.rpush(TASK_QUEUE_KEY, json.dumps(task_data))
-            return True
+            for field, value in self.redis_client.hgetall(ADMISSION_STATS_KEY).items():
+                stats[field.decode('utf-8')] = int(value)
         except Exception as e:
-            logger.error(f"Failed to add URL to queue: {e}")
-            return False
+            logger.warning(f"Failed to get admission stats: {e}")
+        return stats
+    
+    def add_recrawl_urls(self, urls: List[str]) -> int:
+        """把已访问过的URL加入最高优先级层重新爬取（跳过 Bloomfilter 检查）"""
+        tasks = [
+            {'url': self.normalize_url(url), 'depth': 0, 'recrawl': True}
+            for url in urls if url and self.is_valid_url(url)
+        ]
+        return sum(self.frontier.push(tasks))
     
     def get_next_url(self) -> Optional[dict]:
-        """从任务队列获取下一个URL（兼容 JSON 和 pickle 格式）"""
+        """获取下一个主机已就绪的URL"""
+        tasks = self.get_next_urls(1)
+        return tasks[0] if tasks else None
+    
+    def get_next_urls(self, count: int) -> List[dict]:
+        """
+        原子地领取最多 count 个URL（一次 Lua 调用）
+        
+        按优先级层从高到低，在主机已就绪的域名中轮转，每个域名取其子队列中得分最高的URL。
+        """
         try:
-            import json
-            task_data = self.redis_client.lpop(TASK_QUEUE_KEY)
-            if not task_data:
-                return None
-            
-            # 优先尝试 JSON 格式（新格式）
-            try:
-                if isinstance(task_data, bytes):
-                    task_data = task_data.decode('utf-8')
-                return json.loads(task_data)
-            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
-                # JSON 失败，尝试 pickle 格式（兼容旧数据）
-                try:
-                    if isinstance(task_data, str):
-                        task_data = task_data.encode('utf-8')
-                    return pickle.loads(task_data)
-                except Exception as pickle_error:
-                    logger.error(f"Failed to deserialize task (tried JSON and pickle): {pickle_error}")
-                    return None
+            return self.frontier.claim(count, polite=ENABLE_RATE_LIMIT)
         except Exception as e:
-            logger.error(f"Failed to get URL from queue: {e}")
+            logger.error(f"Failed to claim URLs from frontier: {e}")
+            return []
+    
+    def next_ready_in(self) -> Optional[float]:
+        """最早就绪的域名还需等待的秒数（队列为空时为 None）"""
+        try:
+            return self.frontier.next_ready_in()
+        except Exception:
             return None
     
+    def _migrate_legacy_queue(self):
+        """把旧版 FIFO 列表和延后队列中的任务迁移到 frontier（多个进程同时执行也安全）"""
+        try:
+            migrated = 0
+            while True:
+                batch = self.redis_client.lpop(TASK_QUEUE_KEY, 500)
+                if not batch:
+                    break
+                tasks = [task for task in (self._decode_task(task_data) for task_data in batch) if task]
+                self.frontier.push(tasks)
+                migrated += len(tasks)
+            while True:
+                batch = self.redis_client.zpopmin(DEFERRED_QUEUE_KEY, 500)
+                if not batch:
+                    break
+                tasks = [task for task in (self._decode_task(task_data) for task_data, _ in batch) if task]
+                self.frontier.push(tasks)
+                migrated += len(tasks)
+            if migrated:
+                logger.info(f"Migrated {migrated} queued URLs from the legacy task queue to the frontier")
+        except Exception as e:
+            logger.warning(f"Failed to migrate legacy task queue: {e}")
+    
+    def _decode_task(self, task_data) -> Optional[dict]:
+        # 优先尝试 JSON 格式（新格式）
+        try:
+            if isinstance(task_data, bytes):
+                task_data = task_data.decode('utf-8')
+            return json.loads(task_data)
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+            # JSON 失败，尝试 pickle 格式（兼容旧数据）
+            try:
+                if isinstance(task_data, str):
+                    task_data = task_data.encode('utf-8')
+                return pickle.loads(task_data)
+            except Exception as pickle_error:
+                logger.error(f"Failed to deserialize task (tried JSON and pickle): {pickle_error}")
+                return None
+    
     def get_queue_size(self) -> int:
-        """获取任务队列大小"""
+        """获取待爬URL数量"""
         try:
-            return self.redis_client.llen(TASK_QUEUE_KEY)
+            return self.frontier.size()
         except Exception:
             return 0
     
     def get_visited_count(self) -> int:
-        """获取已访问URL数量（实时从Redis加载）"""
+        """获取已访问URL数量"""
         try:
-            bloom_data = self.redis_client.get(BLOOMFILTER_KEY)
-            if bloom_data:
-                bloom_filter = pickle.loads(bloom_data)
-                return bloom_filter.count
+            return self.bloom_filter.count()
         except Exception as e:
             logger.warning(f"Failed to get visited count from Redis: {e}")
-        
-        # 如果加载失败，返回本地缓存的计数
-        return self.bloom_filter.count
+            return 0
     
     def extract_links(self, base_url: str, html_content: str) -> List[str]:
         """从HTML中提取所有链接"""
@@ -305,14 +316,13 @@ class URLManager:
     def clear_all(self):
         """清空所有数据（开发/调试用）"""
         try:
-            self.redis_client.delete(BLOOMFILTER_KEY)
-            self.redis_client.delete(TASK_QUEUE_KEY)
-            self.bloom_filter = BloomFilter(capacity=BLOOMFILTER_CAPACITY, error_rate=BLOOMFILTER_ERROR_RATE)
+            self.bloom_filter.clear()
+            self.frontier.clear()
+            self.redis_client.delete(TASK_QUEUE_KEY, DEFERRED_QUEUE_KEY, ADMISSION_STATS_KEY, LEGACY_BLOOMFILTER_KEY)
             logger.info("Cleared all URL data")
         except Exception as e:
             logger.error(f"Failed to clear URL data: {e}")
     
     def save(self):
-        """保存当前状态"""
-        self._save_bloom_filter()
-        logger.info(f"Saved Bloomfilter with {self.bloom_filter.count} items")
+        """保存当前状态（Bloomfilter 已实时写在 Redis 中，无需额外保存）"""
+        logger.info(f"Bloomfilter holds {self.get_visited_count()} visited URLs")
@@ -31,7 +31,7 @@ async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
     total_images = img_result.scalar()
     
     # 3. Redis Crawler Queue
-    queue_size = redis_client.llen("crawler:task_queue")
+    queue_size = int(redis_client.get("crawler:{frontier}:size") or 0)
     visited_count = 0 # Need to approximation or get from bloom filter meta if stored
     
     # 4. Crawler Status (Scanning keys)
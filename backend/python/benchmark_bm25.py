@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+BM25 top-k 检索基准测试
+
+在合成的 Zipf 分布语料上比较:
+- memory:   向量化穷举 BM25
+- maxscore: Block-Max MaxScore 动态剪枝
+- blocks:   按块打包的 posting（posting_blocks 布局）+ 跳块，含解码开销
+
+查询由常见词 + 少量中频词组成，观察延迟随语料规模的变化。
+不需要数据库，直接构建内存倒排索引。
+
+使用方式:
+    python benchmark_bm25.py
+    python benchmark_bm25.py --sizes 20000 100000 400000 --top-k 200
+"""
+import argparse
+import time
+from types import SimpleNamespace
+import numpy as np
+
+from inverted_index import InvertedIndex
+from posting_blocks import PostingBlockStore, TermBlocks, pack_term
+
+
+def build_index(num_docs: int, vocab_size: int, avg_len: int, seed: int = 42) -> InvertedIndex:
+    """构建合成语料的内存倒排索引（Zipf 词分布）"""
+    rng = np.random.default_rng(seed)
+    index = InvertedIndex()
+    index.loaded = True
+
+    lengths = np.maximum(5, rng.poisson(avg_len, num_docs))
+    ranks = np.arange(1, vocab_size + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+
+    for doc_id, length in enumerate(lengths, start=1):
+        tokens = rng.choice(vocab_size, size=int(length), p=probs)
+        term_ids, tfs = np.unique(tokens, return_counts=True)
+        terms = {f"w{t}": (int(t) + 1, int(tf)) for t, tf in zip(term_ids, tfs)}
+        index.add_document(doc_id, terms, int(length))
+
+    index.merge_pending()  # 封存 memtable 并按分层策略合并（与后台 merger 的稳态一致）
+    return index
+
+
+def pack_index(index: InvertedIndex, terms) -> dict:
+    """按 posting_blocks 布局打包查询词（模拟数据库中的行）"""
+    packed = {}
+    for term in terms:
+        term_id = index.term_ids.get(term)
+        if term_id is None:
+            continue
+        plist = index.get_postings(term).astype(np.int64)
+        packed[term] = [
+            SimpleNamespace(
+                posting_count=count, block_last_doc=last_docs, block_max_tf=max_tfs,
+                block_min_doc_length=min_lengths, block_offsets=offsets, data=data
+            )
+            for _, count, last_docs, max_tfs, min_lengths, offsets, data in pack_term(*plist)
+        ]
+    return packed
+
+
+def blocks_search(index: InvertedIndex, packed: dict):
+    """每次查询都从打包字节开始（与从数据库读取一致）"""
+    store = PostingBlockStore()
+
+    def search(tokens, top_k):
+        terms = [TermBlocks(packed[t]) for t in set(tokens) if t in packed]
+        return store.score(terms, top_k, index.total_docs, index.avg_doc_length)
+    return search
+
+
+def time_strategy(fn, queries, top_k: int, repeat: int) -> float:
+    """平均每个查询的耗时（毫秒）"""
+    fn(queries[0], top_k)  # warm up (builds block metadata)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q, top_k)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 top-k benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 50000, 100000, 200000])
+    parser.add_argument("--vocab", type=int, default=50000)
+    parser.add_argument("--avg-len", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # 常见词（高 DF）+ 中频词
+    queries = [
+        ["w0", "w1", "w2", "w150"],
+        ["w3", "w5", "w400"],
+        ["w1", "w7", "w11", "w900", "w2500"],
+        ["w0", "w4", "w1200"],
+    ]
+
+    print("=" * 86)
+    print(
+        f"{'docs':>10} {'postings':>12} {'memory(ms)':>12} {'maxscore(ms)':>14} "
+        f"{'speedup':>9} {'blocks(ms)':>12} {'same':>6}"
+    )
+    print("-" * 86)
+
+    for size in args.sizes:
+        index = build_index(size, args.vocab, args.avg_len)
+        postings = index.get_stats()["total_postings"]
+        blocks = blocks_search(index, pack_index(index, {t for q in queries for t in q}))
+
+        # 比较分数序列（同分文档的顺序可能不同）
+        same = all(
+            np.allclose(
+                [s for _, s in index.search_bm25(q, args.top_k)],
+                [s for _, s in fn(q, args.top_k)]
+            )
+            for q in queries
+            for fn in (index.search_bm25_maxscore, blocks)
+        )
+        exhaustive = time_strategy(index.search_bm25, queries, args.top_k, args.repeat)
+        pruned = time_strategy(index.search_bm25_maxscore, queries, args.top_k, args.repeat)
+        packed = time_strategy(blocks, queries, args.top_k, args.repeat)
+
+        print(
+            f"{size:>10} {postings:>12} {exhaustive:>12.2f} {pruned:>14.2f} "
+            f"{exhaustive / pruned:>8.1f}x {packed:>12.2f} {str(same):>6}"
+        )
+
+    print("=" * 86)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+SQL BM25 查询计划基准测试
+
+对同一组查询比较:
+- join:    旧版 CTE，通过连接 documents 读取 doc_length（每个 posting 一次堆访问）
+- covered: 当前 BM25_SQL，doc_length 来自 postings，覆盖索引可走 index-only scan
+
+对每个查询执行 EXPLAIN (ANALYZE, BUFFERS)，输出执行时间、访问的缓冲区数、
+是否使用 index-only scan 以及 Heap Fetches，完整计划可写入文件。
+需要先运行 migrate_posting_doc_length.py。
+
+使用方式:
+    python benchmark_bm25_sql.py
+    python benchmark_bm25_sql.py --query "机器学习 算法" --output explain_bm25.txt
+"""
+import argparse
+import asyncio
+import re
+import sys
+from typing import List
+from sqlalchemy import text
+
+from database import AsyncSessionLocal
+from bm25_calculator import BM25_SQL
+from doc_stats_service import get_doc_stats_service
+
+# 覆盖索引之前的版本（连接 documents 取 doc_length）
+JOIN_SQL = """
+    WITH q_terms AS (
+        SELECT id, doc_frequency
+        FROM terms
+        WHERE term = ANY(:tokens)
+    ),
+    doc_matches AS (
+        SELECT
+            p.document_id,
+            t.doc_frequency,
+            p.term_frequency,
+            d.doc_length
+        FROM postings p
+        JOIN q_terms t ON p.term_id = t.id
+        JOIN documents d ON p.document_id = d.id
+    )
+    SELECT
+        document_id,
+        SUM(
+            LN( (:total_docs - doc_frequency + 0.5) / (doc_frequency + 0.5) + 1 ) *
+            ( (term_frequency * (:k1 + 1)) / (term_frequency + :k1 * (1 - :b + :b * (doc_length / :avg_doc_length))) )
+        ) as score
+    FROM doc_matches
+    GROUP BY document_id
+    ORDER BY score DESC
+    LIMIT :limit
+"""
+
+
+async def sample_queries(session, count: int) -> List[List[str]]:
+    """常见词 + 中频词组合（posting 最多的查询最能体现差异）"""
+    result = await session.execute(text("""
+        SELECT term FROM terms WHERE LENGTH(term) > 1 ORDER BY doc_frequency DESC LIMIT 200
+    """))
+    terms = [row.term for row in result]
+    if len(terms) < 4:
+        return [terms] if terms else []
+    return [
+        [terms[i], terms[i + 1], terms[(50 + i * 7) % len(terms)]]
+        for i in range(0, min(count * 3, len(terms) - 1), 3)
+    ][:count]
+
+
+async def explain(session, sql: str, params: dict) -> str:
+    result = await session.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql), params)
+    return "\n".join(row[0] for row in result)
+
+
+def summarize(plan: str) -> dict:
+    """从 EXPLAIN 文本中提取执行时间、缓冲区和扫描方式"""
+    execution = re.search(r"Execution Time: ([\d.]+) ms", plan)
+    buffers = re.search(r"Buffers: shared (?:hit=(\d+))?\s*(?:read=(\d+))?", plan)
+    heap_fetches = sum(int(n) for n in re.findall(r"Heap Fetches: (\d+)", plan))
+    return {
+        "ms": float(execution.group(1)) if execution else 0.0,
+        "hit": int(buffers.group(1) or 0) if buffers else 0,
+        "read": int(buffers.group(2) or 0) if buffers else 0,
+        "index_only": "Index Only Scan" in plan,
+        "joins_documents": " on documents" in plan,
+        "heap_fetches": heap_fetches,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the SQL BM25 query before/after the covering index")
+    parser.add_argument("--query", action="append", help="Space separated terms (repeatable)")
+    parser.add_argument("--count", type=int, default=5, help="Sampled queries when --query is not given")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--output", help="Write the full plans to this file")
+    args = parser.parse_args()
+
+    async with AsyncSessionLocal() as session:
+        await get_doc_stats_service().refresh(session)
+        stats = get_doc_stats_service()
+        if stats.total_docs == 0:
+            print("❌ 没有已索引的文档")
+            sys.exit(1)
+        missing = (await session.execute(
+            text("SELECT COUNT(*) FROM postings WHERE doc_length IS NULL")
+        )).scalar()
+        if missing:
+            print(f"⚠ {missing} 个 posting 缺少 doc_length，请先运行 migrate_posting_doc_length.py")
+
+        queries = [q.split() for q in args.query] if args.query else await sample_queries(session, args.count)
+
+        report = []
+        print("=" * 96)
+        print(f"{'query':<32} {'plan':<8} {'ms':>9} {'hit':>9} {'read':>8} {'index-only':>11} {'heap fetch':>11} {'docs join':>10}")
+        print("-" * 96)
+        for tokens in queries:
+            params = {
+                "tokens": tokens,
+                "total_docs": stats.total_docs,
+                "avg_doc_length": float(stats.avg_doc_length),
+                "k1": 1.5,
+                "b": 0.75,
+                "limit": args.top_k,
+            }
+            for label, sql in (("join", JOIN_SQL), ("covered", BM25_SQL)):
+                await explain(session, sql, params)  # warm up
+                plan = await explain(session, sql, params)
+                s = summarize(plan)
+                print(
+                    f"{' '.join(tokens)[:32]:<32} {label:<8} {s['ms']:>9.2f} {s['hit']:>9} {s['read']:>8} "
+                    f"{str(s['index_only']):>11} {s['heap_fetches']:>11} {str(s['joins_documents']):>10}"
+                )
+                report.append(f"### {' '.join(tokens)} [{label}]\n{plan}\n")
+        print("=" * 96)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(report))
+        print(f"📝 查询计划已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
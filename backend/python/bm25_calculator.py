@@ -1,76 +1,156 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from tokenizer_service import get_tokenizer_service
+from inverted_index import get_inverted_index
+from doc_stats_service import get_doc_stats_service
+from posting_blocks import get_posting_block_store
+from impact_index import get_impact_index
+from config import settings
+
+# BM25 over the database-resident inverted index (terms, postings)
+# Formula: IDF * ((TF * (k1 + 1)) / (TF + k1 * (1 - b + b * DL / AVGDL)))
+# IDF = ln( (N - n + 0.5) / (n + 0.5) + 1 )
+BM25_SQL = """
+    WITH q_terms AS (
+        SELECT id, doc_frequency 
+        FROM terms 
+        WHERE term = ANY(:tokens)
+    ),
+    doc_matches AS (
+        -- doc_length 存在 posting 中，覆盖索引 postings_bm25_covering_idx 可以只走索引；
+        -- migrate_posting_doc_length.py 回填之前的旧 posting 为 NULL，只对这些行回查 documents
+        SELECT 
+            p.document_id,
+            t.doc_frequency,
+            p.term_frequency,
+            COALESCE(
+                p.doc_length,
+                (SELECT d.doc_length FROM documents d WHERE d.id = p.document_id)
+            ) AS doc_length
+        FROM postings p
+        JOIN q_terms t ON p.term_id = t.id
+    )
+    SELECT 
+        document_id,
+        SUM(
+            LN( (:total_docs - doc_frequency + 0.5) / (doc_frequency + 0.5) + 1 ) *
+            ( (term_frequency * (:k1 + 1)) / (term_frequency + :k1 * (1 - :b + :b * (doc_length / :avg_doc_length))) )
+        ) as score
+    FROM doc_matches
+    GROUP BY document_id
+    ORDER BY score DESC
+    LIMIT :limit
+"""
 
 class BM25Calculator:
     """
-    SQL-based BM25 Calculator
-    Directly queries the inverted index (terms, postings) to calculate scores.
+    BM25 Calculator
+
+    Strategies:
+    - "maxscore": top-k over the in-process inverted index with Block-Max
+      MaxScore pruning (skips documents that cannot reach the top-k)
+    - "memory": exhaustive vectorized BM25 over the in-process inverted index
+    - "blocks": block-packed posting lists (posting_blocks) read in one query,
+      with block skipping; no in-process index needed
+    - "impact": quantized impact-ordered postings (impact_postings), integer
+      accumulation with early termination
+    - "sql": queries the database inverted index (terms, postings) directly
     """
-    def __init__(self, k1=1.5, b=0.75):
+    STRATEGIES = ("maxscore", "memory", "blocks", "impact", "sql")
+
+    def __init__(self, k1=1.5, b=0.75, strategy: Optional[str] = None):
         self.k1 = k1
         self.b = b
+        self.strategy = strategy or settings.BM25_STRATEGY
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown BM25 strategy: {self.strategy}")
         self.tokenizer = get_tokenizer_service()
+        self.index = get_inverted_index()
+        self.doc_stats = get_doc_stats_service()
+        self.block_store = get_posting_block_store()
+        self.impact_index = get_impact_index()
 
-    async def search(self, query: str, session: AsyncSession, top_k: int = 10) -> List[Dict[str, Any]]:
+    async def search(
+        self,
+        query: str,
+        session: AsyncSession,
+        top_k: int = 10,
+        strategy: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Perform BM25 search using database-resident inverted index
+        Perform BM25 search
+
+        Falls back to the SQL strategy while the in-memory index is not loaded.
         """
         # 1. Tokenize query
         tokens = self.tokenizer.tokenize(query, mode="search")
         if not tokens:
             return []
 
+        strategy = strategy or self.strategy
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown BM25 strategy: {strategy}")
+        if strategy == "blocks":
+            return await self._search_blocks(tokens, session, top_k)
+        if strategy == "impact":
+            return await self._search_impact(tokens, session, top_k)
+        if strategy != "sql" and self.index.loaded:
+            return self._search_memory(tokens, top_k, pruned=(strategy == "maxscore"))
+        return await self._search_sql(tokens, session, top_k)
+
+    def _search_memory(self, tokens: List[str], top_k: int, pruned: bool = True) -> List[Dict[str, Any]]:
+        """Score against the in-process inverted index (no DB round trip)"""
+        if pruned:
+            results = self.index.search_bm25_maxscore(tokens, top_k, k1=self.k1, b=self.b)
+        else:
+            results = self.index.search_bm25(tokens, top_k, k1=self.k1, b=self.b)
+        return [
+            {"document_id": doc_id, "score": score}
+            for doc_id, score in results
+        ]
+
+    async def _search_blocks(self, tokens: List[str], session: AsyncSession, top_k: int) -> List[Dict[str, Any]]:
+        """Score against posting_blocks (see PostingBlockStore.search_bm25)"""
+        total_docs, avg_doc_length = await self.doc_stats.get(session)
+        try:
+            results = await self.block_store.search_bm25(
+                tokens, session, top_k, total_docs, avg_doc_length, k1=self.k1, b=self.b
+            )
+        except Exception as e:
+            print(f"BM25 block search error: {e}")
+            return []
+        return [
+            {"document_id": doc_id, "score": score}
+            for doc_id, score in results
+        ]
+
+    async def _search_impact(self, tokens: List[str], session: AsyncSession, top_k: int) -> List[Dict[str, Any]]:
+        """Score against impact_postings (scores use the index's build statistics)"""
+        try:
+            results = await self.impact_index.search(tokens, session, top_k)
+        except Exception as e:
+            print(f"BM25 impact search error: {e}")
+            return []
+        return [
+            {"document_id": doc_id, "score": score}
+            for doc_id, score in results
+        ]
+
+    async def _search_sql(self, tokens: List[str], session: AsyncSession, top_k: int) -> List[Dict[str, Any]]:
+        """Perform BM25 search using database-resident inverted index"""
         # Dedup tokens for SQL query (we handle query term frequency if needed, but standard BM25 usually treats query as set or boosts weights)
         # Simple implementation: set of terms
         token_list = list(set(tokens)) 
 
-        # 2. Get global stats
-        # Ensure we have stats; if not, return empty (index might be empty)
-        stats_res = await session.execute(text("SELECT total_docs, avg_doc_length FROM doc_stats WHERE id=1"))
-        stats = stats_res.first()
-        
-        if not stats:
-            # Maybe stats haven't been calculated yet?
-            return []
-        
-        total_docs, avg_doc_length = stats
+        # 2. Get global stats (cached in process, see DocStatsService)
+        total_docs, avg_doc_length = await self.doc_stats.get(session)
         if total_docs == 0 or avg_doc_length == 0:
             return []
 
         try:
             # 3. Calculate BM25 in SQL
-            # Formula: IDF * ((TF * (k1 + 1)) / (TF + k1 * (1 - b + b * DL / AVGDL)))
-            # IDF = ln( (N - n + 0.5) / (n + 0.5) + 1 )
-            
-            sql = text("""
-            WITH q_terms AS (
-                SELECT id, doc_frequency 
-                FROM terms 
-                WHERE term = ANY(:tokens)
-            ),
-            doc_matches AS (
-                SELECT 
-                    p.document_id,
-                    t.doc_frequency,
-                    p.term_frequency,
-                    d.doc_length
-                FROM postings p
-                JOIN q_terms t ON p.term_id = t.id
-                JOIN documents d ON p.document_id = d.id
-            )
-            SELECT 
-                document_id,
-                SUM(
-                    LN( (:total_docs - doc_frequency + 0.5) / (doc_frequency + 0.5) + 1 ) *
-                    ( (term_frequency * (:k1 + 1)) / (term_frequency + :k1 * (1 - :b + :b * (doc_length / :avg_doc_length))) )
-                ) as score
-            FROM doc_matches
-            GROUP BY document_id
-            ORDER BY score DESC
-            LIMIT :limit
-            """)
+            sql = text(BM25_SQL)
             
             result = await session.execute(sql, {
                 "tokens": token_list,
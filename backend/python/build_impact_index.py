@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Impact 索引构建脚本（impact_postings 全量重建）
+
+用途：
+- 用当前 doc_stats（先精确重算）量化所有 posting 的 BM25 impact（见 impact_index.py）
+- avg_doc_length 相对构建时的漂移超过 IMPACT_REBUILD_DRIFT 时才重建（--force 强制）
+
+使用方式：
+    python build_impact_index.py            # 未构建或漂移超过阈值时重建
+    python build_impact_index.py --check    # 只输出漂移
+    python build_impact_index.py --force
+    定时任务: */30 * * * * cd /path/to/backend/python && python3 build_impact_index.py
+
+之后设置 IMPACT_INDEX_ENABLED=true（写入时登记变化的 term，由 API 进程按
+构建时的统计重新量化）并可使用 BM25_STRATEGY=impact
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from sqlalchemy import text
+from config import settings
+from database import AsyncSessionLocal, init_db
+from doc_stats_service import get_doc_stats_service
+from impact_index import get_impact_index
+
+
+async def rebuild(terms_per_batch: int) -> int:
+    """记录新的构建统计后按 term id 分批重新量化"""
+    index = get_impact_index()
+    async with AsyncSessionLocal() as session:
+        stats = await get_doc_stats_service().reconcile(session)
+        total_docs, total_length = stats["total_docs"], stats["total_length"]
+        if total_docs == 0:
+            print("⚠ 没有已索引的文档")
+            return 0
+        meta = await index.start_build(session, total_docs, total_length / total_docs)
+        await session.commit()
+    print(
+        f"📐 N={meta['total_docs']}, avgdl={meta['avg_doc_length']:.1f}, "
+        f"scale={meta['scale']:.3f} (impact 255)"
+    )
+
+    quantized = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT id FROM terms WHERE id > :last_id ORDER BY id LIMIT :limit
+            """), {"last_id": last_id, "limit": terms_per_batch})
+            term_ids = [row.id for row in result]
+            if not term_ids:
+                break
+            last_id = term_ids[-1]
+            quantized += await index.rebuild_terms(session, term_ids)
+            await session.commit()
+        print(f"  已量化到 term ID {last_id}，共 {quantized} 个 posting")
+    return quantized
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild the quantized impact-ordered index")
+    parser.add_argument("--terms-per-batch", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=settings.IMPACT_REBUILD_DRIFT,
+                        help="Relative avg_doc_length drift that triggers a rebuild")
+    parser.add_argument("--check", action="store_true", help="Only report the drift")
+    parser.add_argument("--force", action="store_true", help="Rebuild regardless of drift")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Impact 索引构建")
+    print("=" * 60)
+
+    try:
+        await init_db()
+        async with AsyncSessionLocal() as session:
+            await get_doc_stats_service().refresh(session)
+            drift = await get_impact_index().drift(session, get_doc_stats_service().avg_doc_length)
+
+        if drift is None:
+            print("📊 impact 索引尚未构建")
+        else:
+            print(f"📊 avg_doc_length 漂移: {drift:.1%}（阈值 {args.threshold:.1%}）")
+        if args.check:
+            return
+        if not args.force and drift is not None and drift <= args.threshold:
+            print("✅ 漂移未超过阈值，无需重建")
+            return
+
+        start = time.time()
+        quantized = await rebuild(args.terms_per_batch)
+        print()
+        print(f"✅ 完成: {quantized} 个 posting，用时 {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"❌ 构建失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Posting 块打包脚本（posting_blocks 全量重建）
+
+用途：
+- 从 postings 表按 term 重新打包 posting_blocks（见 posting_blocks.py）
+- 输出 postings 与 posting_blocks 的大小对比
+
+使用方式：
+    python build_posting_blocks.py
+    python build_posting_blocks.py --terms-per-batch 2000
+
+之后设置 POSTING_BLOCKS_ENABLED=true（写入时登记变化的 term，由 API 进程
+后台重新打包）并可使用 BM25_STRATEGY=blocks
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from sqlalchemy import text
+from database import AsyncSessionLocal, init_db
+from posting_blocks import get_posting_block_store
+
+
+async def report_sizes():
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(text("""
+            SELECT
+                pg_size_pretty(pg_total_relation_size('postings')) AS postings_size,
+                pg_size_pretty(pg_total_relation_size('posting_blocks')) AS blocks_size,
+                (SELECT COUNT(*) FROM posting_blocks) AS block_rows,
+                (SELECT COUNT(DISTINCT term_id) FROM posting_blocks) AS terms
+        """))
+        row = result.first()
+        print(
+            f"📊 postings {row.postings_size} | posting_blocks {row.blocks_size} "
+            f"({row.block_rows} 行, {row.terms} 个 term)"
+        )
+
+
+async def rebuild(terms_per_batch: int) -> int:
+    """按 term id 分批重建，已登记的待打包 term 一并清空"""
+    store = get_posting_block_store()
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("DELETE FROM posting_blocks_dirty"))
+        await session.commit()
+
+    packed = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT id FROM terms WHERE id > :last_id ORDER BY id LIMIT :limit
+            """), {"last_id": last_id, "limit": terms_per_batch})
+            term_ids = [row.id for row in result]
+            if not term_ids:
+                break
+            last_id = term_ids[-1]
+            packed += await store.rebuild_terms(session, term_ids)
+            await session.commit()
+        print(f"  已打包到 term ID {last_id}，共 {packed} 个 posting")
+
+    return packed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild the block-packed posting lists")
+    parser.add_argument("--terms-per-batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Posting 块打包（全量重建）")
+    print("=" * 60)
+
+    try:
+        await init_db()
+        start = time.time()
+        packed = await rebuild(args.terms_per_batch)
+        await report_sizes()
+        print()
+        print(f"✅ 完成: {packed} 个 posting，用时 {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"❌ 打包失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
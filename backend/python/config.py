@@ -9,10 +9,62 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "sentence-transformers/clip-ViT-B-32"
     EMBEDDING_DIM: int = 512
     
+    # Query embedding micro-batching
+    EMBEDDING_BATCH_SIZE: int = 32  # Max requests per forward pass
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0  # Window for collecting concurrent requests
+    EMBEDDING_QUEUE_SIZE: int = 1024  # Bounded queue; callers wait when full
+    
+    # Query embedding cache (in-process LRU + Redis)
+    EMBEDDING_CACHE_SIZE: int = 10000  # Max vectors in the in-process LRU
+    EMBEDDING_CACHE_DTYPE: str = "float16"  # "float16" or "float32"
+    EMBEDDING_CACHE_TTL: int = 86400  # Redis TTL in seconds
+    
+    # Bulk indexing
+    INDEX_TOKENIZE_WORKERS: int = 4  # Worker processes for batch tokenization (1 = in-process, capped at CPU count)
+    INDEX_BATCH_SIZE: int = 64  # Documents per batch for bulk indexing scripts
+    TERM_DICTIONARY_SIZE: int = 500000  # Max cached term -> id entries per process
+    DOC_STATS_CACHE_TTL: int = 30  # Seconds before the in-process doc_stats copy is re-read
+    DOC_STATS_RECONCILE_INTERVAL: int = 600  # Seconds between exact recounts of doc_stats
+    ORPHAN_TERM_CLEANUP_INTERVAL: int = 3600  # Seconds between removals of terms without postings
+    
+    # Asynchronous ingestion (Redis Stream), see ingest_queue.py
+    INGEST_MODE: str = "sync"  # "sync" (index inside the request) or "async" (enqueue, return 202)
+    INGEST_WORKERS: int = 2  # Indexer workers run by each API process (0 = only ingest_worker.py)
+    INGEST_BATCH_SIZE: int = 32  # Stream entries indexed per transaction
+    INGEST_BLOCK_MS: int = 2000  # XREADGROUP block timeout
+    INGEST_CLAIM_IDLE_MS: int = 300000  # Entries pending this long (crashed worker) are re-claimed
+    INGEST_MAX_DELIVERIES: int = 3  # Deliveries before an entry is recorded as failed
+    INGEST_STATUS_TTL: int = 86400  # Seconds per-ingestion status is kept
+    
+    # Near-duplicate detection at ingest time, see simhash_index.py
+    SIMHASH_ENABLED: bool = True  # Collapse near-duplicates onto a canonical document instead of indexing them
+    SIMHASH_MAX_DISTANCE: int = 3  # Max Hamming distance (bits of 64) between near-duplicate fingerprints
+    SIMHASH_MIN_LENGTH: int = 200  # Shorter normalized texts are never treated as duplicates
+    
     # Search parameters
     BM25_WEIGHT: float = 0.4
     VECTOR_WEIGHT: float = 0.6
     TOP_K_RESULTS: int = 20
+    VECTOR_SEARCH_TIMEOUT: float = 2.0  # Seconds, includes query embedding
+    BM25_SEARCH_TIMEOUT: float = 1.0  # Seconds
+    
+    # BM25 engine: "maxscore" (in-process index, top-k pruning), "memory" (in-process, exhaustive),
+    # "blocks" (block-packed postings in the database, block skipping), "impact" (quantized impact-ordered
+    # postings, integer accumulation) or "sql" (database CTE)
+    BM25_STRATEGY: str = "maxscore"
+    INVERTED_INDEX_SYNC_INTERVAL: int = 30  # Seconds between syncs with writes from other processes
+    INVERTED_INDEX_SYNC_LOOKBACK: int = 120  # Seconds of overlap to cover in-flight transactions
+    INVERTED_INDEX_FLUSH_DOCS: int = 1000  # Documents buffered in the memtable before it is sealed into a segment
+    INVERTED_INDEX_FLUSH_INTERVAL: int = 5  # Seconds between periodic memtable flushes / merge checks
+    INVERTED_INDEX_MERGE_FACTOR: int = 10  # Tiered merging: this many similar-size segments are merged at once
+    INVERTED_INDEX_MAX_DELETED_RATIO: float = 0.3  # Segments with a larger tombstoned share are rewritten
+    # Block-packed postings (posting_blocks), used by BM25_STRATEGY="blocks"; build with build_posting_blocks.py
+    POSTING_BLOCKS_ENABLED: bool = False  # Writers queue touched terms for repacking
+    POSTING_BLOCKS_REFRESH_INTERVAL: int = 30  # Seconds between repacks of queued terms
+    # Quantized impact-ordered postings (impact_postings), used by BM25_STRATEGY="impact"; build with build_impact_index.py
+    IMPACT_INDEX_ENABLED: bool = False  # Writers queue touched terms for re-quantization
+    IMPACT_REBUILD_DRIFT: float = 0.1  # Relative avg_doc_length drift that triggers a full rebuild
+    IMPACT_POSTINGS_BUDGET: int = 0  # Max postings scored per query (0 = stop only when the top-k is final)
     
     # Server
     HOST: str = "0.0.0.0"
@@ -38,6 +90,8 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: str = ""
     CACHE_TTL: int = 600  # Cache TTL in seconds (10 minutes)
     ENABLE_CACHE: bool = True
+    ENABLE_RESULT_CACHE: bool = True  # Fused search results, invalidated by index generation
+    RESULT_CACHE_TTL: int = 300
     
     class Config:
         env_file = ".env"
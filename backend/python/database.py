@@ -1,3 +1,7 @@
+import csv
+import io
+from typing import Iterable, List, Sequence
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from config import settings
@@ -17,10 +21,39 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# create_all 不会给已有表加列，已部署的库在启动时补齐
+SCHEMA_UPGRADES = [
+    "ALTER TABLE doc_stats ADD COLUMN IF NOT EXISTS total_length BIGINT DEFAULT 0",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    # 旧 posting 的 doc_length 和覆盖索引由 migrate_posting_doc_length.py 补齐
+    # （回填之前 BM25_SQL 对 doc_length 为 NULL 的 posting 回查 documents.doc_length）
+    "ALTER TABLE postings ADD COLUMN IF NOT EXISTS doc_length INTEGER",
+    # 已有文档的指纹由 migrate_simhash.py 回填，回填前它们不参与近似重复检测
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash BIGINT",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS duplicate_of INTEGER REFERENCES documents(id) ON DELETE SET NULL",
+    # 早期版本的外键是 ON DELETE CASCADE（删除规范文档会连带删除其近似重复文档），改为 SET NULL
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'documents_duplicate_of_fkey' AND confdeltype = 'c'
+        ) THEN
+            ALTER TABLE documents DROP CONSTRAINT documents_duplicate_of_fkey;
+            ALTER TABLE documents ADD CONSTRAINT documents_duplicate_of_fkey
+                FOREIGN KEY (duplicate_of) REFERENCES documents(id) ON DELETE SET NULL;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_documents_duplicate_of ON documents (duplicate_of)",
+]
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
 
 async def get_db():
     """Dependency for getting DB session"""
@@ -29,3 +62,31 @@ async def get_db():
             yield session
         finally:
             await session.close()
+
+
+async def copy_rows(
+    session: AsyncSession,
+    table: str,
+    columns: List[str],
+    rows: Iterable[Sequence]
+):
+    """
+    Bulk-load rows with COPY (CSV text format) inside the session's transaction
+    
+    Values are written in their text representation (e.g. '[0.1,0.2]' for
+    vector columns). Must run after another statement has started the
+    transaction on the session's connection.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    if buffer.tell() == 0:
+        return
+    
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_to_table(
+        table,
+        source=io.BytesIO(buffer.getvalue().encode("utf-8")),
+        columns=columns,
+        format="csv"
+    )
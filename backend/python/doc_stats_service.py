@@ -0,0 +1,197 @@
+"""
+Incrementally maintained corpus statistics (doc_stats)
+
+doc_stats row 1 keeps a running document count and token sum. Writers
+adjust it by their deltas inside their own transaction instead of
+re-aggregating the documents table, so ingest cost no longer grows with
+the corpus. A periodic reconciliation recomputes the exact values to
+correct any drift (e.g. rows changed by hand or by old code paths).
+
+Readers (BM25 SQL strategy) use an in-process copy refreshed every
+DOC_STATS_CACHE_TTL seconds; local commits update it immediately.
+"""
+import asyncio
+import time
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+
+# session.info key for deltas applied by the current transaction
+PENDING_KEY = "doc_stats_pending"
+
+
+class DocStatsService:
+    """Running sum/count corpus statistics with an in-process cache"""
+
+    def __init__(self):
+        self.total_docs = 0
+        self.total_length = 0
+        self._loaded_at: Optional[float] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self.last_drift: Optional[Dict[str, int]] = None
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.total_docs if self.total_docs > 0 else 0.0
+
+    async def apply_delta(self, session: AsyncSession, doc_delta: int, length_delta: int):
+        """
+        Adjust the running totals inside the caller's transaction
+
+        Args:
+            doc_delta: Change in the number of documents with doc_length > 0
+            length_delta: Change in the sum of doc_length
+        """
+        if doc_delta == 0 and length_delta == 0:
+            return
+        update_query = text("""
+            UPDATE doc_stats
+            SET total_docs = total_docs + :doc_delta,
+                total_length = total_length + :length_delta,
+                avg_doc_length = COALESCE(
+                    CAST(total_length + :length_delta AS float) / NULLIF(total_docs + :doc_delta, 0), 0
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+        """)
+        params = {"doc_delta": doc_delta, "length_delta": length_delta}
+        result = await session.execute(update_query, params)
+        if result.rowcount == 0:
+            await self._ensure_row(session)
+            await session.execute(update_query, params)
+
+        pending = session.info.setdefault(PENDING_KEY, [0, 0])
+        pending[0] += doc_delta
+        pending[1] += length_delta
+
+    @staticmethod
+    async def _ensure_row(session: AsyncSession):
+        await session.execute(text("""
+            INSERT INTO doc_stats (id, total_docs, total_length, avg_doc_length)
+            VALUES (1, 0, 0, 0)
+            ON CONFLICT (id) DO NOTHING
+        """))
+
+    def _apply_committed(self, doc_delta: int, length_delta: int):
+        if self._loaded_at is not None:
+            self.total_docs += doc_delta
+            self.total_length += length_delta
+
+    async def get(self, session: AsyncSession) -> Tuple[int, float]:
+        """(total_docs, avg_doc_length) from memory, refreshed after DOC_STATS_CACHE_TTL"""
+        if self._loaded_at is None or time.time() - self._loaded_at > settings.DOC_STATS_CACHE_TTL:
+            await self.refresh(session)
+        return self.total_docs, self.avg_doc_length
+
+    async def refresh(self, session: AsyncSession):
+        """Reload the cached totals from doc_stats"""
+        result = await session.execute(
+            text("SELECT total_docs, total_length FROM doc_stats WHERE id = 1")
+        )
+        row = result.first()
+        self.total_docs = int(row.total_docs or 0) if row else 0
+        self.total_length = int(row.total_length or 0) if row else 0
+        self._loaded_at = time.time()
+
+    async def reconcile(self, session: AsyncSession) -> Dict[str, int]:
+        """
+        Recompute exact totals from the documents table and correct drift
+
+        The doc_stats row is locked first, so writers that committed before
+        the lock are included in the recount and writers that commit after
+        it apply their deltas on top of the corrected values.
+
+        Returns:
+            {"total_docs", "total_length", "doc_drift", "length_drift"}
+        """
+        await self._ensure_row(session)
+        current = (await session.execute(
+            text("SELECT total_docs, total_length FROM doc_stats WHERE id = 1 FOR UPDATE")
+        )).first()
+
+        exact = (await session.execute(text("""
+            SELECT COUNT(*) AS total_docs, COALESCE(SUM(doc_length), 0) AS total_length
+            FROM documents
+            WHERE doc_length > 0
+        """))).first()
+        total_docs, total_length = int(exact.total_docs), int(exact.total_length)
+
+        await session.execute(text("""
+            UPDATE doc_stats
+            SET total_docs = :total_docs,
+                total_length = :total_length,
+                avg_doc_length = :avg_doc_length,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+        """), {
+            "total_docs": total_docs,
+            "total_length": total_length,
+            "avg_doc_length": total_length / total_docs if total_docs else 0.0
+        })
+        await session.commit()
+
+        self.total_docs, self.total_length = total_docs, total_length
+        self._loaded_at = time.time()
+        self.last_drift = {
+            "total_docs": total_docs,
+            "total_length": total_length,
+            "doc_drift": total_docs - int(current.total_docs or 0),
+            "length_drift": total_length - int(current.total_length or 0),
+        }
+        if self.last_drift["doc_drift"] or self.last_drift["length_drift"]:
+            print(
+                f"⚠ doc_stats drift corrected: docs {self.last_drift['doc_drift']:+d}, "
+                f"tokens {self.last_drift['length_drift']:+d}"
+            )
+        return self.last_drift
+
+    def start_reconcile(self, session_factory, interval: Optional[int] = None):
+        """Start the periodic background reconciliation task"""
+        interval = interval or settings.DOC_STATS_RECONCILE_INTERVAL
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    async with session_factory() as session:
+                        await self.reconcile(session)
+                except Exception as e:
+                    print(f"⚠ doc_stats reconciliation failed: {e}")
+
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(_loop())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cached totals and the last reconciliation result"""
+        return {
+            "total_docs": self.total_docs,
+            "total_length": self.total_length,
+            "avg_doc_length": self.avg_doc_length,
+            "loaded_at": self._loaded_at,
+            "last_reconcile": self.last_drift,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        get_doc_stats_service()._apply_committed(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Global doc stats service instance
+doc_stats_service = None
+
+def get_doc_stats_service() -> DocStatsService:
+    """Get or create doc stats service singleton"""
+    global doc_stats_service
+    if doc_stats_service is None:
+        doc_stats_service = DocStatsService()
+    return doc_stats_service
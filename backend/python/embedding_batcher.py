@@ -0,0 +1,145 @@
+"""
+Dynamic micro-batching executor for query embeddings
+
+Concurrent encode requests are queued, collected for a short window (or up
+to a maximum batch size) and encoded in a single batched forward pass on a
+worker thread, so model inference never blocks the asyncio event loop.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from embedding_service import get_embedding_service
+from config import settings
+
+
+class EmbeddingBatcher:
+    """Bounded-queue micro-batching executor for text embeddings"""
+
+    def __init__(
+        self,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_queue_size: Optional[int] = None
+    ):
+        self.embedding_service = get_embedding_service()
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_BATCH_WAIT_MS) / 1000
+        self.max_queue_size = max_queue_size or settings.EMBEDDING_QUEUE_SIZE
+
+        # 单线程执行模型推理，批次之间串行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self._requests = 0
+        self._batches = 0
+        self._max_batch_seen = 0
+        self._last_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_inference = 0.0
+        self._errors = 0
+
+    def _ensure_worker(self):
+        """Create the queue and worker on the running event loop"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.create_task(self._run())
+
+    async def encode_text(self, text: str) -> np.ndarray:
+        """
+        Encode one text; batched with other concurrent callers
+
+        Waits for queue space when the queue is full (backpressure).
+
+        Returns:
+            Normalized embedding vector
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        """Wait for one request, then gather more until the window closes or the batch is full"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        """Worker loop: one batched forward pass per collected batch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 丢弃调用方已取消（如超时）的请求
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                embeddings = await loop.run_in_executor(
+                    self._executor,
+                    self.embedding_service.encode_text,
+                    [text for text, _, _ in batch]
+                )
+            except Exception as e:
+                self._errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._total_inference += time.perf_counter() - start
+            for _, _, enqueued_at in batch:
+                wait = start - enqueued_at
+                self._total_wait += wait
+                self._max_wait_seen = max(self._max_wait_seen, wait)
+            self._requests += len(batch)
+            self._batches += 1
+            self._last_batch_size = len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+            for (_, future, _), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, batch size and wait-time metrics"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self._requests,
+            "batches": self._batches,
+            "errors": self._errors,
+            "avg_batch_size": self._requests / self._batches if self._batches else 0,
+            "last_batch_size": self._last_batch_size,
+            "max_batch_size_seen": self._max_batch_seen,
+            "avg_wait_ms": self._total_wait / self._requests * 1000 if self._requests else 0,
+            "max_wait_ms_seen": self._max_wait_seen * 1000,
+            "avg_inference_ms": self._total_inference / self._batches * 1000 if self._batches else 0,
+        }
+
+
+# Global embedding batcher instance
+embedding_batcher = None
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Get or create embedding batcher singleton"""
+    global embedding_batcher
+    if embedding_batcher is None:
+        embedding_batcher = EmbeddingBatcher()
+    return embedding_batcher
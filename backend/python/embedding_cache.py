@@ -0,0 +1,141 @@
+"""
+Two-tier cache for query embeddings
+
+- L1: bounded in-process LRU holding compact float16/float32 vectors
+- L2: Redis, shared by every API worker, holding raw binary blobs
+
+Keys are namespaced by settings.EMBEDDING_MODEL, so switching the model
+invalidates every cached vector automatically.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Dict, Any
+import numpy as np
+import redis
+from config import settings
+
+
+class EmbeddingCache:
+    """LRU + Redis cache for query embeddings"""
+
+    def __init__(self):
+        self.dtype = np.dtype(settings.EMBEDDING_CACHE_DTYPE)
+        self.max_entries = settings.EMBEDDING_CACHE_SIZE
+        self.ttl = settings.EMBEDDING_CACHE_TTL
+        self.namespace = f"verdant:emb:{settings.EMBEDDING_MODEL}"
+
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = Lock()
+
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+        self.redis_client = None
+        if settings.ENABLE_CACHE:
+            try:
+                self.redis_client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                    decode_responses=False,  # 向量以二进制存储
+                    socket_connect_timeout=1,
+                    socket_timeout=0.2
+                )
+                self.redis_client.ping()
+            except Exception as e:
+                print(f"⚠ Embedding cache: Redis unavailable ({e}), using in-process LRU only")
+                self.redis_client = None
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize a query (CLIP's tokenizer lowercases and collapses whitespace anyway)"""
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def _key(self, query: str, kind: str) -> str:
+        if kind == "text":
+            query = self.normalize(query)
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{kind}:{digest}"
+
+    def get(self, query: str, kind: str = "text") -> Optional[np.ndarray]:
+        """
+        Look up a cached embedding
+
+        Args:
+            query: Query text (or base64 image data for kind="image")
+            kind: "text" or "image"
+
+        Returns:
+            float32 embedding, or None on miss
+        """
+        key = self._key(query, kind)
+
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.l1_hits += 1
+                return vector.astype(np.float32)
+
+        if self.redis_client is not None:
+            try:
+                blob = self.redis_client.get(key)
+                if blob:
+                    vector = np.frombuffer(blob, dtype=self.dtype)
+                    self._put_local(key, vector)
+                    self.l2_hits += 1
+                    return vector.astype(np.float32)
+            except Exception as e:
+                print(f"Embedding cache get error: {e}")
+
+        self.misses += 1
+        return None
+
+    def set(self, query: str, embedding: np.ndarray, kind: str = "text"):
+        """Store an embedding in both tiers"""
+        key = self._key(query, kind)
+        vector = np.asarray(embedding, dtype=self.dtype)
+        self._put_local(key, vector)
+
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(key, self.ttl, vector.tobytes())
+            except Exception as e:
+                print(f"Embedding cache set error: {e}")
+
+    def _put_local(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters"""
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "dtype": self.dtype.name,
+            "l1_entries": len(self._lru),
+            "l1_max_entries": self.max_entries,
+            "l1_hits": self.l1_hits,
+            "l2_enabled": self.redis_client is not None,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "hit_rate": (self.l1_hits + self.l2_hits) / lookups if lookups else 0,
+        }
+
+
+# Global embedding cache instance
+embedding_cache = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get or create embedding cache singleton"""
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache()
+    return embedding_cache
@@ -1,6 +1,6 @@
 import torch
 from sentence_transformers import SentenceTransformer
-from typing import List, Union
+from typing import List, Optional, Union
 import numpy as np
 from config import settings
 
@@ -46,6 +46,42 @@ class EmbeddingService:
         image = Image.open(BytesIO(image_data))
         return self._encode_image_object(image)
 
+    def encode_images_base64(self, base64_strings: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Encode several base64 images in one batched forward pass
+        
+        Returns:
+            One embedding per input, None where the image could not be decoded
+        """
+        import base64
+        from io import BytesIO
+        from PIL import Image
+        
+        images, positions = [], []
+        for i, base64_string in enumerate(base64_strings):
+            if "," in base64_string:
+                base64_string = base64_string.split(",")[1]
+            try:
+                image = Image.open(BytesIO(base64.b64decode(base64_string)))
+                image.load()
+            except Exception as e:
+                print(f"Failed to decode image {i}: {e}")
+                continue
+            images.append(image)
+            positions.append(i)
+        
+        results: List[Optional[np.ndarray]] = [None] * len(base64_strings)
+        if images:
+            embeddings = self.model.encode(
+                images,
+                convert_to_tensor=False,
+                show_progress_bar=False,
+                normalize_embeddings=True
+            )
+            for i, embedding in zip(positions, embeddings):
+                results[i] = embedding
+        return results
+
     def _encode_image_object(self, image) -> np.ndarray:
         """Internal helper to encode PIL Image object"""
         embedding = self.model.encode(
@@ -0,0 +1,166 @@
+"""
+Content-addressed image store
+
+Images are stored once in the image_store table keyed by the SHA-256 of
+their bytes. Documents only keep references ({url, hash, alt_text, width,
+height}), and API responses point at /api/images/{hash} instead of carrying
+base64 payloads.
+"""
+import base64
+import hashlib
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Thumbnail variants: name -> max width in pixels
+IMAGE_VARIANTS = {
+    "thumb": 200,
+    "medium": 480,
+}
+
+
+class ImageStore:
+    """SHA-256 keyed image storage with cached resized variants"""
+
+    def __init__(self, max_cached_variants: int = 512):
+        self._variants: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._max_cached_variants = max_cached_variants
+        self._lock = Lock()
+
+    @staticmethod
+    def decode_base64(base64_string: str) -> bytes:
+        """Decode base64 image data (strips a data: URL header if present)"""
+        if "," in base64_string:
+            base64_string = base64_string.split(",")[1]
+        return base64.b64decode(base64_string)
+
+    def hash_of(self, img: Dict) -> Optional[str]:
+        """SHA-256 of an image entry (inline data or an existing reference)"""
+        base64_data = img.get("base64_data")
+        if base64_data:
+            return hashlib.sha256(self.decode_base64(base64_data)).hexdigest()
+        return img.get("hash")
+
+    @staticmethod
+    def url_for(image_hash: str) -> str:
+        """API path serving an image"""
+        return f"/api/images/{image_hash}"
+
+    async def put(self, data: bytes, session: AsyncSession) -> str:
+        """Store image bytes once; returns the SHA-256 hash"""
+        from PIL import Image
+
+        image_hash = hashlib.sha256(data).hexdigest()
+        mime_type, width, height = "image/jpeg", None, None
+        try:
+            image = Image.open(BytesIO(data))
+            mime_type = Image.MIME.get(image.format, mime_type)
+            width, height = image.size
+        except Exception:
+            pass
+
+        await session.execute(text("""
+            INSERT INTO image_store (hash, mime_type, width, height, size_bytes, data)
+            VALUES (:hash, :mime_type, :width, :height, :size_bytes, :data)
+            ON CONFLICT (hash) DO NOTHING
+        """), {
+            "hash": image_hash,
+            "mime_type": mime_type,
+            "width": width,
+            "height": height,
+            "size_bytes": len(data),
+            "data": data
+        })
+        return image_hash
+
+    async def store_images(self, images: Optional[List[Dict]], session: AsyncSession) -> Optional[List[Dict]]:
+        """
+        Move inline base64 images into the store
+
+        Returns:
+            Image references [{url, hash, alt_text, width, height}]
+            (entries without base64 data are kept as-is)
+        """
+        if not images:
+            return images
+
+        refs = []
+        for img in images:
+            base64_data = img.get("base64_data")
+            if not base64_data:
+                refs.append(img)
+                continue
+            image_hash = await self.put(self.decode_base64(base64_data), session)
+            refs.append({
+                "url": img.get("url"),
+                "hash": image_hash,
+                "alt_text": img.get("alt_text"),
+                "width": img.get("width"),
+                "height": img.get("height")
+            })
+        return refs
+
+    async def get(self, image_hash: str, session: AsyncSession) -> Optional[Tuple[bytes, str]]:
+        """Get (data, mime_type) by hash"""
+        result = await session.execute(
+            text("SELECT data, mime_type FROM image_store WHERE hash = :hash"),
+            {"hash": image_hash}
+        )
+        row = result.first()
+        if not row:
+            return None
+        return bytes(row.data), row.mime_type
+
+    async def get_many_base64(self, hashes: List[str], session: AsyncSession) -> Dict[str, str]:
+        """Load several images as base64 in one query (for multimodal LLM context)"""
+        if not hashes:
+            return {}
+        result = await session.execute(
+            text("SELECT hash, data FROM image_store WHERE hash = ANY(:hashes)"),
+            {"hashes": list(hashes)}
+        )
+        return {row.hash: base64.b64encode(bytes(row.data)).decode("utf-8") for row in result}
+
+    def render_variant(self, image_hash: str, data: bytes, variant: str) -> bytes:
+        """Resize to a named variant (JPEG), cached in process"""
+        from PIL import Image
+
+        key = (image_hash, variant)
+        with self._lock:
+            cached = self._variants.get(key)
+            if cached is not None:
+                self._variants.move_to_end(key)
+                return cached
+
+        max_width = IMAGE_VARIANTS[variant]
+        image = Image.open(BytesIO(data))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if image.width > max_width:
+            image = image.resize(
+                (max_width, max(1, int(image.height * max_width / image.width))),
+                Image.Resampling.LANCZOS
+            )
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=80, optimize=True)
+        rendered = buffered.getvalue()
+
+        with self._lock:
+            self._variants[key] = rendered
+            while len(self._variants) > self._max_cached_variants:
+                self._variants.popitem(last=False)
+        return rendered
+
+
+# Global image store instance
+image_store = None
+
+def get_image_store() -> ImageStore:
+    """Get or create image store singleton"""
+    global image_store
+    if image_store is None:
+        image_store = ImageStore()
+    return image_store
@@ -0,0 +1,334 @@
+"""
+Impact-ordered, quantized BM25 index (impact_postings)
+
+Optional index build mode: every posting's BM25 contribution is computed
+once with the corpus statistics of the build (impact_index_meta) and
+quantized to 8 bits (1..255) against the largest score in the corpus. Each
+term stores one row per impact value with the doc ids that have it
+(delta varints, see positions_codec), so a query reads its terms' rows
+highest impact first and scoring is integer accumulation:
+
+    score(doc) ~= sum(impact) * scale / 255
+
+Evaluation stops as soon as the remaining impacts can no longer change
+which documents are in the top-k. Returned scores are the accumulated
+impacts at that point (exact when every segment was processed).
+
+The build statistics are frozen: terms changed by writers are
+re-quantized with them (through the posting_blocks_dirty queue, see
+PostingBlockStore.refresh_dirty), and build_impact_index.py rebuilds
+everything when avg_doc_length drifts past IMPACT_REBUILD_DRIFT.
+"""
+import time
+from typing import Dict, List, Optional, Tuple, Any
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import copy_rows
+from inverted_index import InvertedIndex
+import positions_codec
+
+# 8-bit impacts
+IMPACT_LEVELS = 255
+
+
+class ImpactIndex:
+    """Builds and queries impact-ordered posting segments"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.meta: Optional[Dict[str, Any]] = None
+        self._meta_loaded_at: Optional[float] = None
+        self.last_search: Optional[Dict[str, Any]] = None
+
+    # ------------------------------------------------------------------
+    # Build statistics
+    # ------------------------------------------------------------------
+
+    async def load_meta(self, session: AsyncSession, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Build statistics (cached in process for DOC_STATS_CACHE_TTL seconds)"""
+        max_age = settings.DOC_STATS_CACHE_TTL if max_age is None else max_age
+        if self._meta_loaded_at is None or time.time() - self._meta_loaded_at > max_age:
+            row = (await session.execute(text("""
+                SELECT total_docs, avg_doc_length, k1, b, scale, built_at
+                FROM impact_index_meta WHERE id = 1
+            """))).first()
+            self.meta = dict(row._mapping) if row else None
+            self._meta_loaded_at = time.time()
+        return self.meta
+
+    async def start_build(self, session: AsyncSession, total_docs: int, avg_doc_length: float) -> Dict[str, Any]:
+        """
+        Record new build statistics and the quantization scale (caller commits)
+
+        The scale is the largest BM25 contribution of any posting under the
+        new statistics, so the strongest posting maps to impact 255.
+        """
+        scale = (await session.execute(text("""
+            WITH df AS (
+                SELECT p.term_id, COUNT(*) AS df
+                FROM postings p
+                JOIN documents d ON d.id = p.document_id
+                WHERE d.doc_length > 0
+                GROUP BY p.term_id
+            )
+            SELECT MAX(
+                LN((:total_docs - df.df + 0.5) / (df.df + 0.5) + 1) *
+                (p.term_frequency * (:k1 + 1)) /
+                (p.term_frequency + :k1 * (1 - :b + :b * d.doc_length / :avg_doc_length))
+            )
+            FROM postings p
+            JOIN df ON df.term_id = p.term_id
+            JOIN documents d ON d.id = p.document_id
+            WHERE d.doc_length > 0
+        """), {
+            "total_docs": total_docs,
+            "avg_doc_length": float(avg_doc_length),
+            "k1": self.k1,
+            "b": self.b,
+        })).scalar()
+
+        meta = {
+            "total_docs": total_docs,
+            "avg_doc_length": float(avg_doc_length),
+            "k1": self.k1,
+            "b": self.b,
+            "scale": float(scale or 1.0),
+        }
+        await session.execute(text("""
+            INSERT INTO impact_index_meta (id, total_docs, avg_doc_length, k1, b, scale, built_at)
+            VALUES (1, :total_docs, :avg_doc_length, :k1, :b, :scale, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                total_docs = EXCLUDED.total_docs,
+                avg_doc_length = EXCLUDED.avg_doc_length,
+                k1 = EXCLUDED.k1,
+                b = EXCLUDED.b,
+                scale = EXCLUDED.scale,
+                built_at = EXCLUDED.built_at
+        """), meta)
+        self.meta = meta
+        self._meta_loaded_at = time.time()
+        return meta
+
+    async def drift(self, session: AsyncSession, current_avg_doc_length: float) -> Optional[float]:
+        """Relative avg_doc_length drift since the build (None if never built)"""
+        meta = await self.load_meta(session, max_age=0)
+        if not meta or not meta["avg_doc_length"]:
+            return None
+        return abs(current_avg_doc_length - meta["avg_doc_length"]) / meta["avg_doc_length"]
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def quantize(
+        tf: np.ndarray,
+        dl: np.ndarray,
+        df: np.ndarray,
+        meta: Dict[str, Any]
+    ) -> np.ndarray:
+        """BM25 contributions quantized to 1..IMPACT_LEVELS with the build statistics"""
+        k1, b = meta["k1"], meta["b"]
+        idf = np.log((meta["total_docs"] - df + 0.5) / (df + 0.5) + 1.0)
+        tf = tf.astype(np.float64)
+        scores = idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * dl / meta["avg_doc_length"]))
+        return np.clip(np.rint(scores * IMPACT_LEVELS / meta["scale"]), 1, IMPACT_LEVELS).astype(np.int64)
+
+    async def rebuild_terms(self, session: AsyncSession, term_ids: List[int]) -> int:
+        """
+        Re-quantize the given terms with the current build statistics (caller commits)
+
+        Returns the number of postings written (0 if the index was never built).
+        """
+        meta = await self.load_meta(session)
+        if not term_ids or not meta:
+            return 0
+        await session.execute(text("SELECT pg_advisory_xact_lock(hashtext('impact_postings'))"))
+        result = await session.execute(text("""
+            SELECT p.term_id, p.document_id, p.term_frequency, d.doc_length
+            FROM postings p
+            JOIN documents d ON d.id = p.document_id
+            WHERE p.term_id = ANY(:term_ids) AND d.doc_length > 0
+            ORDER BY p.term_id, p.document_id
+        """), {"term_ids": list(term_ids)})
+        rows = np.array([tuple(row) for row in result], dtype=np.int64).reshape(-1, 4)
+
+        await session.execute(
+            text("DELETE FROM impact_postings WHERE term_id = ANY(:term_ids)"),
+            {"term_ids": list(term_ids)}
+        )
+        if len(rows) == 0:
+            return 0
+
+        # 按 term 计算 df 后统一量化
+        bounds = np.flatnonzero(np.diff(rows[:, 0])) + 1
+        sizes = np.diff(np.concatenate(([0], bounds, [len(rows)])))
+        impacts = self.quantize(rows[:, 2], rows[:, 3], np.repeat(sizes, sizes), meta)
+
+        # 每个 (term, impact) 一行，行内文档ID升序
+        order = np.lexsort((rows[:, 1], -impacts, rows[:, 0]))
+        term_col, doc_col, impacts = rows[order, 0], rows[order, 1], impacts[order]
+        splits = np.flatnonzero((np.diff(term_col) != 0) | (np.diff(impacts) != 0)) + 1
+        segments = []
+        for start, end in zip(np.concatenate(([0], splits)), np.concatenate((splits, [len(order)]))):
+            docs = doc_col[start:end]
+            segments.append((
+                int(term_col[start]), int(impacts[start]), len(docs), int(docs[-1]),
+                "\\x" + positions_codec.encode_varints(np.diff(docs, prepend=0)).hex()
+            ))
+        await copy_rows(
+            session,
+            "impact_postings",
+            ["term_id", "impact", "doc_count", "last_doc", "doc_ids"],
+            segments
+        )
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    async def search(self, tokens: List[str], session: AsyncSession, top_k: int) -> List[Tuple[int, float]]:
+        """
+        Score-at-a-time top-k over impact segments (one query)
+
+        Segments are processed by decreasing impact; after each impact level
+        the search stops once the (k+1)-th accumulated score plus the
+        largest possible remaining contribution cannot reach the k-th.
+        """
+        meta = await self.load_meta(session)
+        if not meta or top_k <= 0:
+            return []
+        result = await session.execute(text("""
+            SELECT i.term_id, i.impact, i.doc_count, i.last_doc, i.doc_ids
+            FROM terms t
+            JOIN impact_postings i ON i.term_id = t.id
+            WHERE t.term = ANY(:tokens)
+            ORDER BY i.impact DESC, i.term_id
+        """), {"tokens": list(set(tokens))})
+        segments = [(row.term_id, row.impact, row.doc_count, row.last_doc, bytes(row.doc_ids)) for row in result]
+        return self.evaluate(segments, top_k, meta["scale"])
+
+    def evaluate(self, segments: List[Tuple[int, int, int, int, bytes]], top_k: int, scale: float) -> List[Tuple[int, float]]:
+        """
+        Integer accumulation with early termination
+
+        Each accumulated document also records which query terms it has
+        been seen with, so its bound only adds the remaining impacts of the
+        other terms. The top-k is final once unseen documents cannot reach
+        the k-th score and no seen document outside the top-k can either.
+        IMPACT_POSTINGS_BUDGET additionally caps the postings processed
+        (anytime mode: the best impacts are always processed first).
+
+        Args:
+            segments: [(term_id, impact, doc_count, last_doc, doc_ids)] by impact descending
+        """
+        if not segments:
+            return []
+        size = max(s[3] for s in segments) + 1
+        accumulators = np.zeros(size, dtype=np.int32)
+
+        # 每个词的段下标（段按 impact 降序，下一个未处理段即该词剩余的最大 impact）
+        term_segments: Dict[int, List[int]] = {}
+        for i, segment in enumerate(segments):
+            term_segments.setdefault(segment[0], []).append(i)
+        term_ids = list(term_segments)
+        next_segment = {term_id: 0 for term_id in term_ids}
+        bits = {term_id: np.uint32(1 << n) for n, term_id in enumerate(term_ids)}
+        seen_terms = np.zeros(size, dtype=np.uint32) if len(term_ids) <= 32 else None
+
+        total = sum(s[2] for s in segments)
+        budget = settings.IMPACT_POSTINGS_BUDGET
+        processed = 0
+        next_check = top_k
+        i = 0
+        while i < len(segments):
+            # 处理同一 impact 层的所有段
+            level = segments[i][1]
+            while i < len(segments) and segments[i][1] == level:
+                term_id, impact, count, _, data = segments[i]
+                docs = np.cumsum(positions_codec.decode_varints(data))
+                accumulators[docs] += impact
+                if seen_terms is not None:
+                    seen_terms[docs] |= bits[term_id]
+                processed += count
+                next_segment[term_id] += 1
+                i += 1
+
+            if budget and processed >= budget:
+                break
+            if processed < next_check or i == len(segments):
+                continue
+            next_check = processed * 2
+
+            remaining = np.array([
+                segments[term_segments[term_id][next_segment[term_id]]][1]
+                if next_segment[term_id] < len(term_segments[term_id]) else 0
+                for term_id in term_ids
+            ])
+            candidates = np.flatnonzero(accumulators)
+            if len(candidates) <= top_k:
+                continue
+            scores = accumulators[candidates]
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            kth = scores[top].min()
+            if remaining.sum() > kth:
+                continue
+
+            # 候选文档的上界：只加上尚未见过的词的剩余 impact
+            if seen_terms is not None:
+                shifts = np.arange(len(term_ids), dtype=np.uint32)
+                unseen = (seen_terms[candidates, None] >> shifts) & 1 == 0
+                bound = scores + unseen @ remaining
+            else:
+                bound = scores + remaining.sum()
+            bound[top] = 0
+            if bound.max() <= kth:
+                break
+
+        candidates = np.flatnonzero(accumulators)
+        totals = accumulators[candidates].astype(np.float64) * (scale / IMPACT_LEVELS)
+        self.last_search = {
+            "segments": len(segments),
+            "segments_processed": i,
+            "postings": total,
+            "postings_processed": processed,
+            "terminated_early": i < len(segments),
+        }
+        return InvertedIndex._top_k(candidates, totals, top_k)
+
+    async def get_stats(self, session: AsyncSession) -> Dict[str, Any]:
+        """Build statistics, drift against doc_stats and the last search's counters"""
+        meta = await self.load_meta(session, max_age=0)
+        row = (await session.execute(text("""
+            SELECT
+                (SELECT COUNT(*) FROM impact_postings) AS segments,
+                (SELECT COALESCE(SUM(doc_count), 0) FROM impact_postings) AS postings,
+                (SELECT avg_doc_length FROM doc_stats WHERE id = 1) AS avg_doc_length
+        """))).first()
+        drift = None
+        if meta and meta["avg_doc_length"] and row.avg_doc_length is not None:
+            drift = abs(row.avg_doc_length - meta["avg_doc_length"]) / meta["avg_doc_length"]
+        return {
+            "enabled": settings.IMPACT_INDEX_ENABLED,
+            "build": meta,
+            "segments": row.segments,
+            "postings": int(row.postings),
+            "avg_doc_length_drift": drift,
+            "rebuild_threshold": settings.IMPACT_REBUILD_DRIFT,
+            "last_search": self.last_search,
+        }
+
+
+# Global impact index instance
+impact_index = None
+
+def get_impact_index() -> ImpactIndex:
+    """Get or create impact index singleton"""
+    global impact_index
+    if impact_index is None:
+        impact_index = ImpactIndex()
+    return impact_index
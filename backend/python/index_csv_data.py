@@ -10,6 +10,7 @@ from pathlib import Path
 # 添加父目录到路径
 sys.path.insert(0, str(Path(__file__).parent))
 
+from config import settings
 from database import AsyncSessionLocal, init_db
 from index_service import get_index_service
 
@@ -84,28 +85,22 @@ async def index_csv_data(csv_file: str, limit: int = 100):
     print("\n开始索引到数据库...")
     indexed_count = 0
     failed_count = 0
+    total_elapsed = 0.0
+    batch_size = settings.INDEX_BATCH_SIZE
     
-    async with AsyncSessionLocal() as session:
-        index_service = get_index_service()
-        
-        for i, doc in enumerate(documents):
+    index_service = get_index_service()
+    for offset in range(0, len(documents), batch_size):
+        batch = documents[offset:offset + batch_size]
+        async with AsyncSessionLocal() as session:
             try:
-                doc_id = await index_service.index_document(
-                    title=doc["title"],
-                    content=doc["content"],
-                    url=doc["url"],
-                    source_type=doc["source_type"],
-                    metadata=doc["metadata"],
-                    session=session
-                )
-                indexed_count += 1
-                
-                if (i + 1) % 10 == 0:
-                    print(f"✓ 已索引 {i+1}/{len(documents)} 条")
-                    
+                result = await index_service.batch_index_documents(batch, session)
+                indexed_count += len(batch)
+                total_elapsed += result["elapsed"]
+                print(f"✓ 已索引 {offset + len(batch)}/{len(documents)} 条 ({result['docs_per_second']:.1f} docs/s)")
             except Exception as e:
-                print(f"✗ 索引失败 (行{i+1}): {str(e)[:100]}")
-                failed_count += 1
+                await session.rollback()
+                print(f"✗ 索引失败 (行{offset + 1}-{offset + len(batch)}): {str(e)[:100]}")
+                failed_count += len(batch)
     
     print("\n" + "=" * 60)
     print("索引完成!")
@@ -113,6 +108,8 @@ async def index_csv_data(csv_file: str, limit: int = 100):
     print(f"✓ 成功: {indexed_count}")
     print(f"✗ 失败: {failed_count}")
     print(f"总计: {len(documents)}")
+    if total_elapsed > 0:
+        print(f"速度: {indexed_count / total_elapsed:.1f} docs/s")
     print("=" * 60)
     print("\n现在可以启动服务并搜索了！")
     print("运行: bash start.sh")
@@ -6,7 +6,7 @@ import requests
 import json
 
 # Python API endpoint
-API_URL = "http://localhost:8001/api/index"
+API_URL = "http://localhost:8001/api/index/batch"
 
 # Sample documents to index
 sample_documents = [
@@ -87,38 +87,31 @@ def index_documents():
     print("Starting document indexing...")
     print(f"Total documents to index: {len(sample_documents)}\n")
     
-    indexed_count = 0
-    failed_count = 0
+    try:
+        response = requests.post(API_URL, json={"documents": sample_documents}, timeout=120)
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Cannot connect to Python API at {API_URL}")
+        print("   Make sure the Python API is running: python main.py")
+        return
+    except Exception as e:
+        print(f"❌ Error indexing batch: {str(e)}")
+        return
     
-    for i, doc in enumerate(sample_documents, 1):
-        try:
-            response = requests.post(API_URL, json=doc, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ [{i}/{len(sample_documents)}] Indexed: {doc['title']}")
-                print(f"   Document ID: {result.get('document_id')}")
-                indexed_count += 1
-            else:
-                print(f"❌ [{i}/{len(sample_documents)}] Failed: {doc['title']}")
-                print(f"   Status: {response.status_code}")
-                print(f"   Error: {response.text}")
-                failed_count += 1
-                
-        except requests.exceptions.ConnectionError:
-            print(f"❌ Cannot connect to Python API at {API_URL}")
-            print("   Make sure the Python API is running: python main.py")
-            return
-        except Exception as e:
-            print(f"❌ [{i}/{len(sample_documents)}] Error indexing {doc['title']}: {str(e)}")
-            failed_count += 1
-        
-        print()  # Empty line for readability
+    if response.status_code != 200:
+        print(f"❌ Batch indexing failed")
+        print(f"   Status: {response.status_code}")
+        print(f"   Error: {response.text}")
+        return
     
+    result = response.json()
+    for i, (doc, doc_id) in enumerate(zip(sample_documents, result["document_ids"]), 1):
+        print(f"✅ [{i}/{len(sample_documents)}] Indexed: {doc['title']} (ID {doc_id})")
+    
+    print()
     print("=" * 50)
     print(f"Indexing complete!")
-    print(f"✅ Successfully indexed: {indexed_count}")
-    print(f"❌ Failed: {failed_count}")
+    print(f"✅ Successfully indexed: {result['count']}")
+    print(f"⏱  {result['elapsed']:.2f}s ({result['docs_per_second']:.1f} docs/s)")
     print("=" * 50)
 
 if __name__ == "__main__":
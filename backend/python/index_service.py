@@ -1,9 +1,17 @@
+import asyncio
+import hashlib
+import time
 from typing import List, Optional, Dict, Any
 from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import copy_rows
 from models import Document, DocumentEmbedding, ImageEmbedding
 from embedding_service import get_embedding_service
 from tokenizer_service import get_tokenizer_service
+from result_cache import get_result_cache
+from image_store import get_image_store
+from simhash_index import get_simhash_index, fingerprint, to_signed, to_unsigned, SimHashIndex
 import numpy as np
 
 class IndexService:
@@ -12,6 +20,9 @@ class IndexService:
     def __init__(self):
         self.embedding_service = get_embedding_service()
         self.tokenizer_service = get_tokenizer_service()
+        self.result_cache = get_result_cache()
+        self.image_store = get_image_store()
+        self.simhash_index = get_simhash_index()
     
     def preprocess_text(self, text: str) -> str:
         """
@@ -37,21 +48,26 @@ class IndexService:
         
         ⚠️ UPSERT 逻辑：如果 URL 已存在，更新文档；否则创建新文档
         
-        构建倒排索引和向量索引
+        构建倒排索引和向量索引。与已索引文档 SimHash 近似重复的新内容
+        只保存为指向规范文档的轻量记录（见 simhash_index.py）
         
         Args:
             images: List of image objects [{url, base64_data, alt_text, width, height}]
+                    (bytes go to the content-addressed image store, the
+                    document keeps {url, hash, alt_text, width, height})
         
         Returns:
-            Document ID
+            Document ID (the canonical document's ID for a near-duplicate)
         """
         from posting_list_manager import get_posting_list_manager
+        posting_manager = get_posting_list_manager()
         
-        # Store original in metadata
+        # Store original title in metadata (content is already in documents.content)
         if metadata is None:
             metadata = {}
         metadata["original_title"] = title
-        metadata["original_content"] = content
+        content_hash = self.content_hash(title, content)
+        simhash = fingerprint(title, content)
         
         # ============ UPSERT 逻辑 ============
         # 如果提供了 URL，检查是否已存在
@@ -63,117 +79,553 @@ class IndexService:
             existing_doc = result.scalar_one_or_none()
         
         if existing_doc:
-            # URL 已存在 → 更新文档
-            print(f"🔄 UPSERT: URL 已存在，更新文档 ID={existing_doc.id}: {url}")
+            # URL 已存在 → 与已存储的内容/图片哈希比较，只更新变化的部分
+            image_hashes = [self.image_store.hash_of(img) for img in images or []]
+            old_hashes = [img.get("hash") for img in existing_doc.images or []]
+            text_changed = existing_doc.content_hash != content_hash
             
-            # 1. 删除旧的 posting list 和 embedding
-            posting_manager = get_posting_list_manager()
-            await posting_manager.delete_posting_list(existing_doc.id, session)
+            if not text_changed and image_hashes == old_hashes:
+                print(f"⏭ UPSERT: 内容和图片未变化，跳过文档 ID={existing_doc.id}: {url}")
+                return existing_doc.duplicate_of or existing_doc.id
             
-            # 删除旧 embedding (文本和图片)
-            await session.execute(
-                text("DELETE FROM document_embeddings WHERE document_id = :doc_id"),
-                {"doc_id": existing_doc.id}
-            )
-            await session.execute(
-                text("DELETE FROM image_embeddings WHERE document_id = :doc_id"),
-                {"doc_id": existing_doc.id}
-            )
+            if text_changed:
+                canonical = await self.simhash_index.find_canonical(session, simhash, exclude=existing_doc.id)
+            elif existing_doc.duplicate_of is not None:
+                canonical = (existing_doc.duplicate_of, None)  # 只有图片变化，仍是近似重复
+            else:
+                canonical = None
+            if canonical is not None:
+                return await self._store_duplicate(
+                    existing_doc, canonical, title, content, content_hash, url,
+                    source_type, metadata, images, simhash, session
+                )
             
-            # 2. 更新文档内容
+            print(f"🔄 UPSERT: URL 已存在，更新文档 ID={existing_doc.id}: {url}")
+            was_duplicate = existing_doc.duplicate_of is not None
+            if was_duplicate:
+                # 不再与规范文档近似：按新文档完整索引
+                old_hashes = []
+                existing_doc.duplicate_of = None
+            existing_doc.simhash = to_signed(simhash) if simhash is not None else None
             existing_doc.title = title
             existing_doc.content = content
+            existing_doc.content_hash = content_hash
             existing_doc.source_type = source_type
             existing_doc.doc_metadata = metadata
-            existing_doc.images = images  # 更新图片
-            
+            existing_doc.images = await self.image_store.store_images(images, session)
             await session.flush()
             document = existing_doc
+            
+            if text_changed or was_duplicate:
+                # 只重写变化的 posting
+                diff = await posting_manager.update_posting_list(
+                    document_id=document.id,
+                    title=title,
+                    content=content,
+                    session=session
+                )
+                print(
+                    f"   postings: +{diff['added']} ~{diff['changed']} "
+                    f"-{diff['removed']} ={diff['unchanged']}"
+                )
+                
+                # 标题或内容变化才重新计算文本向量
+                embedding = self.embedding_service.encode_text(f"{title}. {content}")[0]
+                result = await session.execute(
+                    select(DocumentEmbedding).where(DocumentEmbedding.document_id == document.id)
+                )
+                doc_embedding = result.scalars().first()
+                if doc_embedding is not None:
+                    doc_embedding.embedding = embedding.tolist()
+                else:
+                    session.add(DocumentEmbedding(document_id=document.id, embedding=embedding.tolist()))
+            
+            # 只重新计算变化的图片向量
+            await self._update_image_embeddings(document.id, images, old_hashes, image_hashes, session)
         else:
+            canonical = await self.simhash_index.find_canonical(session, simhash)
+            if canonical is not None:
+                return await self._store_duplicate(
+                    None, canonical, title, content, content_hash, url,
+                    source_type, metadata, images, simhash, session
+                )
+            
             # URL 不存在 → 创建新文档
             print(f"➕ UPSERT: 创建新文档: {url or '(no URL)'}")
+            
+            # 图片写入内容寻址存储，文档只保存引用
+            image_refs = await self.image_store.store_images(images, session)
             document = Document(
                 title=title,
                 content=content,
+                content_hash=content_hash,
                 url=url,
                 source_type=source_type,
                 doc_metadata=metadata,
-                images=images  # 保存图片
+                images=image_refs,  # 保存图片引用
+                simhash=to_signed(simhash) if simhash is not None else None
             )
             session.add(document)
             await session.flush()  # Get the ID
+            
+            # Build posting list (构建倒排索引)
+            await posting_manager.build_posting_list(
+                document_id=document.id,
+                title=title,
+                content=content,
+                session=session
+            )
+            
+            # Generate embedding from original text (向量索引)
+            embedding = self.embedding_service.encode_text(f"{title}. {content}")[0]
+            session.add(DocumentEmbedding(
+                document_id=document.id,
+                embedding=embedding.tolist()
+            ))
+            
+            # 处理图片 Embedding
+            image_hashes = [self.image_store.hash_of(img) for img in images or []]
+            await self._update_image_embeddings(document.id, images, [], image_hashes, session)
         
-        # Build posting list (构建倒排索引)
-        posting_manager = get_posting_list_manager()
-        await posting_manager.build_posting_list(
-            document_id=document.id,
-            title=title,
-            content=content,
-            session=session
-        )
+        self.simhash_index.stage_add(session, document.id, simhash)
+        await session.commit()
         
-        # Generate embedding from original text (向量索引)
-        text_to_embed = f"{title}. {content}"
-        embedding = self.embedding_service.encode_text(text_to_embed)[0]
+        # 写入已提交，推进索引版本号使结果缓存失效
+        self.result_cache.bump_generation()
         
-        # Store embedding
-        doc_embedding = DocumentEmbedding(
-            document_id=document.id,
-            embedding=embedding.tolist()
-        )
-        session.add(doc_embedding)
-        
-        # 处理图片 Embedding
-        if images:
-             # 限制处理前4张图片
-             for i, img in enumerate(images[:4]):
-                 base64_data = img.get("base64_data")
-                 if base64_data:
-                     try:
-                         # 使用 base64 生成 embedding
-                         img_embedding = self.embedding_service.encode_image_base64(base64_data)
-                         
-                         img_emb_record = ImageEmbedding(
-                             document_id=document.id,
-                             image_index=i,
-                             embedding=img_embedding.tolist()
-                         )
-                         session.add(img_emb_record)
-                     except Exception as e:
-                         print(f"Failed to generate image embedding for doc {document.id} img {i}: {e}")
-
+        return document.id
+    
+    async def _store_duplicate(
+        self,
+        document: Optional[Document],
+        canonical: tuple,
+        title: str,
+        content: str,
+        content_hash: str,
+        url: Optional[str],
+        source_type: str,
+        metadata: Dict[str, Any],
+        images: Optional[List[Dict]],
+        simhash: Optional[int],
+        session: AsyncSession
+    ) -> int:
+        """
+        Store a near-duplicate as a lightweight row pointing at its canonical document
+        
+        No tokenization, postings or embeddings. An existing canonical
+        document that turned into a near-duplicate has its postings and
+        embeddings withdrawn, and its own near-duplicates are moved to the
+        new canonical document.
+        
+        Returns:
+            Canonical document ID
+        """
+        from posting_list_manager import get_posting_list_manager
+        
+        canonical_id, distance = canonical
+        label = f"距离 {distance}" if distance is not None else "仅图片变化"
+        print(f"🪞 SimHash: {url or '(no URL)'} 与文档 ID={canonical_id} 近似重复（{label}），跳过索引")
+        
+        demoted = document is not None and document.duplicate_of is None
+        if demoted:
+            await get_posting_list_manager().delete_posting_list(document.id, session)
+            await session.execute(
+                text("DELETE FROM document_embeddings WHERE document_id = :id"), {"id": document.id}
+            )
+            await session.execute(
+                text("DELETE FROM image_embeddings WHERE document_id = :id"), {"id": document.id}
+            )
+            self.simhash_index.stage_add(session, document.id, None)
+        
+        image_refs = await self.image_store.store_images(images, session)
+        if document is None:
+            document = Document(url=url)
+            session.add(document)
+        document.title = title
+        document.content = content
+        document.content_hash = content_hash
+        document.source_type = source_type
+        document.doc_metadata = metadata
+        document.images = image_refs
+        document.simhash = to_signed(simhash) if simhash is not None else None
+        document.duplicate_of = canonical_id
+        await session.flush()
+        if demoted:
+            await self._repoint_duplicates({document.id: canonical_id}, session)
         await session.commit()
         
-        return document.id
+        self.simhash_index.record_skip(content, images)
+        if demoted:
+            self.result_cache.bump_generation()
+        return canonical_id
+    
+    async def _update_image_embeddings(
+        self,
+        document_id: int,
+        images: Optional[List[Dict]],
+        old_hashes: List[Optional[str]],
+        new_hashes: List[Optional[str]],
+        session: AsyncSession
+    ):
+        """
+        Re-embed only the image slots whose hash changed (first 4 images)
+        
+        Embeddings of slots that changed or disappeared are deleted; new or
+        changed images with inline data are encoded in one batched pass.
+        """
+        images = (images or [])[:4]  # 限制处理前4张图片
+        old_hashes, new_hashes = old_hashes[:4], new_hashes[:4]
+        
+        def changed(i: int) -> bool:
+            return i >= len(old_hashes) or i >= len(new_hashes) or old_hashes[i] != new_hashes[i]
+        
+        stale = [i for i in range(len(old_hashes)) if changed(i)]
+        if stale:
+            await session.execute(text("""
+                DELETE FROM image_embeddings
+                WHERE document_id = :doc_id AND image_index = ANY(:indexes)
+            """), {"doc_id": document_id, "indexes": stale})
+        
+        to_embed = [i for i in range(len(images)) if changed(i) and images[i].get("base64_data")]
+        if not to_embed:
+            return
+        embeddings = self.embedding_service.encode_images_base64(
+            [images[i]["base64_data"] for i in to_embed]
+        )
+        for i, embedding in zip(to_embed, embeddings):
+            if embedding is None:
+                print(f"Failed to generate image embedding for doc {document_id} img {i}")
+                continue
+            session.add(ImageEmbedding(
+                document_id=document_id,
+                image_index=i,
+                embedding=embedding.tolist()
+            ))
+    
+    @staticmethod
+    def content_hash(title: str, content: str) -> str:
+        """SHA-256 of the indexed text, used to detect unchanged re-crawls"""
+        return hashlib.sha256(f"{title}\x00{content}".encode("utf-8")).hexdigest()
     
     async def batch_index_documents(
         self,
         documents: List[Dict[str, Any]],
         session: AsyncSession
-    ) -> List[int]:
+    ) -> Dict[str, Any]:
         """
-        Index multiple documents in batch
+        Bulk-index a batch of documents in one transaction
+        
+        - tokenization runs in parallel worker processes
+        - text and image embeddings run as batched forward passes
+        - all terms of the batch are upserted in one statement
+        - postings and embeddings are bulk-loaded with COPY
+        - doc_stats is updated once per batch
+        
+        Documents are UPSERTed by URL like index_document; if a URL appears
+        more than once in the batch, the last occurrence wins. Near-duplicates
+        of indexed documents (or of an earlier document in the batch) are
+        stored as lightweight rows, like in index_document.
         
         Args:
-            documents: List of dicts with keys: title, content, url, source_type, metadata
+            documents: List of dicts with keys: title, content, url, source_type, metadata, images
         
         Returns:
-            List of document IDs
+            {"document_ids": [...] (one per input, canonical ID for near-duplicates),
+             "elapsed": seconds, "docs_per_second": float}
         """
-        doc_ids = []
+        from posting_list_manager import get_posting_list_manager
         
-        for doc_data in documents:
-            doc_id = await self.index_document(
-                title=doc_data["title"],
-                content=doc_data["content"],
-                url=doc_data.get("url"),
-                source_type=doc_data.get("source_type", "text"),
-                metadata=doc_data.get("metadata"),
-                session=session
+        start = time.perf_counter()
+        if not documents:
+            return {"document_ids": [], "elapsed": 0.0, "docs_per_second": 0.0}
+        
+        # 同一批次内相同 URL 只保留最后一条
+        keys = [doc.get("url") or ("no-url", i) for i, doc in enumerate(documents)]
+        unique = {key: dict(doc) for key, doc in zip(keys, documents)}
+        
+        posting_manager = get_posting_list_manager()
+        urls = [doc["url"] for doc in unique.values() if doc.get("url")]
+        existing = {}
+        if urls:
+            result = await session.execute(select(Document).where(Document.url.in_(urls)))
+            existing = {doc.url: doc for doc in result.scalars()}
+        
+        # 内容和图片哈希都未变化的已存在文档直接跳过
+        ids_by_key = {}
+        for key, doc in list(unique.items()):
+            doc["content_hash"] = self.content_hash(doc["title"], doc["content"])
+            record = existing.get(doc.get("url"))
+            if (
+                record is not None
+                and record.content_hash == doc["content_hash"]
+                and [self.image_store.hash_of(img) for img in doc.get("images") or []]
+                    == [img.get("hash") for img in record.images or []]
+            ):
+                ids_by_key[key] = record.duplicate_of or record.id
+                del unique[key]
+                del existing[doc["url"]]
+        if ids_by_key:
+            print(f"⏭ UPSERT: {len(ids_by_key)} 个文档未变化，跳过")
+        
+        # 近似重复（SimHash）的文档不分词、不做向量化，只保存指向规范文档的记录
+        duplicates = {}  # key -> (doc, ("id", 规范文档 ID) 或 ("key", 本批次内规范文档的 key))
+        in_batch = SimHashIndex(self.simhash_index.max_distance)
+        in_batch_keys = []
+        lookups = []
+        for doc in unique.values():
+            doc["simhash"] = fingerprint(doc["title"], doc["content"])
+            record = existing.get(doc.get("url"))
+            lookups.append((doc["simhash"], record.id if record is not None else None))
+        # 整批候选在一次查询里确认，而不是每个文档一次往返
+        canonicals = await self.simhash_index.find_canonical_many(session, lookups)
+        for (key, doc), canonical in zip(list(unique.items()), canonicals):
+            if canonical is not None:
+                duplicates[key] = (doc, ("id", canonical[0]))
+            elif doc["simhash"] is not None and settings.SIMHASH_ENABLED:
+                matches = in_batch.candidates(doc["simhash"])
+                if matches:
+                    duplicates[key] = (doc, ("key", in_batch_keys[matches[0][0]]))
+                else:
+                    in_batch.add(len(in_batch_keys), doc["simhash"])
+                    in_batch_keys.append(key)
+            if key in duplicates:
+                del unique[key]
+        
+        batch_keys = list(unique)
+        batch = list(unique.values())
+        if not batch and not duplicates:
+            elapsed = time.perf_counter() - start
+            return {
+                "document_ids": [ids_by_key[key] for key in keys],
+                "elapsed": elapsed,
+                "docs_per_second": len(ids_by_key) / elapsed if elapsed > 0 else 0.0
+            }
+        
+        # 1. 分词（多进程）与文本 / 图片向量化（批量前向）并行执行
+        image_slots = [
+            (i, j, img["base64_data"])
+            for i, doc in enumerate(batch)
+            for j, img in enumerate((doc.get("images") or [])[:4])  # 限制处理前4张图片
+            if img.get("base64_data")
+        ]
+        token_lists, text_embeddings, image_embeddings = [], [], []
+        if batch:
+            token_lists, text_embeddings, image_embeddings = await asyncio.gather(
+                self.tokenizer_service.tokenize_many(
+                    [f"{doc['title']} {doc['content']}" for doc in batch]
+                ),
+                asyncio.to_thread(
+                    self.embedding_service.encode_text,
+                    [f"{doc['title']}. {doc['content']}" for doc in batch]
+                ),
+                asyncio.to_thread(
+                    self.embedding_service.encode_images_base64,
+                    [base64_data for _, _, base64_data in image_slots]
+                )
+            )
+        
+        # 2. 文档 UPSERT（批量路径中变化的文档整篇重建）
+        if existing:
+            existing_ids = [doc.id for doc in existing.values()]
+            print(f"🔄 UPSERT: {len(existing_ids)} 个 URL 已存在，更新文档")
+            await posting_manager.delete_posting_lists(existing_ids, session)
+            await session.execute(
+                text("DELETE FROM document_embeddings WHERE document_id = ANY(:ids)"),
+                {"ids": existing_ids}
+            )
+            await session.execute(
+                text("DELETE FROM image_embeddings WHERE document_id = ANY(:ids)"),
+                {"ids": existing_ids}
             )
-            doc_ids.append(doc_id)
         
-        return doc_ids
+        records = []
+        for doc in batch:
+            metadata = dict(doc.get("metadata") or {})
+            metadata["original_title"] = doc["title"]
+            image_refs = await self.image_store.store_images(doc.get("images"), session)
+            
+            record = existing.get(doc.get("url"))
+            if record is not None:
+                record.title = doc["title"]
+                record.content = doc["content"]
+                record.content_hash = doc["content_hash"]
+                record.source_type = doc.get("source_type", "text")
+                record.doc_metadata = metadata
+                record.images = image_refs
+                record.duplicate_of = None
+            else:
+                record = Document(
+                    title=doc["title"],
+                    content=doc["content"],
+                    content_hash=doc["content_hash"],
+                    url=doc.get("url"),
+                    source_type=doc.get("source_type", "text"),
+                    doc_metadata=metadata,
+                    images=image_refs
+                )
+                session.add(record)
+            record.simhash = to_signed(doc["simhash"]) if doc["simhash"] is not None else None
+            records.append(record)
+        await session.flush()  # Get the IDs
+        for record, doc in zip(records, batch):
+            self.simhash_index.stage_add(session, record.id, doc["simhash"])
+        
+        ids_by_key.update({key: record.id for key, record in zip(batch_keys, records)})
+        if duplicates:
+            ids_by_key.update(await self._store_batch_duplicates(duplicates, existing, ids_by_key, session))
+        
+        # 3. 倒排索引（批量 term upsert + COPY postings + 统计更新一次）
+        await posting_manager.build_posting_lists(
+            [(record.id, tokens) for record, tokens in zip(records, token_lists)],
+            session
+        )
+        
+        # 4. COPY 向量
+        await copy_rows(
+            session,
+            "document_embeddings",
+            ["document_id", "embedding"],
+            (
+                (record.id, self._vector_literal(embedding))
+                for record, embedding in zip(records, text_embeddings)
+            )
+        )
+        await copy_rows(
+            session,
+            "image_embeddings",
+            ["document_id", "image_index", "embedding"],
+            (
+                (records[i].id, j, self._vector_literal(embedding))
+                for (i, j, _), embedding in zip(image_slots, image_embeddings)
+                if embedding is not None
+            )
+        )
+        
+        await session.commit()
+        self.result_cache.bump_generation()
+        for doc, _ in duplicates.values():
+            self.simhash_index.record_skip(doc["content"], doc.get("images"))
+        
+        elapsed = time.perf_counter() - start
+        docs_per_second = len(ids_by_key) / elapsed if elapsed > 0 else 0.0
+        print(
+            f"📦 Batch indexed {len(batch)} documents ({len(duplicates)} near-duplicates, "
+            f"{len(ids_by_key) - len(batch) - len(duplicates)} unchanged) in {elapsed:.2f}s ({docs_per_second:.1f} docs/s)"
+        )
+
+        return {
+            "document_ids": [ids_by_key[key] for key in keys],
+            "elapsed": elapsed,
+            "docs_per_second": docs_per_second
+        }
+    
+    async def _store_batch_duplicates(
+        self,
+        duplicates: Dict[Any, tuple],
+        existing: Dict[str, Document],
+        ids_by_key: Dict[Any, int],
+        session: AsyncSession
+    ) -> Dict[Any, int]:
+        """
+        Write the near-duplicates of a batch as rows pointing at their canonical documents
+        
+        Postings and embeddings of existing records were already removed by
+        the batch UPSERT step.
+        
+        Returns:
+            {key: canonical document ID}
+        """
+        canonical_ids = {}
+        demoted = {}
+        for key, (doc, (kind, target)) in duplicates.items():
+            canonical_id = target if kind == "id" else ids_by_key[target]
+            metadata = dict(doc.get("metadata") or {})
+            metadata["original_title"] = doc["title"]
+            
+            record = existing.get(doc.get("url"))
+            if record is None:
+                record = Document(url=doc.get("url"))
+                session.add(record)
+            elif record.duplicate_of is None:
+                self.simhash_index.stage_add(session, record.id, None)  # 原本是规范文档
+                demoted[record.id] = canonical_id
+            record.title = doc["title"]
+            record.content = doc["content"]
+            record.content_hash = doc["content_hash"]
+            record.source_type = doc.get("source_type", "text")
+            record.doc_metadata = metadata
+            record.images = await self.image_store.store_images(doc.get("images"), session)
+            record.simhash = to_signed(doc["simhash"]) if doc["simhash"] is not None else None
+            record.duplicate_of = canonical_id
+            canonical_ids[key] = canonical_id
+        
+        await session.flush()
+        await self._repoint_duplicates(demoted, session)
+        print(f"🪞 SimHash: {len(duplicates)} 个近似重复文档已折叠到规范文档，跳过索引")
+        return canonical_ids
+    
+    async def _repoint_duplicates(self, demoted: Dict[int, int], session: AsyncSession):
+        """Move the near-duplicates of demoted canonical documents to their new canonical"""
+        for old_id, canonical_id in demoted.items():
+            await session.execute(
+                text("UPDATE documents SET duplicate_of = :canonical_id WHERE duplicate_of = :old_id"),
+                {"canonical_id": canonical_id, "old_id": old_id}
+            )
+    
+    async def _promote_duplicates(self, document_ids: List[int], session: AsyncSession):
+        """
+        Re-home near-duplicates whose canonical document was deleted
+        
+        Each one is attached to another live canonical document if it still
+        has one within SIMHASH_MAX_DISTANCE (including the ones promoted
+        here); otherwise it is promoted and gets its own postings and
+        embeddings.
+        """
+        from posting_list_manager import get_posting_list_manager
+        
+        if not document_ids:
+            return
+        posting_manager = get_posting_list_manager()
+        result = await session.execute(
+            select(Document).where(Document.id.in_(document_ids)).order_by(Document.id)
+        )
+        promoted = SimHashIndex(self.simhash_index.max_distance)
+        for document in result.scalars().all():
+            value = to_unsigned(document.simhash) if document.simhash is not None else None
+            canonical = await self.simhash_index.find_canonical(session, value, exclude=document.id)
+            if canonical is None and value is not None and settings.SIMHASH_ENABLED:
+                matches = promoted.candidates(value)
+                canonical = matches[0] if matches else None
+            if canonical is not None:
+                document.duplicate_of = canonical[0]
+                continue
+            
+            print(f"⬆️ SimHash: 规范文档已删除，近似重复文档 ID={document.id} 升为规范文档并建索引")
+            document.duplicate_of = None
+            await posting_manager.build_posting_list(
+                document_id=document.id,
+                title=document.title,
+                content=document.content,
+                session=session
+            )
+            embedding = self.embedding_service.encode_text(f"{document.title}. {document.content}")[0]
+            session.add(DocumentEmbedding(document_id=document.id, embedding=embedding.tolist()))
+            
+            # 图片向量从内容寻址存储中的原图重新计算
+            image_hashes = [img.get("hash") for img in (document.images or [])[:4]]
+            data = await self.image_store.get_many_base64([h for h in image_hashes if h], session)
+            images = [{"base64_data": data.get(h)} for h in image_hashes]
+            await self._update_image_embeddings(document.id, images, [], image_hashes, session)
+            
+            if value is not None:
+                promoted.add(document.id, value)
+            self.simhash_index.stage_add(session, document.id, value)
+        await session.flush()
+    
+    @staticmethod
+    def _vector_literal(embedding) -> str:
+        """pgvector text format: [x1,x2,...]"""
+        return "[" + ",".join(map(str, np.asarray(embedding, dtype=np.float32).tolist())) + "]"
     
     async def get_document(
         self,
@@ -186,25 +638,110 @@ class IndexService:
         )
         return result.scalar_one_or_none()
     
+    async def get_documents_by_ids(
+        self,
+        document_ids: List[int],
+        session: AsyncSession,
+        full_content: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Bulk-hydrate documents with a single query, preserving the given order
+        
+        Only selects the columns the API responses need. By default the content
+        is cut to a 200-character snippet in SQL, so full pages never leave the
+        database just to build a snippet.
+        
+        Args:
+            document_ids: Document IDs in rank order
+            full_content: Return the full content instead of a snippet
+        
+        Returns:
+            List of dicts with id, title, url, source_type, snippet, images
+            (missing documents are skipped)
+        """
+        if not document_ids:
+            return []
+        
+        if full_content:
+            content_column = "content AS snippet"
+        else:
+            content_column = """
+                CASE WHEN char_length(content) > 200
+                     THEN LEFT(content, 200) || '...'
+                     ELSE content END AS snippet
+            """
+        
+        result = await session.execute(
+            text(f"""
+                SELECT id, title, url, source_type, images, {content_column}
+                FROM documents
+                WHERE id = ANY(:ids)
+            """),
+            {"ids": list(document_ids)}
+        )
+        rows = {row.id: row for row in result}
+        
+        return [
+            {
+                "id": rows[doc_id].id,
+                "title": rows[doc_id].title,
+                "url": rows[doc_id].url,
+                "source_type": rows[doc_id].source_type,
+                "snippet": rows[doc_id].snippet,
+                "images": rows[doc_id].images
+            }
+            for doc_id in document_ids
+            if doc_id in rows
+        ]
+    
     async def delete_document(
         self,
         document_id: int,
         session: AsyncSession
     ) -> bool:
         """Delete document, its embeddings and posting list"""
+        return await self.delete_documents([document_id], session) > 0
+    
+    async def delete_documents(
+        self,
+        document_ids: List[int],
+        session: AsyncSession
+    ) -> int:
+        """
+        Delete documents, their embeddings and posting lists in one transaction
+        
+        Near-duplicates of a deleted canonical document are kept (the foreign
+        key sets duplicate_of to NULL) and re-homed or promoted, see
+        _promote_duplicates.
+        
+        Returns:
+            Number of deleted documents
+        """
         from posting_list_manager import get_posting_list_manager
         
-        document = await self.get_document(document_id, session)
-        if document:
-            # Delete posting list first
-            posting_manager = get_posting_list_manager()
-            await posting_manager.delete_posting_list(document_id, session)
-            
-            # Delete document (cascades to embeddings)
-            await session.delete(document)
-            await session.commit()
-            return True
-        return False
+        result = await session.execute(
+            text("SELECT id FROM documents WHERE id = ANY(:ids)"), {"ids": list(document_ids)}
+        )
+        found = [row.id for row in result]
+        if not found:
+            return 0
+        result = await session.execute(text("""
+            SELECT id FROM documents
+            WHERE duplicate_of = ANY(:ids) AND NOT (id = ANY(:ids))
+        """), {"ids": found})
+        orphans = [row.id for row in result]
+        
+        # Delete posting lists first
+        await get_posting_list_manager().delete_posting_lists(found, session)
+        
+        # Delete documents (cascades to embeddings)
+        await session.execute(text("DELETE FROM documents WHERE id = ANY(:ids)"), {"ids": found})
+        for document_id in found:
+            self.simhash_index.stage_add(session, document_id, None)
+        await self._promote_duplicates(orphans, session)
+        await session.commit()
+        self.result_cache.bump_generation()
+        return len(found)
     
     async def get_all_documents(
         self,
@@ -0,0 +1,311 @@
+"""
+Asynchronous ingestion queue (Redis Stream)
+
+/api/index and /api/index/batch can enqueue documents instead of indexing
+them inside the request (INGEST_MODE="async" or ?mode=async):
+
+- Each document becomes one stream entry {ingestion_id, position, document};
+  the endpoint returns 202 with the ingestion id right after XADD
+- Indexer workers (a consumer group) drain the stream in batches of up to
+  INGEST_BATCH_SIZE through IndexService.batch_index_documents. A failing
+  batch is retried document by document, so one bad document only fails itself.
+- Entries are acknowledged and deleted once their outcome is recorded, so the
+  stream length is the indexing lag. Entries left pending by a crashed worker
+  are re-claimed after INGEST_CLAIM_IDLE_MS and failed after
+  INGEST_MAX_DELIVERIES deliveries.
+- Per-ingestion status (counters + per-document outcome) lives in Redis
+  for INGEST_STATUS_TTL seconds
+
+Re-delivery is safe for documents with a URL (UPSERT by URL skips unchanged
+content); documents without a URL may be indexed twice after a crash.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import redis
+from config import settings
+
+STREAM_KEY = "verdant:ingest:stream"
+GROUP = "indexers"
+STATUS_PREFIX = "verdant:ingest:"
+
+
+class IngestQueue:
+    """Durable document ingestion queue with a pool of indexer workers"""
+
+    def __init__(self):
+        self.batch_size = settings.INGEST_BATCH_SIZE
+        self.indexed = 0
+        self.failed = 0
+        self.batches = 0
+        self._tasks: List[asyncio.Task] = []
+        self.redis_client = None
+        try:
+            self.redis_client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                decode_responses=True,
+                socket_connect_timeout=3,
+                socket_timeout=settings.INGEST_BLOCK_MS / 1000 + 5  # 大于 XREADGROUP 阻塞时长
+            )
+            self.redis_client.ping()
+            self._ensure_group()
+        except Exception as e:
+            print(f"⚠ Ingest queue: Redis unavailable ({e}), asynchronous indexing disabled")
+            self.redis_client = None
+
+    @property
+    def available(self) -> bool:
+        return self.redis_client is not None
+
+    def _ensure_group(self):
+        try:
+            self.redis_client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def enqueue(self, documents: List[Dict[str, Any]]) -> str:
+        """
+        Append documents to the stream
+
+        Args:
+            documents: Dicts with keys: title, content, url, source_type, metadata, images
+
+        Returns:
+            Ingestion id
+        """
+        if not self.available:
+            raise RuntimeError("Ingest queue unavailable (Redis not connected)")
+
+        ingestion_id = uuid.uuid4().hex
+        status_key = f"{STATUS_PREFIX}{ingestion_id}"
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(status_key, mapping={
+            "total": len(documents),
+            "indexed": 0,
+            "failed": 0,
+            "created_at": time.time(),
+        })
+        pipe.expire(status_key, settings.INGEST_STATUS_TTL)
+        for position, document in enumerate(documents):
+            pipe.xadd(STREAM_KEY, {
+                "ingestion_id": ingestion_id,
+                "position": position,
+                "document": json.dumps(document, ensure_ascii=False),
+            })
+        pipe.execute()
+        return ingestion_id
+
+    def get_status(self, ingestion_id: str) -> Optional[Dict[str, Any]]:
+        """Counters and per-document outcome of one ingestion (None if unknown or expired)"""
+        if not self.available:
+            return None
+        status_key = f"{STATUS_PREFIX}{ingestion_id}"
+        status = self.redis_client.hgetall(status_key)
+        if not status:
+            return None
+        outcomes = self.redis_client.hgetall(f"{status_key}:docs")
+
+        total = int(status["total"])
+        indexed, failed = int(status["indexed"]), int(status["failed"])
+        documents = []
+        for position in range(total):
+            outcome = outcomes.get(str(position))
+            documents.append({"position": position, **(json.loads(outcome) if outcome else {"status": "queued"})})
+        return {
+            "ingestion_id": ingestion_id,
+            "state": "completed" if indexed + failed >= total else "processing",
+            "total": total,
+            "indexed": indexed,
+            "failed": failed,
+            "pending": total - indexed - failed,
+            "created_at": float(status["created_at"]),
+            "finished_at": float(status["finished_at"]) if "finished_at" in status else None,
+            "documents": documents,
+        }
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _parse(entries) -> List[Tuple[str, Dict[str, str]]]:
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def _read(self, consumer: str) -> List[Tuple[str, Dict[str, str]]]:
+        """New entries for this consumer (blocks up to INGEST_BLOCK_MS)"""
+        response = self.redis_client.xreadgroup(
+            GROUP, consumer, {STREAM_KEY: ">"},
+            count=self.batch_size, block=settings.INGEST_BLOCK_MS
+        )
+        return self._parse(response[0][1]) if response else []
+
+    def _reclaim(self, consumer: str) -> Tuple[List, List]:
+        """
+        Take over entries left pending by a crashed worker
+
+        Returns:
+            (entries to retry, entries that exceeded INGEST_MAX_DELIVERIES)
+        """
+        pending = self.redis_client.xpending_range(
+            STREAM_KEY, GROUP, min="-", max="+",
+            count=self.batch_size, idle=settings.INGEST_CLAIM_IDLE_MS
+        )
+        if not pending:
+            return [], []
+        exhausted = {
+            p["message_id"] for p in pending
+            if p["times_delivered"] >= settings.INGEST_MAX_DELIVERIES
+        }
+        claimed = self._parse(self.redis_client.xclaim(
+            STREAM_KEY, GROUP, consumer, settings.INGEST_CLAIM_IDLE_MS,
+            [p["message_id"] for p in pending]
+        ))
+        return (
+            [e for e in claimed if e[0] not in exhausted],
+            [e for e in claimed if e[0] in exhausted],
+        )
+
+    def _record(self, entries: List[Tuple[str, Dict[str, str]]], outcomes: List[Dict[str, Any]]):
+        """Store per-document outcomes, then acknowledge and delete the entries"""
+        counts: Dict[str, List[int]] = {}  # ingestion_id -> [indexed, failed]
+        pipe = self.redis_client.pipeline(transaction=True)
+        for (_, fields), outcome in zip(entries, outcomes):
+            status_key = f"{STATUS_PREFIX}{fields['ingestion_id']}"
+            pipe.hset(f"{status_key}:docs", fields["position"], json.dumps(outcome, ensure_ascii=False))
+            pipe.expire(f"{status_key}:docs", settings.INGEST_STATUS_TTL)
+            count = counts.setdefault(fields["ingestion_id"], [0, 0])
+            count[0 if outcome["status"] == "indexed" else 1] += 1
+        for ingestion_id, (indexed, failed) in counts.items():
+            status_key = f"{STATUS_PREFIX}{ingestion_id}"
+            pipe.hincrby(status_key, "indexed", indexed)
+            pipe.hincrby(status_key, "failed", failed)
+        ids = [entry_id for entry_id, _ in entries]
+        pipe.xack(STREAM_KEY, GROUP, *ids)
+        pipe.xdel(STREAM_KEY, *ids)
+        pipe.execute()
+
+        # 记录完成时间
+        for ingestion_id in counts:
+            status_key = f"{STATUS_PREFIX}{ingestion_id}"
+            status = self.redis_client.hmget(status_key, "total", "indexed", "failed")
+            if status[0] is not None and int(status[1]) + int(status[2]) >= int(status[0]):
+                self.redis_client.hsetnx(status_key, "finished_at", time.time())
+
+        self.indexed += sum(c[0] for c in counts.values())
+        self.failed += sum(c[1] for c in counts.values())
+
+    async def _index(self, session_factory, entries: List[Tuple[str, Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """Index one batch; on failure retry document by document to isolate bad ones"""
+        from index_service import get_index_service
+        index_service = get_index_service()
+        documents = [json.loads(fields["document"]) for _, fields in entries]
+
+        try:
+            async with session_factory() as session:
+                result = await index_service.batch_index_documents(documents, session)
+            return [{"status": "indexed", "document_id": doc_id} for doc_id in result["document_ids"]]
+        except Exception as e:
+            if len(documents) == 1:
+                return [{"status": "failed", "error": str(e)}]
+            print(f"⚠ Ingest batch of {len(documents)} failed ({e}), retrying one by one")
+
+        outcomes = []
+        for document in documents:
+            try:
+                async with session_factory() as session:
+                    result = await index_service.batch_index_documents([document], session)
+                outcomes.append({"status": "indexed", "document_id": result["document_ids"][0]})
+            except Exception as e:
+                outcomes.append({"status": "failed", "error": str(e)})
+        return outcomes
+
+    async def _worker(self, session_factory, consumer: str):
+        """Indexer worker loop: re-claim stale entries, otherwise read new ones"""
+        reclaim_every = max(1.0, settings.INGEST_CLAIM_IDLE_MS / 2000)
+        last_reclaim = 0.0
+        while True:
+            try:
+                entries, exhausted = [], []
+                if time.time() - last_reclaim >= reclaim_every:
+                    last_reclaim = time.time()
+                    entries, exhausted = await asyncio.to_thread(self._reclaim, consumer)
+                if exhausted:
+                    await asyncio.to_thread(self._record, exhausted, [
+                        {"status": "failed", "error": f"gave up after {settings.INGEST_MAX_DELIVERIES} deliveries"}
+                    ] * len(exhausted))
+                if not entries:
+                    entries = await asyncio.to_thread(self._read, consumer)
+                if not entries:
+                    continue
+
+                outcomes = await self._index(session_factory, entries)
+                await asyncio.to_thread(self._record, entries, outcomes)
+                self.batches += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠ Ingest worker {consumer} error: {e}")
+                await asyncio.sleep(1)
+
+    def start_workers(self, session_factory, workers: Optional[int] = None):
+        """Start the indexer worker pool on the running event loop"""
+        workers = workers if workers is not None else settings.INGEST_WORKERS
+        if not self.available or workers <= 0:
+            return
+        self._tasks = [t for t in self._tasks if not t.done()]
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        for i in range(len(self._tasks), workers):
+            self._tasks.append(asyncio.create_task(self._worker(session_factory, f"{prefix}-{i}")))
+        print(f"✓ Ingest queue: {workers} indexer workers started")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue lag and worker counters"""
+        stats = {
+            "available": self.available,
+            "mode": settings.INGEST_MODE,
+            "workers": sum(1 for t in self._tasks if not t.done()),
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+        if not self.available:
+            return stats
+        try:
+            backlog = self.redis_client.xlen(STREAM_KEY)  # 已确认的条目会被删除
+            in_flight = self.redis_client.xpending(STREAM_KEY, GROUP)["pending"]
+            oldest = self.redis_client.xrange(STREAM_KEY, count=1)
+            lag_seconds = time.time() - int(oldest[0][0].split("-")[0]) / 1000 if oldest else 0.0
+            consumers = self.redis_client.xinfo_consumers(STREAM_KEY, GROUP)
+            stats.update({
+                "backlog": backlog,
+                "queued": backlog - in_flight,
+                "in_flight": in_flight,
+                "lag_seconds": round(max(lag_seconds, 0.0), 3),
+                "consumers": len(consumers),
+            })
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
+
+
+# Global ingest queue instance
+ingest_queue = None
+
+def get_ingest_queue() -> IngestQueue:
+    """Get or create ingest queue singleton"""
+    global ingest_queue
+    if ingest_queue is None:
+        ingest_queue = IngestQueue()
+    return ingest_queue
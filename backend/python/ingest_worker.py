@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+独立的索引 worker 进程（消费异步索引队列）
+
+用途：
+- 在 API 进程之外扩展索引能力（与 API 内的 worker 属于同一个 consumer group）
+- 部署时可设置 INGEST_WORKERS=0，让 API 进程只负责入队
+
+使用方式：
+    python ingest_worker.py
+    python ingest_worker.py --workers 4
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from database import AsyncSessionLocal, init_db
+from ingest_queue import get_ingest_queue
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Drain the asynchronous ingestion stream")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--report-interval", type=int, default=30, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("异步索引 worker")
+    print("=" * 60)
+
+    queue = get_ingest_queue()
+    if not queue.available:
+        print("❌ Redis 不可用，无法消费索引队列")
+        sys.exit(1)
+
+    await init_db()
+    queue.start_workers(AsyncSessionLocal, args.workers)
+
+    while True:
+        await asyncio.sleep(args.report_interval)
+        stats = queue.get_stats()
+        print(
+            f"[{time.strftime('%H:%M:%S')}] 已索引 {stats['indexed']}，失败 {stats['failed']}，"
+            f"积压 {stats.get('backlog', '?')}，延迟 {stats.get('lag_seconds', '?')}s"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
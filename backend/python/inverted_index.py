@@ -0,0 +1,906 @@
+"""
+In-memory inverted index engine
+
+Keeps the term dictionary and posting lists in process memory as compact
+sorted NumPy arrays, so BM25 scoring does not need a database round trip.
+
+The index is organised like an LSM tree:
+
+- New documents go into a small mutable write buffer (the memtable), which
+  is sealed into an immutable segment every INVERTED_INDEX_FLUSH_DOCS
+  documents or INVERTED_INDEX_FLUSH_INTERVAL seconds
+- Deletes (and the old version of a re-indexed document) only set a bit in
+  the owning segment's tombstone bitmap
+- A background merger compacts segments of similar size under a tiered
+  policy and drops tombstoned documents; the merge itself runs off the
+  event loop on immutable arrays
+- Queries fan out across the segments (and the memtable) with global
+  statistics; a live document lives in exactly one segment, so per-segment
+  top-k results merge into the exact global top-k
+
+Writes never touch the arrays queries are reading, so indexing does not
+stall search. The index is loaded from the terms/postings tables at
+startup (load), kept current by PostingListManager (changes are staged on
+the session and applied only after the transaction commits), and a
+periodic sync picks up writes made by other processes (e.g. the crawler).
+"""
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional, Set, Tuple, Any
+import numpy as np
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+
+# Posting list layout: int32 array of shape (3, n), columns sorted by doc id
+DOC_ROW, TF_ROW, LEN_ROW = 0, 1, 2
+
+# Postings per block for block-max pruning
+BLOCK_SIZE = 128
+# Below this many postings per query, exhaustive scoring is cheaper than pruning
+PRUNING_MIN_POSTINGS = 4096
+
+# session.info key used to stage index changes until commit
+PENDING_KEY = "inverted_index_pending"
+
+_EMPTY_DOCS = np.empty(0, dtype=np.int32)
+_EMPTY_SCORES = np.empty(0)
+
+
+class Segment:
+    """
+    Immutable index segment
+
+    postings: term_id -> int32[3, n] (doc ids, term frequencies, doc lengths)
+    doc_ids:  sorted int32 ids of the documents stored in the segment
+    deleted:  tombstone bitmap aligned with doc_ids, the only mutable part
+    """
+
+    def __init__(self, postings: Dict[int, np.ndarray], doc_ids: np.ndarray):
+        self.postings = postings
+        self.doc_ids = doc_ids
+        self.deleted = np.zeros(len(doc_ids), dtype=bool)
+        self.num_deleted = 0
+        self.num_postings = sum(p.shape[1] for p in postings.values())
+        self._blocks: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def from_columns(cls, term_col: np.ndarray, cols: np.ndarray, presorted: bool = False) -> "Segment":
+        """
+        Build a segment from flat postings
+
+        Args:
+            term_col: int32[n] term id of each posting
+            cols: int32[3, n] doc ids, term frequencies, doc lengths
+            presorted: postings are already ordered by (term id, doc id)
+        """
+        if not presorted and len(term_col):
+            order = np.lexsort((cols[DOC_ROW], term_col))
+            term_col, cols = term_col[order], cols[:, order]
+        cols = np.ascontiguousarray(cols, dtype=np.int32)
+
+        postings: Dict[int, np.ndarray] = {}
+        if len(term_col):
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(term_col)) + 1])
+            ends = np.append(starts[1:], len(term_col))
+            for term_id, start, end in zip(term_col[starts].tolist(), starts.tolist(), ends.tolist()):
+                postings[term_id] = cols[:, start:end]
+        return cls(postings, np.unique(cols[DOC_ROW]))
+
+    @classmethod
+    def merge(cls, segments: List["Segment"], deleted: List[np.ndarray]) -> "Segment":
+        """
+        Merge segments into one, dropping documents marked in deleted
+
+        deleted holds tombstone snapshots taken when the merge was planned,
+        so the sources can keep receiving deletes while this runs off-thread.
+        """
+        term_chunks, col_chunks = [], []
+        for segment, dead in zip(segments, deleted):
+            if not segment.postings:
+                continue
+            term_ids = np.fromiter(segment.postings, dtype=np.int32, count=len(segment.postings))
+            lengths = [p.shape[1] for p in segment.postings.values()]
+            terms = np.repeat(term_ids, lengths)
+            cols = np.concatenate(list(segment.postings.values()), axis=1)
+            if dead.any():
+                keep = ~dead[np.searchsorted(segment.doc_ids, cols[DOC_ROW])]
+                terms, cols = terms[keep], cols[:, keep]
+            term_chunks.append(terms)
+            col_chunks.append(cols)
+
+        if not term_chunks:
+            return cls({}, _EMPTY_DOCS)
+        return cls.from_columns(np.concatenate(term_chunks), np.concatenate(col_chunks, axis=1))
+
+    @property
+    def live_docs(self) -> int:
+        return len(self.doc_ids) - self.num_deleted
+
+    @property
+    def deleted_ratio(self) -> float:
+        return self.num_deleted / len(self.doc_ids) if len(self.doc_ids) else 0.0
+
+    def delete(self, document_id: int) -> bool:
+        """Set the tombstone bit of a document stored in this segment"""
+        i = int(np.searchsorted(self.doc_ids, document_id))
+        if i >= len(self.doc_ids) or self.doc_ids[i] != document_id or self.deleted[i]:
+            return False
+        self.deleted[i] = True
+        self.num_deleted += 1
+        return True
+
+    def live(self, docs: np.ndarray) -> np.ndarray:
+        """Boolean mask of docs (all stored in this segment) that are not tombstoned"""
+        if self.num_deleted == 0:
+            return np.ones(len(docs), dtype=bool)
+        return ~self.deleted[np.searchsorted(self.doc_ids, docs)]
+
+    def block_meta(self, term_id: int) -> np.ndarray:
+        """
+        Per-block metadata for block-max pruning, built lazily per term
+
+        Stores each block's max tf and min doc length rather than a score:
+        BM25 increases with tf and decreases with doc length, so
+        impact(max_tf, min_dl) bounds every posting in the block for any
+        idf/avg_doc_length, and the metadata never goes stale as stats drift.
+        Tombstoned postings stay in their blocks, which keeps the bounds valid.
+        """
+        meta = self._blocks.get(term_id)
+        if meta is None:
+            plist = self.postings[term_id]
+            n = plist.shape[1]
+            starts = np.arange(0, n, BLOCK_SIZE)
+            meta = np.vstack([
+                plist[DOC_ROW][np.minimum(starts + BLOCK_SIZE, n) - 1],
+                np.maximum.reduceat(plist[TF_ROW], starts),
+                np.minimum.reduceat(plist[LEN_ROW], starts),
+            ])
+            self._blocks[term_id] = meta
+        return meta
+
+
+class InvertedIndex:
+    """
+    Process-local segmented inverted index
+
+    segments:    sealed immutable segments
+    term_ids:    term -> term_id (term dictionary)
+    doc_freqs:   term_id -> number of live documents containing the term
+    doc_terms:   doc_id -> int32[] term ids (forward index, used for deletes)
+    doc_lengths: doc_id -> doc length in tokens
+    """
+
+    def __init__(self):
+        self.segments: List[Segment] = []
+        self.term_ids: Dict[str, int] = {}
+        self.doc_freqs: Dict[int, int] = {}
+        self.doc_terms: Dict[int, np.ndarray] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self.loaded = False
+        # 写缓冲区（memtable）：term_id -> [(doc_id, tf, doc_length)]，定期封存为不可变段
+        self._memtable: Dict[int, List[Tuple[int, int, int]]] = {}
+        self._memtable_docs: Set[int] = set()
+        self._flushed_at = time.time()
+        self._doc_segment: Dict[int, Segment] = {}  # doc_id -> 所在的已封存段
+        self._merges = 0
+        self._synced_at: Optional[float] = None  # DB epoch watermark
+        self._synced_versions: Dict[int, float] = {}  # doc_id -> 同步时已核对的 updated_at（仅回看窗口内）
+        self._sync_task: Optional[asyncio.Task] = None
+        self._merge_task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Global statistics
+    # ------------------------------------------------------------------
+
+    @property
+    def total_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def avg_doc_length(self) -> float:
+        if not self.doc_lengths:
+            return 0.0
+        return self.total_length / len(self.doc_lengths)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index statistics"""
+        return {
+            "loaded": self.loaded,
+            "total_docs": self.total_docs,
+            "avg_doc_length": self.avg_doc_length,
+            "total_terms": len(self.term_ids),
+            "total_postings": sum(s.num_postings for s in self.segments)
+                              + sum(len(b) for b in self._memtable.values()),
+            "segments": len(self.segments),
+            "segment_docs": sorted((s.live_docs for s in self.segments), reverse=True),
+            "deleted_docs": sum(s.num_deleted for s in self.segments),
+            "memtable_docs": len(self._memtable_docs),
+            "merges": self._merges,
+            "synced_at": self._synced_at,
+        }
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    async def load(self, session: AsyncSession, chunk_size: int = 100000):
+        """Load the whole index from the terms/postings tables as one base segment"""
+        start = time.time()
+        epoch = (await session.execute(
+            text("SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)")
+        )).scalar()
+
+        term_ids: Dict[str, int] = {}
+        result = await session.execute(text("SELECT id, term FROM terms"))
+        for term_id, term in result:
+            term_ids[term] = term_id
+
+        doc_lengths: Dict[int, int] = {}
+        result = await session.execute(
+            text("SELECT id, doc_length FROM documents WHERE doc_length > 0")
+        )
+        for doc_id, doc_length in result:
+            doc_lengths[doc_id] = doc_length
+
+        # 分块流式读取posting，避免一次性物化所有行
+        chunks = []
+        stream = await session.stream(text("""
+            SELECT p.term_id, p.document_id, p.term_frequency, d.doc_length
+            FROM postings p
+            JOIN documents d ON p.document_id = d.id
+            WHERE d.doc_length > 0
+            ORDER BY p.term_id, p.document_id
+        """))
+        async for partition in stream.partitions(chunk_size):
+            chunks.append(np.array([tuple(row) for row in partition], dtype=np.int32).reshape(-1, 4))
+
+        rows = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int32)
+
+        # 已按term_id, document_id排序
+        base = Segment.from_columns(rows[:, 0], rows[:, 1:].T, presorted=True)
+        doc_freqs = {term_id: plist.shape[1] for term_id, plist in base.postings.items()}
+
+        # 正排索引：doc_id -> term ids
+        doc_terms: Dict[int, np.ndarray] = {}
+        if len(rows):
+            by_doc = rows[np.argsort(rows[:, 1], kind="stable")]
+            bounds = np.flatnonzero(np.diff(by_doc[:, 1])) + 1
+            for block in np.split(by_doc, bounds):
+                doc_terms[int(block[0, 1])] = block[:, 0].copy()
+
+        self.segments = [base] if base.postings else []
+        self.term_ids = term_ids
+        self.doc_freqs = doc_freqs
+        self.doc_terms = doc_terms
+        self.doc_lengths = doc_lengths
+        self.total_length = int(sum(doc_lengths.values()))
+        self._memtable = {}
+        self._memtable_docs = set()
+        self._doc_segment = dict.fromkeys(base.doc_ids.tolist(), base)
+        self._synced_at = float(epoch) if epoch is not None else None
+        self.loaded = True
+
+        print(
+            f"✓ Inverted index loaded: {len(base.postings)} terms, {len(rows)} postings, "
+            f"{len(doc_lengths)} docs in {time.time() - start:.2f}s"
+        )
+
+    # ------------------------------------------------------------------
+    # Incremental maintenance
+    # ------------------------------------------------------------------
+
+    def stage_add(
+        self,
+        session: AsyncSession,
+        document_id: int,
+        terms: Dict[str, Tuple[int, int]],
+        doc_length: int
+    ):
+        """
+        Stage a document's postings; applied after the session commits
+
+        Args:
+            terms: {term: (term_id, term_frequency)}
+        """
+        if not self.loaded:
+            return
+        session.info.setdefault(PENDING_KEY, []).append(
+            ("add", document_id, terms, doc_length)
+        )
+
+    def stage_remove(self, session: AsyncSession, document_id: int):
+        """Stage removal of a document; applied after the session commits"""
+        if not self.loaded:
+            return
+        session.info.setdefault(PENDING_KEY, []).append(("remove", document_id))
+
+    def apply_pending(self, pending: List[tuple]):
+        """Apply staged operations in order"""
+        for op in pending:
+            if op[0] == "add":
+                _, document_id, terms, doc_length = op
+                self.add_document(document_id, terms, doc_length)
+            else:
+                self.remove_document(op[1])
+
+    def add_document(self, document_id: int, terms: Dict[str, Tuple[int, int]], doc_length: int):
+        """Add (or replace) a document in the index"""
+        if document_id in self.doc_lengths:
+            self.remove_document(document_id)
+        if not terms or doc_length <= 0:
+            return
+
+        term_ids = np.empty(len(terms), dtype=np.int32)
+        for i, (term, (term_id, tf)) in enumerate(terms.items()):
+            self.term_ids[term] = term_id
+            self._memtable.setdefault(term_id, []).append((document_id, tf, doc_length))
+            self.doc_freqs[term_id] = self.doc_freqs.get(term_id, 0) + 1
+            term_ids[i] = term_id
+
+        self.doc_terms[document_id] = term_ids
+        self.doc_lengths[document_id] = doc_length
+        self.total_length += doc_length
+        self._memtable_docs.add(document_id)
+
+        if len(self._memtable_docs) >= settings.INVERTED_INDEX_FLUSH_DOCS:
+            self.flush()
+
+    def remove_document(self, document_id: int):
+        """Remove a document: tombstone it in its segment, or drop it from the memtable"""
+        doc_length = self.doc_lengths.pop(document_id, None)
+        if doc_length is None:
+            return
+        self.total_length -= doc_length
+
+        term_ids = self.doc_terms.pop(document_id, ())
+        for term_id in term_ids:
+            term_id = int(term_id)
+            df = self.doc_freqs.get(term_id, 0) - 1
+            if df > 0:
+                self.doc_freqs[term_id] = df
+            else:
+                self.doc_freqs.pop(term_id, None)
+
+        segment = self._doc_segment.pop(document_id, None)
+        if segment is not None:
+            segment.delete(document_id)
+        elif document_id in self._memtable_docs:
+            # memtable 仍可变，直接移除
+            self._memtable_docs.discard(document_id)
+            for term_id in term_ids:
+                term_id = int(term_id)
+                kept = [p for p in self._memtable.get(term_id, ()) if p[0] != document_id]
+                if kept:
+                    self._memtable[term_id] = kept
+                else:
+                    self._memtable.pop(term_id, None)
+
+    def flush(self):
+        """Seal the memtable into an immutable segment"""
+        self._flushed_at = time.time()
+        if not self._memtable_docs:
+            return
+        memtable = self._memtable
+        term_ids = np.fromiter(memtable, dtype=np.int32, count=len(memtable))
+        term_col = np.repeat(term_ids, [len(p) for p in memtable.values()])
+        cols = np.array([p for plist in memtable.values() for p in plist], dtype=np.int32).T
+        segment = Segment.from_columns(term_col, cols)
+
+        self.segments.append(segment)
+        for document_id in self._memtable_docs:
+            self._doc_segment[document_id] = segment
+        self._memtable = {}
+        self._memtable_docs = set()
+
+    def _memtable_segment(self, term_ids: List[int]) -> Optional[Segment]:
+        """Read-only view of the memtable restricted to the query terms"""
+        postings = {}
+        for term_id in term_ids:
+            buffered = self._memtable.get(term_id)
+            if not buffered:
+                continue
+            plist = np.array(buffered, dtype=np.int32).T
+            if plist.shape[1] > 1 and (np.diff(plist[DOC_ROW]) < 0).any():
+                plist = plist[:, np.argsort(plist[DOC_ROW], kind="stable")]
+            postings[term_id] = np.ascontiguousarray(plist)
+        if not postings:
+            return None
+        return Segment(postings, np.array(sorted(self._memtable_docs), dtype=np.int32))
+
+    def _search_segments(self, term_ids: List[int]) -> List[Segment]:
+        """Segments holding postings of the query terms, largest first"""
+        segments = [s for s in self.segments if any(t in s.postings for t in term_ids)]
+        memtable = self._memtable_segment(term_ids)
+        if memtable is not None:
+            segments.append(memtable)
+        return sorted(segments, key=lambda s: s.num_postings, reverse=True)
+
+    def get_postings(self, term: str) -> Optional[np.ndarray]:
+        """Get a term's live posting list across all segments (int32[3, n], sorted by doc id)"""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None
+        chunks = []
+        for segment in self._search_segments([term_id]):
+            plist = segment.postings[term_id]
+            if segment.num_deleted:
+                plist = plist[:, segment.live(plist[DOC_ROW])]
+            chunks.append(plist)
+        if not chunks:
+            return None
+        plist = np.concatenate(chunks, axis=1)
+        return np.ascontiguousarray(plist[:, np.argsort(plist[DOC_ROW], kind="stable")])
+
+    # ------------------------------------------------------------------
+    # Tiered merging
+    # ------------------------------------------------------------------
+
+    def _merge_plan(self) -> List[Segment]:
+        """
+        Pick the next segments to merge
+
+        Segments are grouped into tiers by live document count (tier i holds
+        FLUSH_DOCS * FACTOR^i .. FLUSH_DOCS * FACTOR^(i+1) documents). Once a
+        tier has FACTOR segments they are merged into one segment of the next
+        tier, so each document is rewritten O(log N) times. A segment whose
+        tombstoned share exceeds MAX_DELETED_RATIO is rewritten on its own.
+        """
+        factor = max(2, settings.INVERTED_INDEX_MERGE_FACTOR)
+        flush_docs = max(1, settings.INVERTED_INDEX_FLUSH_DOCS)
+        tiers: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            if segment.live_docs == 0 or segment.deleted_ratio > settings.INVERTED_INDEX_MAX_DELETED_RATIO:
+                return [segment]
+            tier = max(0, int(math.log(max(segment.live_docs / flush_docs, 1.0), factor)))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= factor:
+                return sorted(tiers[tier], key=lambda s: s.live_docs)[:factor]
+        return []
+
+    def _install(self, plan: List[Segment], snapshots: List[np.ndarray], merged: Segment):
+        """Replace the merged sources, carrying over deletes made while the merge ran"""
+        if any(s not in self.segments for s in plan):
+            return  # 索引在合并期间被重新加载
+        for segment, snapshot in zip(plan, snapshots):
+            for document_id in segment.doc_ids[segment.deleted & ~snapshot].tolist():
+                merged.delete(document_id)
+        for document_id in merged.doc_ids[~merged.deleted].tolist():
+            self._doc_segment[document_id] = merged
+
+        self.segments = [s for s in self.segments if s not in plan]
+        if merged.live_docs:
+            self.segments.append(merged)
+        self._merges += 1
+
+    async def merge_step(self) -> bool:
+        """Run one merge off the event loop; returns False when nothing is due"""
+        plan = self._merge_plan()
+        if not plan:
+            return False
+        snapshots = [s.deleted.copy() for s in plan]
+        merged = await asyncio.to_thread(Segment.merge, plan, snapshots)
+        self._install(plan, snapshots, merged)
+        return True
+
+    def merge_pending(self):
+        """Flush and run all due merges synchronously (scripts and benchmarks)"""
+        self.flush()
+        while True:
+            plan = self._merge_plan()
+            if not plan:
+                return
+            snapshots = [s.deleted.copy() for s in plan]
+            self._install(plan, snapshots, Segment.merge(plan, snapshots))
+
+    def start_merge(self, interval: Optional[int] = None):
+        """Start the periodic flush / tiered merge background task"""
+        interval = interval or settings.INVERTED_INDEX_FLUSH_INTERVAL
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    if time.time() - self._flushed_at >= interval:
+                        self.flush()
+                    while await self.merge_step():
+                        pass
+                except Exception as e:
+                    print(f"⚠ Inverted index merge failed: {e}")
+
+        if self._merge_task is None or self._merge_task.done():
+            self._merge_task = asyncio.create_task(_loop())
+
+    # ------------------------------------------------------------------
+    # Cross-process sync
+    # ------------------------------------------------------------------
+
+    async def sync(self, session: AsyncSession):
+        """
+        Pick up documents changed by other processes since the last sync
+
+        Changed documents are detected by documents.updated_at (with a lookback
+        margin for long transactions); deletions by comparing document counts.
+        Documents whose version was already checked, or whose postings in
+        memory already match the database (e.g. written by this process), are
+        left alone, so a sync only touches the index for real changes.
+        """
+        if not self.loaded:
+            return
+
+        epoch = float((await session.execute(
+            text("SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)")
+        )).scalar())
+        since = (self._synced_at or epoch) - settings.INVERTED_INDEX_SYNC_LOOKBACK
+
+        # 回看窗口会重复返回上次已核对过的文档（包括本进程刚索引的），按 updated_at 跳过
+        result = await session.execute(text("""
+            SELECT id, EXTRACT(EPOCH FROM updated_at) FROM documents
+            WHERE updated_at >= to_timestamp(:since)
+        """), {"since": since})
+        versions = {
+            doc_id: float(version) for doc_id, version in result
+            if self._synced_versions.get(doc_id) != float(version)
+        }
+
+        changed: Dict[int, Tuple[int, Dict[str, Tuple[int, int]]]] = {}
+        if versions:
+            result = await session.execute(text("""
+                SELECT d.id, d.doc_length, p.term_id, t.term, p.term_frequency
+                FROM documents d
+                LEFT JOIN postings p ON p.document_id = d.id
+                LEFT JOIN terms t ON t.id = p.term_id
+                WHERE d.id = ANY(:ids)
+                ORDER BY d.id
+            """), {"ids": list(versions)})
+            for doc_id, doc_length, term_id, term, tf in result:
+                entry = changed.setdefault(doc_id, (doc_length or 0, {}))
+                if term_id is not None:
+                    entry[1][term] = (term_id, tf)
+
+        applied = False
+        for doc_id, (doc_length, terms) in changed.items():
+            if doc_length > 0 and terms:
+                if not self._matches(doc_id, doc_length, terms):
+                    self.add_document(doc_id, terms, doc_length)
+                    applied = True
+            elif doc_id in self.doc_lengths:
+                self.remove_document(doc_id)
+                applied = True
+        self._synced_versions.update(versions)
+        self._synced_versions = {
+            doc_id: version for doc_id, version in self._synced_versions.items()
+            if version >= since
+        }
+
+        # 检测其他进程删除的文档
+        db_count = (await session.execute(
+            text("SELECT COUNT(*) FROM documents WHERE doc_length > 0")
+        )).scalar()
+        if db_count != self.total_docs:
+            result = await session.execute(
+                text("SELECT id FROM documents WHERE doc_length > 0")
+            )
+            live = {row[0] for row in result}
+            removed = [d for d in self.doc_lengths if d not in live]
+            for doc_id in removed:
+                self.remove_document(doc_id)
+            applied = applied or bool(removed)
+
+        self._synced_at = epoch
+
+        # 结果缓存可能在写入方推进版本号之后、本进程同步之前被填充，再推进一次
+        if applied:
+            from result_cache import get_result_cache
+            get_result_cache().bump_generation()
+
+    def _matches(self, document_id: int, doc_length: int, terms: Dict[str, Tuple[int, int]]) -> bool:
+        """Whether the in-memory postings of a document already equal the stored ones"""
+        if self.doc_lengths.get(document_id) != doc_length:
+            return False
+        stored = self.doc_terms.get(document_id)
+        if stored is None or len(stored) != len(terms):
+            return False
+        segment = self._doc_segment.get(document_id)
+        for term_id, tf in terms.values():
+            if segment is not None:
+                plist = segment.postings.get(term_id)
+                if plist is None:
+                    return False
+                i = int(np.searchsorted(plist[DOC_ROW], document_id))
+                if i >= plist.shape[1] or plist[DOC_ROW, i] != document_id or plist[TF_ROW, i] != tf:
+                    return False
+            elif (document_id, tf, doc_length) not in self._memtable.get(term_id, ()):
+                return False
+        return True
+
+    def start_sync(self, session_factory, interval: Optional[int] = None):
+        """Start the periodic background sync task"""
+        interval = interval or settings.INVERTED_INDEX_SYNC_INTERVAL
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    async with session_factory() as session:
+                        await self.sync(session)
+                except Exception as e:
+                    print(f"⚠ Inverted index sync failed: {e}")
+
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(_loop())
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _impact(idf: float, tf: np.ndarray, dl: np.ndarray, avg_doc_length: float, k1: float, b: float) -> np.ndarray:
+        """BM25 term contribution"""
+        tf = tf.astype(np.float64)
+        return idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * dl / avg_doc_length))
+
+    def _query_terms(self, tokens: List[str]) -> List[Tuple[int, float]]:
+        """Resolve query tokens to (term_id, idf) using live document frequencies"""
+        total_docs = self.total_docs
+        terms = []
+        for term in set(tokens):
+            term_id = self.term_ids.get(term)
+            df = self.doc_freqs.get(term_id, 0) if term_id is not None else 0
+            if df <= 0:
+                continue
+            idf = float(np.log((total_docs - df + 0.5) / (df + 0.5) + 1.0))
+            terms.append((term_id, idf))
+        return terms
+
+    def _lookup(self, plist: np.ndarray, idf: float, docs: np.ndarray, avg_doc_length: float, k1: float, b: float) -> np.ndarray:
+        """Contribution of one term to each of docs (0 where the term is absent)"""
+        doc_ids = plist[DOC_ROW]
+        pos = np.minimum(np.searchsorted(doc_ids, docs), len(doc_ids) - 1)
+        hit = doc_ids[pos] == docs
+        pos = pos[hit]
+        scores = np.zeros(len(docs))
+        scores[hit] = self._impact(idf, plist[TF_ROW][pos], plist[LEN_ROW][pos], avg_doc_length, k1, b)
+        return scores
+
+    @staticmethod
+    def _top_k(doc_ids: np.ndarray, totals: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if len(totals) > top_k:
+            top = np.argpartition(-totals, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(doc_ids[i]), float(totals[i])) for i in top]
+
+    @staticmethod
+    def _best(doc_ids: np.ndarray, totals: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Unordered top_k of a segment's results"""
+        if len(totals) > top_k:
+            top = np.argpartition(-totals, top_k - 1)[:top_k]
+            return doc_ids[top], totals[top]
+        return doc_ids, totals
+
+    def _fan_out(self, tokens: List[str], top_k: int, score_segment) -> List[Tuple[int, float]]:
+        """
+        Score each segment with global statistics and merge the per-segment top-k
+
+        Segments are visited largest first; the k-th best score found so far
+        is passed on as a floor, so later segments can prune against it.
+        """
+        terms = self._query_terms(tokens)
+        if not terms:
+            return []
+
+        doc_chunks, score_chunks = [], []
+        floor = 0.0
+        found = 0
+        for segment in self._search_segments([term_id for term_id, _ in terms]):
+            docs, totals = score_segment(segment, terms, floor)
+            docs, totals = self._best(docs, totals, top_k)
+            doc_chunks.append(docs)
+            score_chunks.append(totals)
+            found += len(totals)
+            if found >= top_k:
+                scores = np.concatenate(score_chunks)
+                floor = float(np.partition(scores, len(scores) - top_k)[len(scores) - top_k])
+
+        if not doc_chunks:
+            return []
+        return self._top_k(np.concatenate(doc_chunks), np.concatenate(score_chunks), top_k)
+
+    def _score_exhaustive(
+        self,
+        segment: Segment,
+        terms: List[Tuple[int, float]],
+        avg_doc_length: float,
+        k1: float,
+        b: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact BM25 of every live document of a segment that matches a query term"""
+        doc_chunks = []
+        score_chunks = []
+        for term_id, idf in terms:
+            plist = segment.postings.get(term_id)
+            if plist is None:
+                continue
+            doc_chunks.append(plist[DOC_ROW])
+            score_chunks.append(self._impact(idf, plist[TF_ROW], plist[LEN_ROW], avg_doc_length, k1, b))
+
+        if not doc_chunks:
+            return _EMPTY_DOCS, _EMPTY_SCORES
+
+        if len(doc_chunks) == 1:
+            doc_ids, totals = doc_chunks[0], score_chunks[0]
+        else:
+            doc_ids, inverse = np.unique(np.concatenate(doc_chunks), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(score_chunks))
+
+        if segment.num_deleted:
+            keep = segment.live(doc_ids)
+            doc_ids, totals = doc_ids[keep], totals[keep]
+        return doc_ids, totals
+
+    def search_bm25(
+        self,
+        tokens: List[str],
+        top_k: int,
+        k1: float = 1.5,
+        b: float = 0.75
+    ) -> List[Tuple[int, float]]:
+        """
+        Vectorized exhaustive BM25 over the query terms' posting lists
+
+        Returns:
+            List of (document_id, score), best first
+        """
+        avg_doc_length = self.avg_doc_length
+        if avg_doc_length == 0 or top_k <= 0:
+            return []
+
+        return self._fan_out(
+            tokens, top_k,
+            lambda segment, terms, floor: self._score_exhaustive(segment, terms, avg_doc_length, k1, b)
+        )
+
+    def search_bm25_maxscore(
+        self,
+        tokens: List[str],
+        top_k: int,
+        k1: float = 1.5,
+        b: float = 0.75
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k BM25 with block-max MaxScore dynamic pruning (per segment)
+
+        1. Seed a threshold from the best blocks of the highest-bound term
+           (never below the k-th score already found in larger segments)
+        2. Terms whose summed upper bounds stay below the threshold become
+           non-essential: they never generate candidates, only score them
+        3. Blocks of essential terms that cannot reach the threshold are skipped
+        4. Candidates are bounded with the non-essential terms' block maxima
+           before exact scoring
+
+        Returns the same top-k as search_bm25 (up to ties at the threshold).
+        """
+        avg_doc_length = self.avg_doc_length
+        if avg_doc_length == 0 or top_k <= 0:
+            return []
+
+        return self._fan_out(
+            tokens, top_k,
+            lambda segment, terms, floor: self._maxscore_segment(
+                segment, terms, top_k, floor, avg_doc_length, k1, b
+            )
+        )
+
+    def _maxscore_segment(
+        self,
+        segment: Segment,
+        terms: List[Tuple[int, float]],
+        top_k: int,
+        floor: float,
+        avg_doc_length: float,
+        k1: float,
+        b: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Block-max MaxScore over one segment; returns (candidates, scores)"""
+        scored = []  # (plist, block last doc ids, idf, block upper bounds, term upper bound)
+        for term_id, idf in terms:
+            plist = segment.postings.get(term_id)
+            if plist is None:
+                continue
+            meta = segment.block_meta(term_id)
+            block_ub = self._impact(idf, meta[1], meta[2], avg_doc_length, k1, b)
+            scored.append((plist, meta[0], idf, block_ub, float(block_ub.max())))
+
+        if not scored:
+            return _EMPTY_DOCS, _EMPTY_SCORES
+        if sum(t[0].shape[1] for t in scored) <= PRUNING_MIN_POSTINGS:
+            return self._score_exhaustive(segment, terms, avg_doc_length, k1, b)
+
+        scored.sort(key=lambda t: t[4])
+        cum_ub = np.cumsum([t[4] for t in scored])
+        if cum_ub[-1] < floor:
+            return _EMPTY_DOCS, _EMPTY_SCORES
+
+        # 1. 用上界最高的词的最佳块估计初始阈值
+        plist, _, idf, block_ub, _ = scored[-1]
+        n = plist.shape[1]
+        order = np.argsort(-block_ub, kind="stable")
+        sizes = np.minimum(BLOCK_SIZE, n - order * BLOCK_SIZE)
+        order = order[:int(np.searchsorted(np.cumsum(sizes), top_k)) + 1]
+        idx = (order[:, None] * BLOCK_SIZE + np.arange(BLOCK_SIZE)).ravel()
+        idx = idx[idx < n]
+        seed_scores = self._impact(idf, plist[TF_ROW][idx], plist[LEN_ROW][idx], avg_doc_length, k1, b)
+        if len(idx) > top_k:
+            idx = idx[np.argpartition(-seed_scores, top_k - 1)[:top_k]]
+        seeds = np.sort(plist[DOC_ROW][idx])
+        if segment.num_deleted:
+            seeds = seeds[segment.live(seeds)]  # 已删除文档不能抬高阈值
+
+        threshold = floor
+        if len(seeds) >= top_k:
+            seed_totals = np.zeros(len(seeds))
+            for t_plist, _, t_idf, _, _ in scored:
+                seed_totals += self._lookup(t_plist, t_idf, seeds, avg_doc_length, k1, b)
+            threshold = max(threshold, float(np.partition(seed_totals, len(seeds) - top_k)[len(seeds) - top_k]))
+
+        # 2. 非必要词：其上界之和低于阈值，只含这些词的文档不可能进入top-k
+        n_non_essential = int(np.searchsorted(cum_ub, threshold, side="left"))
+        non_essential, essential = scored[:n_non_essential], scored[n_non_essential:]
+
+        # 3. 候选文档只来自必要词，跳过无法达到阈值的块
+        chunks = [seeds]
+        for t_plist, _, _, t_block_ub, t_ub in essential:
+            docs = t_plist[DOC_ROW]
+            keep = t_block_ub + (cum_ub[-1] - t_ub) >= threshold
+            if not keep.all():
+                docs = docs[np.repeat(keep, BLOCK_SIZE)[:len(docs)]]
+            chunks.append(docs)
+        candidates = np.unique(np.concatenate(chunks))
+        if segment.num_deleted:
+            candidates = candidates[segment.live(candidates)]
+
+        totals = np.zeros(len(candidates))
+        for t_plist, _, t_idf, _, _ in essential:
+            totals += self._lookup(t_plist, t_idf, candidates, avg_doc_length, k1, b)
+
+        # 4. 用非必要词的块上界过滤候选，再精确打分
+        if non_essential:
+            bound = totals.copy()
+            for _, t_last_doc, _, t_block_ub, _ in non_essential:
+                blk = np.minimum(np.searchsorted(t_last_doc, candidates), len(t_last_doc) - 1)
+                bound += t_block_ub[blk]
+            keep = bound >= threshold
+            candidates, totals = candidates[keep], totals[keep]
+            for t_plist, _, t_idf, _, _ in non_essential:
+                totals += self._lookup(t_plist, t_idf, candidates, avg_doc_length, k1, b)
+
+        return candidates, totals
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        get_inverted_index().apply_pending(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Global inverted index instance
+inverted_index = None
+
+def get_inverted_index() -> InvertedIndex:
+    """Get or create inverted index singleton"""
+    global inverted_index
+    if inverted_index is None:
+        inverted_index = InvertedIndex()
+    return inverted_index
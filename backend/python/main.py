@@ -1,15 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 import uvicorn
 
-from database import get_db, init_db
+from database import get_db, init_db, AsyncSessionLocal
 from search_service import get_search_service, SearchService
 from index_service import get_index_service, IndexService
 from llm_service import get_llm_service, LLMService
 from cache_service import get_cache_service, CacheService
+from inverted_index import get_inverted_index
+from posting_list_manager import get_posting_list_manager
+from embedding_batcher import get_embedding_batcher
+from term_dictionary import get_term_dictionary
+from doc_stats_service import get_doc_stats_service
+from posting_blocks import get_posting_block_store
+from impact_index import get_impact_index
+from embedding_cache import get_embedding_cache
+from result_cache import get_result_cache
+from ingest_queue import get_ingest_queue
+from simhash_index import get_simhash_index
+from image_store import get_image_store, IMAGE_VARIANTS
 from analytics_router import router as analytics_router
 from config import settings
 
@@ -57,7 +71,9 @@ class SearchRequest(BaseModel):
 
 class ImageInfo(BaseModel):
     url: str
-    base64_data: Optional[str] = None
+    hash: Optional[str] = None  # SHA-256 in the image store
+    src: Optional[str] = None  # Cacheable /api/images/{hash} path
+    base64_data: Optional[str] = None  # Legacy inline data (documents not yet migrated)
     alt_text: Optional[str] = None
     width: Optional[int] = None
     height: Optional[int] = None
@@ -101,6 +117,14 @@ class BatchIndexResponse(BaseModel):
     document_ids: List[int]
     count: int
     message: str
+    elapsed: float = 0.0
+    docs_per_second: float = 0.0
+
+class IngestionAcceptedResponse(BaseModel):
+    ingestion_id: str
+    count: int
+    status_url: str
+    message: str
 
 class SummaryRequest(BaseModel):
     query: str
@@ -140,6 +164,36 @@ async def startup_event():
     await init_db()
     # Pre-load embedding model
     get_search_service()
+    
+    # Correct doc_stats drift, then keep reconciling in the background
+    doc_stats = get_doc_stats_service()
+    try:
+        async with AsyncSessionLocal() as session:
+            await doc_stats.reconcile(session)
+    except Exception as e:
+        print(f"⚠ doc_stats reconciliation failed: {e}")
+    doc_stats.start_reconcile(AsyncSessionLocal)
+    
+    # Terms left without postings by deletes are removed in the background
+    get_posting_list_manager().start_orphan_cleanup(AsyncSessionLocal)
+    
+    # Repack / re-quantize terms queued by writers (posting_blocks, impact_postings)
+    if settings.POSTING_BLOCKS_ENABLED or settings.IMPACT_INDEX_ENABLED:
+        get_posting_block_store().start_refresh(AsyncSessionLocal)
+    
+    # Load in-memory inverted index for BM25
+    if settings.BM25_STRATEGY in ("maxscore", "memory"):
+        inverted_index = get_inverted_index()
+        try:
+            async with AsyncSessionLocal() as session:
+                await inverted_index.load(session)
+            inverted_index.start_sync(AsyncSessionLocal)
+            inverted_index.start_merge()
+        except Exception as e:
+            print(f"⚠ Failed to load inverted index, falling back to SQL BM25: {e}")
+    
+    # Indexer workers draining the asynchronous ingestion stream
+    get_ingest_queue().start_workers(AsyncSessionLocal)
 
 @app.get("/")
 async def root():
@@ -170,6 +224,29 @@ async def tokenize_text(text: str):
         "token_count": len(tokens)
     }
 
+def _image_infos(images: Optional[List[Dict[str, Any]]]) -> Optional[List[ImageInfo]]:
+    """Image references -> response objects pointing at /api/images/{hash}"""
+    if not images:
+        return images
+    return [
+        ImageInfo(
+            **{**img, "src": get_image_store().url_for(img["hash"]) if img.get("hash") else None}
+        )
+        for img in images
+    ]
+
+def _to_search_result(document: Dict[str, Any], score: float) -> SearchResult:
+    """Build a SearchResult from a hydrated document row"""
+    return SearchResult(
+        id=document["id"],
+        title=document["title"],
+        url=document["url"] or "",
+        snippet=document["snippet"],
+        score=score,
+        source_type=document["source_type"] or "text",
+        images=_image_infos(document["images"])  # 图片URL（不再内联base64）
+    )
+
 @app.post("/api/search", response_model=SearchResponse)
 async def search(
     request: SearchRequest,
@@ -209,29 +286,11 @@ async def search(
         # 分页切片
         paginated_results = search_results[start_idx:end_idx]
         
-        # Fetch full document details for current page
-        results = []
+        # Fetch document details for current page (single bulk query)
         index_service = get_index_service()
-        
-        for result in paginated_results:
-            doc_id = result["document_id"]
-            score = result["score"]
-            
-            # Get document from database
-            document = await index_service.get_document(doc_id, db)
-            if document:
-                # Create snippet (first 200 chars of content)
-                snippet = document.content[:200] + "..." if len(document.content) > 200 else document.content
-                
-                results.append(SearchResult(
-                    id=document.id,
-                    title=document.title,
-                    url=document.url or "",
-                    snippet=snippet,
-                    score=score,
-                    source_type=document.source_type or "text",
-                    images=document.images  # 传递图片数据
-                ))
+        scores = {r["document_id"]: r["score"] for r in paginated_results}
+        documents = await index_service.get_documents_by_ids(list(scores), db)
+        results = [_to_search_result(doc, scores[doc["id"]]) for doc in documents]
         
         # 计算总页数
         total_pages = (total_results + page_size - 1) // page_size
@@ -269,29 +328,11 @@ async def search_by_image(
             top_k=request.top_k or 10
         )
         
-        # Fetch full document details
-        results = []
+        # Fetch document details (single bulk query)
         index_service = get_index_service()
-        
-        for result in search_results:
-            doc_id = result["document_id"]
-            score = result["score"]
-            
-            # Get document from database
-            document = await index_service.get_document(doc_id, db)
-            if document:
-                # Create snippet
-                snippet = document.content[:200] + "..." if len(document.content) > 200 else document.content
-                
-                results.append(SearchResult(
-                    id=document.id,
-                    title=document.title,
-                    url=document.url or "",
-                    snippet=snippet,
-                    score=score,
-                    source_type=document.source_type or "text",
-                    images=document.images
-                ))
+        scores = {r["document_id"]: r["score"] for r in search_results}
+        documents = await index_service.get_documents_by_ids(list(scores), db)
+        results = [_to_search_result(doc, scores[doc["id"]]) for doc in documents]
         
         return SearchResponse(
             query="[Image Search]",
@@ -320,17 +361,50 @@ async def get_suggestions(
         "suggestions": search_service.get_suggestions(q, limit=5)
     }
 
+async def _enqueue_documents(documents: List[Dict[str, Any]]) -> JSONResponse:
+    """
+    Append documents to the ingestion stream and answer 202 Accepted
+    
+    The Redis client is synchronous; the pipeline (one XADD per document)
+    runs in a worker thread so large batches do not block the event loop.
+    """
+    try:
+        ingestion_id = await run_in_threadpool(get_ingest_queue().enqueue, documents)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Ingest queue unavailable: {str(e)}"
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=IngestionAcceptedResponse(
+            ingestion_id=ingestion_id,
+            count=len(documents),
+            status_url=f"/api/index/ingestions/{ingestion_id}",
+            message=f"Queued {len(documents)} documents for indexing"
+        ).dict()
+    )
+
+def _async_ingest(mode: Optional[str]) -> bool:
+    return (mode or settings.INGEST_MODE) == "async"
+
 @app.post("/api/index", response_model=IndexDocumentResponse)
 async def index_document(
     request: IndexDocumentRequest,
+    mode: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     index_service: IndexService = Depends(get_index_service)
 ):
     """
     Index a single document
     
-    Creates document record and generates embedding
+    Creates document record and generates embedding. With mode=async
+    (or INGEST_MODE=async) the document is queued instead and the
+    response is 202 with an ingestion id.
     """
+    if _async_ingest(mode):
+        return await _enqueue_documents([request.dict()])
+    
     try:
         doc_id = await index_service.index_document(
             title=request.title,
@@ -355,26 +429,36 @@ async def index_document(
 @app.post("/api/index/batch", response_model=BatchIndexResponse)
 async def batch_index_documents(
     request: BatchIndexRequest,
+    mode: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     index_service: IndexService = Depends(get_index_service)
 ):
     """
     Batch index multiple documents
     
-    Efficiently indexes multiple documents at once
+    Bulk pipeline: parallel tokenization, batched embeddings, one term
+    upsert and COPY-loaded postings/embeddings in a single transaction.
+    With mode=async (or INGEST_MODE=async) the documents are queued and
+    the response is 202 with an ingestion id.
     """
+    if _async_ingest(mode):
+        return await _enqueue_documents([doc.dict() for doc in request.documents])
+    
     try:
         docs_data = [doc.dict() for doc in request.documents]
         
-        doc_ids = await index_service.batch_index_documents(
+        result = await index_service.batch_index_documents(
             documents=docs_data,
             session=db
         )
+        doc_ids = result["document_ids"]
         
         return BatchIndexResponse(
             document_ids=doc_ids,
             count=len(doc_ids),
-            message=f"Indexed {len(doc_ids)} documents successfully"
+            message=f"Indexed {len(doc_ids)} documents successfully ({result['docs_per_second']:.1f} docs/s)",
+            elapsed=result["elapsed"],
+            docs_per_second=result["docs_per_second"]
         )
     
     except Exception as e:
@@ -383,6 +467,128 @@ async def batch_index_documents(
             detail=f"Batch indexing failed: {str(e)}"
         )
 
+@app.get("/api/index/ingestions/{ingestion_id}")
+async def ingestion_status(ingestion_id: str):
+    """Get the progress and per-document outcome of a queued ingestion"""
+    result = await run_in_threadpool(get_ingest_queue().get_status, ingestion_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingestion not found (unknown id or status expired)"
+        )
+    return result
+
+@app.get("/api/index/queue/stats")
+async def ingest_queue_stats():
+    """Get ingestion stream backlog, lag and indexer worker counters"""
+    return await run_in_threadpool(get_ingest_queue().get_stats)
+
+@app.get("/api/index/duplicates/stats")
+async def duplicate_stats():
+    """Get SimHash fingerprint index size and near-duplicate skip counters"""
+    return get_simhash_index().get_stats()
+
+@app.get("/api/index/stats")
+async def index_stats():
+    """Get in-memory inverted index statistics"""
+    return get_inverted_index().get_stats()
+
+@app.get("/api/index/terms/stats")
+async def term_dictionary_stats():
+    """Get term dictionary cache statistics"""
+    return get_term_dictionary().get_stats()
+
+@app.get("/api/index/doc-stats")
+async def doc_stats():
+    """Get cached corpus statistics and the last reconciliation result"""
+    return get_doc_stats_service().get_stats()
+
+@app.get("/api/index/blocks/stats")
+async def posting_block_stats(db: AsyncSession = Depends(get_db)):
+    """Get posting_blocks size, refresh backlog and last block-skipping counters"""
+    return await get_posting_block_store().get_stats(db)
+
+@app.get("/api/index/impacts/stats")
+async def impact_index_stats(db: AsyncSession = Depends(get_db)):
+    """Get impact index build statistics, avg_doc_length drift and early-termination counters"""
+    return await get_impact_index().get_stats(db)
+
+@app.get("/api/embedding/stats")
+async def embedding_stats():
+    """Get query embedding micro-batching metrics"""
+    return get_embedding_batcher().get_stats()
+
+@app.get("/api/embedding/cache/stats")
+async def embedding_cache_stats():
+    """Get query embedding cache hit/miss counters"""
+    return get_embedding_cache().get_stats()
+
+@app.get("/api/search/cache/stats")
+async def result_cache_stats():
+    """Get search result cache hit/miss counters and index generation"""
+    return await run_in_threadpool(get_result_cache().get_stats)
+
+@app.get("/api/images/{image_hash}")
+async def get_image(
+    image_hash: str,
+    request: Request,
+    variant: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Serve an image from the content-addressed store
+    
+    Images are immutable (addressed by SHA-256), so responses carry a strong
+    ETag and a long-lived Cache-Control. variant: thumb | medium | original
+    
+    If-None-Match may list several (weak or strong) ETags. A matching
+    explicit ETag is answered with 304 without looking the hash up: the
+    bytes behind a hash never change, so a client can only hold that ETag
+    for an image it already received. "*" is only honoured for images
+    that exist.
+    """
+    if variant and variant != "original" and variant not in IMAGE_VARIANTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown variant: {variant}"
+        )
+    
+    etag = f'"{image_hash}-{variant or "original"}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if_none_match = [
+        tag.strip().removeprefix("W/")
+        for tag in request.headers.get("if-none-match", "").split(",")
+    ]
+    if etag in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    image_store = get_image_store()
+    stored = await image_store.get(image_hash, db)
+    if not stored:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Image {image_hash} not found"
+        )
+    if "*" in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    data, mime_type = stored
+    
+    if variant and variant != "original":
+        # 解码 + LANCZOS 缩放 + JPEG 编码是 CPU 密集的同步操作，放到线程池中执行
+        try:
+            data = await run_in_threadpool(image_store.render_variant, image_hash, data, variant)
+        except (OSError, ValueError) as e:  # PIL.UnidentifiedImageError 是 OSError 的子类
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Stored image {image_hash} could not be decoded: {str(e)}"
+            )
+        mime_type = "image/jpeg"
+    
+    return Response(content=data, media_type=mime_type, headers=headers)
+
 @app.get("/api/documents")
 async def list_documents(
     limit: int = 100,
@@ -508,19 +714,22 @@ async def chat_with_ai(
         
         # If document_ids are provided, fetch full details from DB
         if request.document_ids:
-            fetched_results = []
-            for doc_id in request.document_ids:
-                doc = await index_service.get_document(doc_id, db)
-                if doc:
-                    fetched_results.append({
-                        "id": doc.id,
-                        "title": doc.title,
-                        "url": doc.url,
-                        "snippet": doc.content,  # Use full content for context
-                        "source_type": doc.source_type,
-                        "images": doc.images  # Include images
-                    })
+            fetched_results = await index_service.get_documents_by_ids(
+                request.document_ids, db, full_content=True  # Use full content for context
+            )
             if fetched_results:
+                # 多模态上下文需要图片数据：一次查询加载前4张图片
+                hashes = [
+                    img["hash"]
+                    for doc in fetched_results
+                    for img in (doc["images"] or [])
+                    if img.get("hash")
+                ][:4]
+                image_data = await get_image_store().get_many_base64(hashes, db)
+                for doc in fetched_results:
+                    for img in doc["images"] or []:
+                        if img.get("hash") in image_data:
+                            img["base64_data"] = image_data[img["hash"]]
                 search_results = fetched_results
         
         response = llm_service.chat_with_context(
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+图片存储迁移脚本（一次性）
+
+用途：
+- 将 documents.images 中内联的 base64 图片移入内容寻址的 image_store 表
+  （按 SHA-256 去重），文档只保留 {url, hash, alt_text, width, height} 引用
+- 删除 doc_metadata 中冗余的 original_content（与 documents.content 重复）
+
+使用方式：
+    python migrate_images.py
+    python migrate_images.py --batch-size 200
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from sqlalchemy import text
+from database import AsyncSessionLocal, init_db
+from image_store import get_image_store
+
+
+async def migrate(batch_size: int):
+    """分批迁移所有文档"""
+    await init_db()  # 确保 image_store 表存在
+    image_store = get_image_store()
+
+    migrated_docs = 0
+    migrated_images = 0
+    last_id = 0
+
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT id, images, doc_metadata
+                FROM documents
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size})
+            rows = result.fetchall()
+            if not rows:
+                break
+
+            for doc_id, images, metadata in rows:
+                last_id = doc_id
+                has_inline = any(img.get("base64_data") for img in (images or []))
+                has_copy = bool(metadata) and "original_content" in metadata
+                if not has_inline and not has_copy:
+                    continue
+
+                if has_inline:
+                    images = await image_store.store_images(images, session)
+                    migrated_images += sum(1 for img in images if img.get("hash"))
+                if has_copy:
+                    metadata = {k: v for k, v in metadata.items() if k != "original_content"}
+
+                await session.execute(text("""
+                    UPDATE documents
+                    SET images = :images, doc_metadata = :metadata
+                    WHERE id = :id
+                """), {
+                    "images": json.dumps(images) if images is not None else None,
+                    "metadata": json.dumps(metadata) if metadata is not None else None,
+                    "id": doc_id
+                })
+                migrated_docs += 1
+
+            await session.commit()
+            print(f"  已处理到文档 ID {last_id}，迁移 {migrated_docs} 个文档 / {migrated_images} 张图片")
+
+    return migrated_docs, migrated_images
+
+
+async def report_sizes():
+    """输出迁移后的表大小"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(text("""
+            SELECT
+                pg_size_pretty(pg_total_relation_size('documents')) AS documents_size,
+                pg_size_pretty(pg_total_relation_size('image_store')) AS image_store_size,
+                (SELECT COUNT(*) FROM image_store) AS image_count
+        """))
+        row = result.first()
+        print(f"📊 documents: {row.documents_size}, image_store: {row.image_store_size} ({row.image_count} 张图片)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Move inline base64 images into the image store")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("图片存储迁移")
+    print("=" * 60)
+
+    try:
+        docs, images = await migrate(args.batch_size)
+        print()
+        print(f"✅ 迁移完成: {docs} 个文档, {images} 张图片")
+        await report_sizes()
+        print("提示: 运行 VACUUM FULL documents 以回收空间")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Posting 位置编码迁移脚本（一次性）
+
+用途：
+- 将 postings.positions 从 JSON / INTEGER[] 转换为 delta varint 编码的 BYTEA
+  （见 positions_codec.py）
+- 输出迁移前后 postings 表和 positions 列的大小对比
+
+使用方式：
+    python migrate_positions.py
+    python migrate_positions.py --batch-size 20000 --vacuum
+
+注意：迁移完成后重启 API 和爬虫进程（写入格式在进程内按列类型缓存）
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from sqlalchemy import text
+from database import AsyncSessionLocal, engine
+import positions_codec
+
+
+async def positions_type(session) -> str:
+    result = await session.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'postings' AND column_name = 'positions'
+    """))
+    return result.scalar()
+
+
+async def report_sizes(label: str):
+    """输出 postings 表和 positions 列的大小"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(text("""
+            SELECT
+                pg_total_relation_size('postings') AS total_bytes,
+                pg_size_pretty(pg_total_relation_size('postings')) AS total_size,
+                COUNT(*) AS rows,
+                COALESCE(SUM(pg_column_size(positions)), 0) AS positions_bytes
+            FROM postings
+        """))
+        row = result.first()
+        avg = row.positions_bytes / row.rows if row.rows else 0
+        print(
+            f"📊 {label}: postings {row.total_size} ({row.rows} 行), "
+            f"positions 列 {row.positions_bytes / 1024 / 1024:.1f} MB (平均 {avg:.1f} 字节/行)"
+        )
+        return row.total_bytes, row.positions_bytes
+
+
+def encode_legacy(value) -> bytes:
+    """旧格式（JSON 字符串 / 列表）-> 编码字节"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return positions_codec.encode(value)
+
+
+async def migrate(batch_size: int) -> int:
+    """分批写入新列，最后在一个事务中替换旧列"""
+    async with AsyncSessionLocal() as session:
+        column_type = await positions_type(session)
+        if column_type == "bytea":
+            print("✅ positions 已是 BYTEA，无需迁移")
+            return 0
+        await session.execute(text(
+            "ALTER TABLE postings ADD COLUMN IF NOT EXISTS positions_packed BYTEA"
+        ))
+        await session.commit()
+
+    converted = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT id, positions
+                FROM postings
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size})
+            rows = result.fetchall()
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+            await session.execute(text("""
+                UPDATE postings AS p
+                SET positions_packed = v.packed
+                FROM (
+                    SELECT unnest(CAST(:ids AS integer[])) AS id,
+                           unnest(CAST(:packed AS bytea[])) AS packed
+                ) AS v
+                WHERE p.id = v.id
+            """), {
+                "ids": [row.id for row in rows],
+                "packed": [encode_legacy(row.positions) for row in rows]
+            })
+            await session.commit()
+            converted += len(rows)
+            print(f"  已转换到 posting ID {last_id}，共 {converted} 行")
+
+    # 迁移期间新写入的 posting（旧格式）在替换前补齐，然后替换列
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("LOCK TABLE postings IN SHARE ROW EXCLUSIVE MODE"))
+        result = await session.execute(text(
+            "SELECT id, positions FROM postings WHERE id > :last_id"
+        ), {"last_id": last_id})
+        for row in result.fetchall():
+            await session.execute(
+                text("UPDATE postings SET positions_packed = :packed WHERE id = :id"),
+                {"packed": encode_legacy(row.positions), "id": row.id}
+            )
+            converted += 1
+        await session.execute(text("ALTER TABLE postings DROP COLUMN positions"))
+        await session.execute(text("ALTER TABLE postings RENAME COLUMN positions_packed TO positions"))
+        await session.commit()
+
+    return converted
+
+
+async def vacuum():
+    """VACUUM FULL 回收旧列占用的空间（需要在事务外执行）"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM FULL postings"))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Re-encode posting positions as delta varint BYTEA")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--vacuum", action="store_true", help="Run VACUUM FULL postings afterwards")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Posting 位置编码迁移")
+    print("=" * 60)
+
+    try:
+        before_total, before_positions = await report_sizes("迁移前")
+        converted = await migrate(args.batch_size)
+        if args.vacuum:
+            print("🔄 VACUUM FULL postings ...")
+            await vacuum()
+        after_total, after_positions = await report_sizes("迁移后")
+
+        print()
+        print(f"✅ 迁移完成: {converted} 行")
+        if before_positions:
+            print(f"   positions 列: {after_positions / before_positions:.1%} of original")
+        if before_total:
+            print(f"   postings 表: {after_total / before_total:.1%} of original")
+        if not args.vacuum:
+            print("提示: 使用 --vacuum（VACUUM FULL postings）回收旧列空间后表大小才会下降")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
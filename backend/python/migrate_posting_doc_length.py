@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Posting 文档长度迁移脚本（一次性）
+
+用途：
+- 为已有 posting 补齐 postings.doc_length（documents.doc_length 的副本）
+- 创建 BM25 覆盖索引 postings_bm25_covering_idx
+  (term_id) INCLUDE (document_id, term_frequency, doc_length)
+- VACUUM ANALYZE postings，更新可见性映射，使 BM25 查询可以走 index-only scan
+
+使用方式：
+    python migrate_posting_doc_length.py
+    python migrate_posting_doc_length.py --batch-size 50000
+
+迁移前后的查询计划对比见 benchmark_bm25_sql.py
+"""
+
+import argparse
+import asyncio
+import sys
+from sqlalchemy import text
+from database import AsyncSessionLocal, engine, init_db
+
+
+async def backfill(batch_size: int) -> int:
+    """按 posting id 区间分批回填"""
+    async with AsyncSessionLocal() as session:
+        max_id = (await session.execute(text("SELECT COALESCE(MAX(id), 0) FROM postings"))).scalar()
+
+    updated = 0
+    last_id = 0
+    while last_id < max_id:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                UPDATE postings AS p
+                SET doc_length = d.doc_length
+                FROM documents AS d
+                WHERE p.id > :last_id AND p.id <= :upper
+                  AND d.id = p.document_id
+                  AND p.doc_length IS DISTINCT FROM d.doc_length
+            """), {"last_id": last_id, "upper": last_id + batch_size})
+            await session.commit()
+            updated += result.rowcount
+        last_id += batch_size
+        print(f"  已处理到 posting ID {min(last_id, max_id)}，更新 {updated} 行")
+    return updated
+
+
+async def create_index_and_vacuum():
+    """CONCURRENTLY 建索引和 VACUUM 都需要在事务外执行"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        print("🔄 创建覆盖索引 postings_bm25_covering_idx ...")
+        await conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS postings_bm25_covering_idx
+            ON postings (term_id) INCLUDE (document_id, term_frequency, doc_length)
+        """))
+        print("🔄 VACUUM ANALYZE postings ...")
+        await conn.execute(text("VACUUM ANALYZE postings"))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill postings.doc_length and build the BM25 covering index")
+    parser.add_argument("--batch-size", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Posting 文档长度迁移")
+    print("=" * 60)
+
+    try:
+        await init_db()  # 补齐 postings.doc_length 列
+        updated = await backfill(args.batch_size)
+        await create_index_and_vacuum()
+
+        async with AsyncSessionLocal() as session:
+            missing = (await session.execute(
+                text("SELECT COUNT(*) FROM postings WHERE doc_length IS NULL")
+            )).scalar()
+        print()
+        print(f"✅ 迁移完成: 回填 {updated} 行")
+        if missing:
+            print(f"⚠ 仍有 {missing} 行 doc_length 为空（迁移期间旧进程写入），请重新运行")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
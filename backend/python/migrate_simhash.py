@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+SimHash 指纹回填脚本（一次性）
+
+用途：
+- 为 simhash 列加入之前已索引的规范文档计算 documents.simhash
+- 回填前这些文档不在 SimHash 索引里，新抓取的镜像/转载页面无法折叠到它们
+
+说明：
+- 只回填规范文档（duplicate_of IS NULL）；已有文档之间不做去重，已有索引保持不变
+- 文本过短（< SIMHASH_MIN_LENGTH）的文档指纹仍为 NULL
+- 不修改 updated_at，运行中的服务不会增量同步这些指纹，回填完成后请重启后端
+  （启动后第一次查重会全量加载 SimHash 索引）
+
+使用方式：
+    python migrate_simhash.py
+    python migrate_simhash.py --batch-size 2000
+"""
+
+import argparse
+import asyncio
+import sys
+from sqlalchemy import text
+from database import AsyncSessionLocal, init_db
+from simhash_index import fingerprint, to_signed
+
+
+async def backfill(batch_size: int):
+    """按文档 id 分批回填，返回 (已处理文档数, 写入指纹数)"""
+    scanned = 0
+    updated = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(text("""
+                SELECT id, title, content FROM documents
+                WHERE id > :last_id AND simhash IS NULL AND duplicate_of IS NULL
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size})).all()
+            if not rows:
+                break
+
+            params = []
+            for row in rows:
+                value = fingerprint(row.title or "", row.content or "")
+                if value is not None:
+                    params.append({"id": row.id, "simhash": to_signed(value)})
+            if params:
+                await session.execute(text("""
+                    UPDATE documents SET simhash = :simhash
+                    WHERE id = :id AND simhash IS NULL
+                """), params)
+            await session.commit()
+
+        scanned += len(rows)
+        updated += len(params)
+        last_id = rows[-1].id
+        print(f"  已处理到文档 ID {last_id}，计算 {scanned} 个，写入 {updated} 个指纹")
+    return scanned, updated
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill documents.simhash for documents indexed before SimHash")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SimHash 指纹回填")
+    print("=" * 60)
+
+    try:
+        await init_db()  # 补齐 documents.simhash 列
+        scanned, updated = await backfill(args.batch_size)
+        print()
+        print(f"✅ 回填完成: 处理 {scanned} 个文档，写入 {updated} 个指纹（其余文本过短）")
+        print("ℹ 请重启后端服务以重新加载 SimHash 索引")
+    except Exception as e:
+        print(f"❌ 回填失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
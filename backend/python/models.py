@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Float, UniqueConstraint, Index, LargeBinary, BigInteger, SmallInteger
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
@@ -12,11 +13,14 @@ class Document(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(Text, nullable=False, index=True)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64))  # SHA-256 of title + content, skips unchanged re-crawls
     url = Column(Text)
     source_type = Column(String(50))
     doc_metadata = Column(JSON)  # Renamed from 'metadata' (reserved word in SQLAlchemy)
     doc_length = Column(Integer, default=0)  # Document length in tokens (for BM25)
-    images = Column(JSON)  # Array of image objects: [{url, base64_data, alt_text, width, height}], max 4 images
+    images = Column(JSON)  # Array of image references: [{url, hash, alt_text, width, height}], max 4 images
+    simhash = Column(BigInteger)  # 64-bit SimHash of title + content (signed), see simhash_index.py
+    duplicate_of = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), index=True)  # Canonical document of a near-duplicate (no postings/embeddings of its own)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -29,6 +33,18 @@ class DocumentEmbedding(Base):
     embedding = Column(Vector(512))  # CLIP embedding dimension
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class StoredImage(Base):
+    """Content-addressed image storage (keyed by SHA-256 of the bytes)"""
+    __tablename__ = "image_store"
+    
+    hash = Column(String(64), primary_key=True)
+    mime_type = Column(String(50))
+    width = Column(Integer)
+    height = Column(Integer)
+    size_bytes = Column(Integer)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class ImageEmbedding(Base):
     """Image embedding model for image search"""
     __tablename__ = "image_embeddings"
@@ -56,20 +72,69 @@ class Posting(Base):
     term_id = Column(Integer, ForeignKey("terms.id", ondelete="CASCADE"), nullable=False, index=True)
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
     term_frequency = Column(Integer, nullable=False)  # TF: frequency in this document
-    positions = Column(JSON)  # Array of positions where term appears
+    doc_length = Column(Integer)  # Copy of documents.doc_length, so BM25 never joins documents
+    positions = Column(LargeBinary)  # Delta varint encoded positions (see positions_codec)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     __table_args__ = (
         # 唯一约束：每个文档中的每个词只能有一条记录
         # 这样可以使用 ON CONFLICT (term_id, document_id) DO UPDATE
         UniqueConstraint('term_id', 'document_id', name='uq_posting_term_document'),
+        # BM25 覆盖索引：按 term 取 posting 可以只走索引（index-only scan）
+        Index(
+            'postings_bm25_covering_idx', 'term_id',
+            postgresql_include=['document_id', 'term_frequency', 'doc_length']
+        ),
     )
 
+class PostingBlock(Base):
+    """Block-packed posting list rows for BM25 (see posting_blocks.py)"""
+    __tablename__ = "posting_blocks"
+    
+    term_id = Column(Integer, ForeignKey("terms.id", ondelete="CASCADE"), primary_key=True)
+    chunk_no = Column(Integer, primary_key=True)  # Row number within the term
+    posting_count = Column(Integer, nullable=False)
+    block_last_doc = Column(ARRAY(Integer), nullable=False)  # Last doc id of each block (skip index)
+    block_max_tf = Column(ARRAY(Integer), nullable=False)  # Max TF of each block
+    block_min_doc_length = Column(ARRAY(Integer), nullable=False)  # Min doc length of each block
+    block_offsets = Column(ARRAY(Integer), nullable=False)  # Byte offset of each block in data
+    data = Column(LargeBinary, nullable=False)  # Varint doc id gaps, TFs and doc lengths per block
+
+class PostingBlockDirty(Base):
+    """Terms whose posting_blocks rows must be repacked"""
+    __tablename__ = "posting_blocks_dirty"
+    
+    term_id = Column(Integer, primary_key=True)
+    marked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ImpactPosting(Base):
+    """Quantized BM25 impact segments: one row per (term, impact) (see impact_index.py)"""
+    __tablename__ = "impact_postings"
+    
+    term_id = Column(Integer, ForeignKey("terms.id", ondelete="CASCADE"), primary_key=True)
+    impact = Column(SmallInteger, primary_key=True)  # 1..255
+    doc_count = Column(Integer, nullable=False)
+    last_doc = Column(Integer, nullable=False)  # Largest doc id in the segment
+    doc_ids = Column(LargeBinary, nullable=False)  # Delta varint encoded doc ids
+
+class ImpactIndexMeta(Base):
+    """Corpus statistics the impact index was quantized with"""
+    __tablename__ = "impact_index_meta"
+    
+    id = Column(Integer, primary_key=True)
+    total_docs = Column(Integer, nullable=False)
+    avg_doc_length = Column(Float, nullable=False)
+    k1 = Column(Float, nullable=False)
+    b = Column(Float, nullable=False)
+    scale = Column(Float, nullable=False)  # BM25 score of impact 255
+    built_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class DocStats(Base):
     """Document statistics for BM25 calculation"""
     __tablename__ = "doc_stats"
     
     id = Column(Integer, primary_key=True)
     total_docs = Column(Integer, default=0)
+    total_length = Column(BigInteger, default=0)  # Running sum of doc_length, adjusted by deltas
     avg_doc_length = Column(Float, default=0.0)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,100 @@
+"""
+Compact binary codec for posting positions
+
+Positions are sorted token offsets, so they are stored as gaps (first
+position, then differences) with each gap written as an unsigned LEB128
+varint: 7 payload bits per byte, high bit set on every byte except the
+last. Typical gaps fit in one byte, against ~3-4 bytes per position as
+JSON text or 4 bytes (+ array header) as INTEGER[].
+
+Encoding and decoding are vectorized with NumPy so phrase and proximity
+checks can run over many posting lists without a Python loop per byte.
+The plain varint helpers are shared with the block-packed posting layout
+(see posting_blocks.py).
+"""
+from typing import Iterable, List, Sequence
+import numpy as np
+
+
+def encode(positions: Iterable[int]) -> bytes:
+    """Encode sorted positions as delta varints"""
+    positions = np.fromiter(positions, dtype=np.int64)
+    gaps = np.diff(positions, prepend=0)
+    if (gaps < 0).any():
+        raise ValueError("positions must be sorted")
+    return encode_varints(gaps)
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """Encode non-negative integers as consecutive LEB128 varints"""
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) == 0:
+        return b""
+    # 每个值占用的字节数：每 7 位一个字节
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 63, 7):
+        sizes += values >= (1 << shift)
+    starts = np.cumsum(sizes) - sizes
+
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max())):
+        mask = sizes > k
+        byte = (values[mask] >> (7 * k)) & 0x7F
+        byte |= np.where(sizes[mask] > k + 1, 0x80, 0)
+        out[starts[mask] + k] = byte
+    return out.tobytes()
+
+
+def decode(data: bytes) -> np.ndarray:
+    """Decode delta varints into an int64 array of positions"""
+    return np.cumsum(decode_varints(data))
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Decode consecutive LEB128 varints into an int64 array"""
+    if not data:
+        return np.empty(0, dtype=np.int64)
+    raw = np.frombuffer(data, dtype=np.uint8)
+
+    # 每个 varint 的最后一个字节最高位为 0
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # 字节在所属 varint 中的序号 -> 左移位数
+    index_in_group = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    payload = (raw & 0x7F).astype(np.int64) << (7 * index_in_group)
+    return np.add.reduceat(payload, starts)
+
+
+def decode_list(data: bytes) -> List[int]:
+    """Decode into a plain list of ints"""
+    return decode(data).tolist()
+
+
+def phrase_starts(position_lists: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Start positions where the terms occur consecutively (phrase match)
+
+    Args:
+        position_lists: Decoded positions of each phrase term, in phrase order
+    """
+    if not position_lists:
+        return np.empty(0, dtype=np.int64)
+    starts = position_lists[0]
+    for offset, positions in enumerate(position_lists[1:], start=1):
+        starts = np.intersect1d(starts, positions - offset, assume_unique=True)
+        if len(starts) == 0:
+            break
+    return starts
+
+
+def min_distance(a: np.ndarray, b: np.ndarray) -> int:
+    """Smallest |pa - pb| between two sorted position arrays (proximity), -1 if either is empty"""
+    if len(a) == 0 or len(b) == 0:
+        return -1
+    idx = np.searchsorted(b, a)
+    right = b[np.minimum(idx, len(b) - 1)]
+    left = b[np.maximum(idx - 1, 0)]
+    return int(min(np.abs(right - a).min(), np.abs(a - left).min()))
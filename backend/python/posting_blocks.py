@@ -0,0 +1,428 @@
+"""
+Block-packed posting storage (posting_blocks)
+
+An alternative layout of the postings table for BM25: each term owns a few
+rows of up to BLOCKS_PER_ROW fixed-size blocks (BLOCK_SIZE postings each).
+A block is stored as LEB128 varints (see positions_codec):
+
+    doc id gaps (first one absolute) | term frequencies | doc lengths
+
+with per-block metadata arrays alongside the bytes:
+
+    block_last_doc        last doc id in the block (skip index)
+    block_max_tf          max term frequency in the block
+    block_min_doc_length  min doc length in the block
+    block_offsets         byte offset of each block in data
+
+max tf and min doc length bound the block's maximum BM25 impact under any
+corpus statistics, so block maxima never go stale when doc_stats moves.
+
+A term's whole posting list is read with one query and only the blocks
+that can still reach the top-k are decoded.
+
+Maintenance: writers mark the terms they touch in posting_blocks_dirty
+(inside their transaction) and a background task repacks dirty terms from
+postings. build_posting_blocks.py does a full rebuild. The same queue
+feeds the impact index (impact_index.py), which is re-quantized for the
+claimed terms in the same transaction.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple, Any, Iterable
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import copy_rows
+from inverted_index import InvertedIndex, BLOCK_SIZE, PRUNING_MIN_POSTINGS
+import positions_codec
+from impact_index import get_impact_index
+
+# Blocks per row: a term with up to 8192 postings fits in a single row
+BLOCKS_PER_ROW = 64
+# Skip-index intervals scored per step of the block-max search
+INTERVAL_BATCH = 64
+
+COLUMNS = [
+    "term_id", "chunk_no", "posting_count",
+    "block_last_doc", "block_max_tf", "block_min_doc_length", "block_offsets", "data",
+]
+
+
+def pack_term(doc_ids: np.ndarray, tfs: np.ndarray, doc_lengths: np.ndarray) -> List[Tuple]:
+    """
+    Pack one term's postings (sorted by doc id) into rows
+
+    Returns:
+        [(chunk_no, posting_count, last_docs, max_tfs, min_doc_lengths, offsets, data)]
+    """
+    rows = []
+    row_size = BLOCK_SIZE * BLOCKS_PER_ROW
+    for chunk_no, row_start in enumerate(range(0, len(doc_ids), row_size)):
+        last_docs, max_tfs, min_lengths, offsets, parts = [], [], [], [], []
+        size = 0
+        for start in range(row_start, min(row_start + row_size, len(doc_ids)), BLOCK_SIZE):
+            docs = doc_ids[start:start + BLOCK_SIZE]
+            tf = tfs[start:start + BLOCK_SIZE]
+            dl = doc_lengths[start:start + BLOCK_SIZE]
+            encoded = positions_codec.encode_varints(np.concatenate((np.diff(docs, prepend=0), tf, dl)))
+            last_docs.append(int(docs[-1]))
+            max_tfs.append(int(tf.max()))
+            min_lengths.append(int(dl.min()))
+            offsets.append(size)
+            parts.append(encoded)
+            size += len(encoded)
+        count = min(row_size, len(doc_ids) - row_start)
+        rows.append((chunk_no, count, last_docs, max_tfs, min_lengths, offsets, b"".join(parts)))
+    return rows
+
+
+class TermBlocks:
+    """One query term's packed posting list, decoded block by block on demand"""
+
+    def __init__(self, rows: List[Any]):
+        self.count = sum(row.posting_count for row in rows)
+        self.last_doc = np.concatenate([np.asarray(row.block_last_doc, dtype=np.int64) for row in rows])
+        self.max_tf = np.concatenate([np.asarray(row.block_max_tf, dtype=np.int64) for row in rows])
+        self.min_doc_length = np.concatenate([np.asarray(row.block_min_doc_length, dtype=np.int64) for row in rows])
+
+        # 每块的字节和posting数量；解码结果写入按posting排列的数组
+        self._slices = []
+        sizes = []
+        for row in rows:
+            data = bytes(row.data)
+            ends = list(row.block_offsets[1:]) + [len(data)]
+            for i, (start, end) in enumerate(zip(row.block_offsets, ends)):
+                self._slices.append(data[start:end])
+                sizes.append(min(BLOCK_SIZE, row.posting_count - i * BLOCK_SIZE))
+        self._sizes = np.array(sizes, dtype=np.int64)
+        self._starts = np.cumsum(self._sizes) - self._sizes
+        self._decoded = np.zeros(len(sizes), dtype=bool)
+        self._docs = np.empty(self.count, dtype=np.int64)
+        self._tfs = np.empty(self.count, dtype=np.int64)
+        self._lengths = np.empty(self.count, dtype=np.int64)
+        self.idf = 0.0
+        self.block_ub = np.empty(0)
+
+    @property
+    def blocks_decoded(self) -> int:
+        return int(self._decoded.sum())
+
+    def _posting_index(self, block_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Posting offsets covered by the blocks, and each one's offset within its block"""
+        sizes = self._sizes[block_ids]
+        local = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return np.repeat(self._starts[block_ids], sizes) + local, local
+
+    def decode(self, block_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(doc ids, tfs, doc lengths) of the given blocks, in block order"""
+        block_ids = np.asarray(block_ids, dtype=np.int64)
+        missing = block_ids[~self._decoded[block_ids]]
+        if len(missing):
+            # 所有缺失块的字节拼接后一次解码；每块依次为 n 个文档ID差值、n 个词频、n 个文档长度
+            values = positions_codec.decode_varints(b"".join(self._slices[i] for i in missing))
+            sizes = self._sizes[missing]
+            target, local = self._posting_index(missing)
+            gap_at = np.repeat(3 * (np.cumsum(sizes) - sizes), sizes) + local
+            block_n = np.repeat(sizes, sizes)
+
+            # 分段前缀和：每块第一个差值是绝对文档ID
+            sums = np.cumsum(values[gap_at])
+            block_first = np.cumsum(sizes) - sizes
+            base = np.where(block_first > 0, sums[block_first - 1], 0)
+            self._docs[target] = sums - np.repeat(base, sizes)
+            self._tfs[target] = values[gap_at + block_n]
+            self._lengths[target] = values[gap_at + 2 * block_n]
+            self._decoded[missing] = True
+
+        index, _ = self._posting_index(block_ids)
+        return self._docs[index], self._tfs[index], self._lengths[index]
+
+
+class PostingBlockStore:
+    """Reads, searches and maintains the posting_blocks table"""
+
+    def __init__(self):
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.refreshed_terms = 0
+        self.last_refresh: Optional[float] = None
+        self.last_search: Optional[Dict[str, int]] = None
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    async def mark_dirty(self, session: AsyncSession, term_ids: Iterable[int]):
+        """
+        Queue terms for repacking (inside the writer's transaction)
+
+        DO UPDATE locks an already queued row until the writer commits, so
+        the refresher (SKIP LOCKED) cannot claim it before the new postings
+        are visible.
+        """
+        if not (settings.POSTING_BLOCKS_ENABLED or settings.IMPACT_INDEX_ENABLED):
+            return
+        term_ids = sorted(set(term_ids))
+        if not term_ids:
+            return
+        await session.execute(text("""
+            INSERT INTO posting_blocks_dirty (term_id)
+            SELECT unnest(CAST(:term_ids AS integer[]))
+            ON CONFLICT (term_id) DO UPDATE SET marked_at = CURRENT_TIMESTAMP
+        """), {"term_ids": term_ids})
+
+    async def rebuild_terms(self, session: AsyncSession, term_ids: List[int]) -> int:
+        """
+        Repack the given terms from postings (caller commits)
+
+        Returns the number of postings packed.
+        """
+        if not term_ids:
+            return 0
+        # 重建互斥（后台刷新与 build_posting_blocks.py 可能同时运行）
+        await session.execute(text("SELECT pg_advisory_xact_lock(hashtext('posting_blocks'))"))
+        result = await session.execute(text("""
+            SELECT p.term_id, p.document_id, p.term_frequency, d.doc_length
+            FROM postings p
+            JOIN documents d ON d.id = p.document_id
+            WHERE p.term_id = ANY(:term_ids) AND d.doc_length > 0
+            ORDER BY p.term_id, p.document_id
+        """), {"term_ids": list(term_ids)})
+        rows = np.array([tuple(row) for row in result], dtype=np.int64).reshape(-1, 4)
+
+        await session.execute(
+            text("DELETE FROM posting_blocks WHERE term_id = ANY(:term_ids)"),
+            {"term_ids": list(term_ids)}
+        )
+        if len(rows) == 0:
+            return 0
+
+        packed = []
+        bounds = np.flatnonzero(np.diff(rows[:, 0])) + 1
+        for block in np.split(rows, bounds):
+            term_id = int(block[0, 0])
+            for chunk in pack_term(block[:, 1], block[:, 2], block[:, 3]):
+                chunk_no, count, last_docs, max_tfs, min_lengths, offsets, data = chunk
+                packed.append((
+                    term_id, chunk_no, count,
+                    self._int_array(last_docs), self._int_array(max_tfs),
+                    self._int_array(min_lengths), self._int_array(offsets),
+                    "\\x" + data.hex()
+                ))
+        await copy_rows(session, "posting_blocks", COLUMNS, packed)
+        return len(rows)
+
+    @staticmethod
+    def _int_array(values: List[int]) -> str:
+        return "{" + ",".join(map(str, values)) + "}"
+
+    async def refresh_dirty(self, session: AsyncSession, limit: int = 5000) -> int:
+        """Claim up to limit dirty terms, repack / re-quantize them and commit; returns terms refreshed"""
+        result = await session.execute(text("""
+            DELETE FROM posting_blocks_dirty
+            WHERE term_id IN (
+                SELECT term_id FROM posting_blocks_dirty
+                ORDER BY term_id
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING term_id
+        """), {"limit": limit})
+        term_ids = sorted(row.term_id for row in result)
+        if settings.POSTING_BLOCKS_ENABLED:
+            await self.rebuild_terms(session, term_ids)
+        if settings.IMPACT_INDEX_ENABLED:
+            await get_impact_index().rebuild_terms(session, term_ids)
+        await session.commit()
+        self.refreshed_terms += len(term_ids)
+        self.last_refresh = time.time()
+        return len(term_ids)
+
+    def start_refresh(self, session_factory, interval: Optional[int] = None):
+        """Start the periodic background repacking of dirty terms"""
+        interval = interval or settings.POSTING_BLOCKS_REFRESH_INTERVAL
+
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    while True:
+                        async with session_factory() as session:
+                            if not await self.refresh_dirty(session):
+                                break
+                except Exception as e:
+                    print(f"⚠ Posting block refresh failed: {e}")
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(_loop())
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    async def fetch(self, tokens: List[str], session: AsyncSession) -> List[TermBlocks]:
+        """Read the packed posting lists of the query terms (one query)"""
+        result = await session.execute(text("""
+            SELECT b.term_id, b.chunk_no, b.posting_count,
+                   b.block_last_doc, b.block_max_tf, b.block_min_doc_length, b.block_offsets, b.data
+            FROM terms t
+            JOIN posting_blocks b ON b.term_id = t.id
+            WHERE t.term = ANY(:tokens)
+            ORDER BY b.term_id, b.chunk_no
+        """), {"tokens": list(set(tokens))})
+
+        by_term: Dict[int, List[Any]] = {}
+        for row in result:
+            by_term.setdefault(row.term_id, []).append(row)
+        return [TermBlocks(rows) for rows in by_term.values()]
+
+    async def search_bm25(
+        self,
+        tokens: List[str],
+        session: AsyncSession,
+        top_k: int,
+        total_docs: int,
+        avg_doc_length: float,
+        k1: float = 1.5,
+        b: float = 0.75
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k BM25 over posting_blocks with block skipping
+
+        The union of all block boundaries splits the doc id space into
+        intervals; each interval lies inside exactly one block per term, so
+        the sum of those blocks' maxima bounds every document in it.
+        Intervals are scored best bound first, and the search stops once
+        no remaining interval can beat the current k-th score. Blocks are
+        only decoded when an interval that needs them is scored.
+        """
+        if total_docs == 0 or avg_doc_length == 0 or top_k <= 0:
+            return []
+        terms = await self.fetch(tokens, session)
+        return self.score(terms, top_k, total_docs, avg_doc_length, k1, b)
+
+    def score(
+        self,
+        terms: List[TermBlocks],
+        top_k: int,
+        total_docs: int,
+        avg_doc_length: float,
+        k1: float = 1.5,
+        b: float = 0.75
+    ) -> List[Tuple[int, float]]:
+        """Block-skipping top-k over already fetched terms (see search_bm25)"""
+        if not terms or top_k <= 0:
+            return []
+
+        for term in terms:
+            df = term.count
+            term.idf = float(np.log((total_docs - df + 0.5) / (df + 0.5) + 1.0))
+            term.block_ub = InvertedIndex._impact(
+                term.idf, term.max_tf, term.min_doc_length, avg_doc_length, k1, b
+            )
+
+        def term_impacts(term: TermBlocks, block_ids) -> Tuple[np.ndarray, np.ndarray]:
+            docs, tf, dl = term.decode(block_ids)
+            return docs, InvertedIndex._impact(term.idf, tf, dl, avg_doc_length, k1, b)
+
+        # 小查询直接全部解码打分
+        if sum(term.count for term in terms) <= PRUNING_MIN_POSTINGS:
+            parts = [term_impacts(term, range(len(term.last_doc))) for term in terms]
+            doc_ids, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts]))
+            self._record(terms, 0, 0)
+            return InvertedIndex._top_k(doc_ids, totals, top_k)
+
+        bounds = np.unique(np.concatenate([term.last_doc for term in terms]))
+        interval_ub = np.zeros(len(bounds))
+        term_blocks = []  # 每个区间落在该词的哪个块（-1 表示该词在此区间之后已无posting）
+        for term in terms:
+            blk = np.searchsorted(term.last_doc, bounds, side="left")
+            valid = blk < len(term.last_doc)
+            interval_ub[valid] += term.block_ub[blk[valid]]
+            term_blocks.append(np.where(valid, blk, -1))
+
+        order = np.argsort(-interval_ub, kind="stable")
+        best_docs = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        threshold = 0.0
+        scored = 0
+        for start in range(0, len(order), INTERVAL_BATCH):
+            batch = order[start:start + INTERVAL_BATCH]
+            if len(best_scores) >= top_k:
+                batch = batch[interval_ub[batch] > threshold]
+                if len(batch) == 0:
+                    break
+            scored += len(batch)
+            selected = np.zeros(len(bounds), dtype=bool)
+            selected[batch] = True
+
+            doc_chunks, score_chunks = [], []
+            for term, blk in zip(terms, term_blocks):
+                block_ids = np.unique(blk[batch])
+                block_ids = block_ids[block_ids >= 0]
+                if len(block_ids) == 0:
+                    continue
+                docs, impacts = term_impacts(term, block_ids)
+                # 只保留落在本批区间内的文档（其余区间单独打分）
+                keep = selected[np.searchsorted(bounds, docs)]
+                doc_chunks.append(docs[keep])
+                score_chunks.append(impacts[keep])
+            if not doc_chunks:
+                continue
+
+            doc_ids, inverse = np.unique(np.concatenate(doc_chunks), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(score_chunks))
+            best_docs = np.concatenate((best_docs, doc_ids))
+            best_scores = np.concatenate((best_scores, totals))
+            if len(best_scores) > top_k:
+                top = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_docs, best_scores = best_docs[top], best_scores[top]
+            if len(best_scores) >= top_k:
+                threshold = float(best_scores.min())
+
+        self._record(terms, len(bounds), scored)
+        return InvertedIndex._top_k(best_docs, best_scores, top_k)
+
+    def _record(self, terms: List[TermBlocks], intervals: int, scored: int):
+        self.last_search = {
+            "terms": len(terms),
+            "postings": sum(term.count for term in terms),
+            "blocks": sum(len(term.last_doc) for term in terms),
+            "blocks_decoded": sum(term.blocks_decoded for term in terms),
+            "intervals": intervals,
+            "intervals_scored": scored,
+        }
+
+    async def get_stats(self, session: AsyncSession) -> Dict[str, Any]:
+        """Table size, refresh backlog and the last search's skipping counters"""
+        row = (await session.execute(text("""
+            SELECT
+                (SELECT COUNT(*) FROM posting_blocks) AS rows,
+                (SELECT COUNT(DISTINCT term_id) FROM posting_blocks) AS terms,
+                (SELECT COALESCE(SUM(posting_count), 0) FROM posting_blocks) AS postings,
+                (SELECT COUNT(*) FROM posting_blocks_dirty) AS dirty_terms,
+                pg_total_relation_size('posting_blocks') AS total_bytes
+        """))).first()
+        return {
+            "enabled": settings.POSTING_BLOCKS_ENABLED,
+            "rows": row.rows,
+            "terms": row.terms,
+            "postings": int(row.postings),
+            "dirty_terms": row.dirty_terms,
+            "total_bytes": row.total_bytes,
+            "refreshed_terms": self.refreshed_terms,
+            "last_refresh": self.last_refresh,
+            "last_search": self.last_search,
+        }
+
+
+# Global posting block store instance
+posting_block_store = None
+
+def get_posting_block_store() -> PostingBlockStore:
+    """Get or create posting block store singleton"""
+    global posting_block_store
+    if posting_block_store is None:
+        posting_block_store = PostingBlockStore()
+    return posting_block_store
@@ -1,7 +1,16 @@
-from typing import List, Dict
+import asyncio
+import json
+from typing import List, Dict, Tuple, Optional
 from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import copy_rows
+import positions_codec
 from tokenizer_service import get_tokenizer_service
+from inverted_index import get_inverted_index
+from term_dictionary import get_term_dictionary
+from doc_stats_service import get_doc_stats_service
+from posting_blocks import get_posting_block_store
 
 class PostingListManager:
     """
@@ -11,6 +20,12 @@ class PostingListManager:
     
     def __init__(self):
         self.tokenizer = get_tokenizer_service()
+        self.inverted_index = get_inverted_index()
+        self.term_dictionary = get_term_dictionary()
+        self.doc_stats = get_doc_stats_service()
+        self.block_store = get_posting_block_store()
+        self._positions_type: Optional[str] = None  # postings.positions 列类型（bytea，迁移前为 JSON / INTEGER[]）
+        self._cleanup_task: Optional[asyncio.Task] = None
     
     async def build_posting_list(
         self,
@@ -32,189 +47,380 @@ class PostingListManager:
         full_text = f"{title} {content}"
         tokens = self.tokenizer.tokenize(full_text, mode="search")
         
-        if not tokens:
+        await self.build_posting_lists([(document_id, tokens)], session)
+    
+    async def build_posting_lists(
+        self,
+        documents: List[Tuple[int, List[str]]],
+        session: AsyncSession
+    ):
+        """
+        批量构建多个文档的 posting list（批量索引路径）
+        
+        - 未缓存的 term 一条语句 upsert（见 TermDictionary）
+        - postings 通过 COPY 批量写入
+        - 文档长度一条语句更新，全局统计每批只更新一次
+        
+        Args:
+            documents: [(document_id, tokens)]，tokens 为已分词结果
+            session: 数据库会话
+        """
+        per_doc = []  # [(document_id, doc_length, term_stats)]
+        all_terms = set()
+        for document_id, tokens in documents:
+            if not tokens:
+                continue
+            term_stats = self._term_stats(tokens)
+            per_doc.append((document_id, len(tokens), term_stats))
+            all_terms.update(term_stats)
+        
+        if not per_doc:
             return
         
-        # 计算词频和位置
-        term_stats = {}  # {term: {"tf": count, "positions": [pos1, pos2, ...]}}
+        term_ids = await self.term_dictionary.resolve(all_terms, session)
+        
+        # 更新文档长度（返回旧长度，用于增量更新全局统计）
+        doc_delta, length_delta = await self._set_doc_lengths(
+            session,
+            {document_id: doc_length for document_id, doc_length, _ in per_doc}
+        )
+        
+        # COPY postings
+        await self._copy_postings(session, (
+            (term_ids[term], document_id, stats["tf"], doc_length, stats["positions"])
+            for document_id, doc_length, term_stats in per_doc
+            for term, stats in term_stats.items()
+        ))
+        
+        # 增量更新 term 统计（只涉及本批文档包含的 term）
+        term_deltas: Dict[int, List[int]] = {}  # term_id -> [df, tf]
+        for _, _, term_stats in per_doc:
+            for term, stats in term_stats.items():
+                delta = term_deltas.setdefault(term_ids[term], [0, 0])
+                delta[0] += 1
+                delta[1] += stats["tf"]
+        await self._apply_term_deltas(session, term_deltas)
+        await self.block_store.mark_dirty(session, term_deltas)
+        
+        # 增量更新全局统计（每批一次）
+        await self.doc_stats.apply_delta(session, doc_delta, length_delta)
+        
+        # 事务提交后更新内存倒排索引
+        for document_id, doc_length, term_stats in per_doc:
+            indexed_terms = {
+                term: (term_ids[term], stats["tf"])
+                for term, stats in term_stats.items()
+            }
+            self.inverted_index.stage_add(session, document_id, indexed_terms, doc_length)
+    
+    async def update_posting_list(
+        self,
+        document_id: int,
+        title: str,
+        content: str,
+        session: AsyncSession
+    ) -> Dict[str, int]:
+        """
+        差量更新已存在文档的 posting list（重新索引路径）
+        
+        与旧 posting 比较，只删除消失的 term、只重写词频或位置变化的 posting、
+        只插入新出现的 term；term 统计和全局统计按差值调整。
+        
+        Returns:
+            {"added", "changed", "removed", "unchanged"} posting 数量
+        """
+        full_text = f"{title} {content}"
+        tokens = self.tokenizer.tokenize(full_text, mode="search")
+        new_stats = self._term_stats(tokens)
+        
+        result = await session.execute(text("""
+            SELECT p.term_id, t.term, p.term_frequency, p.positions
+            FROM postings p
+            JOIN terms t ON t.id = p.term_id
+            WHERE p.document_id = :document_id
+        """), {"document_id": document_id})
+        old = {row.term: (row.term_id, row.term_frequency, row.positions) for row in result}
+        
+        removed = {term: entry for term, entry in old.items() if term not in new_stats}
+        changed, unchanged = {}, 0
+        for term, (term_id, tf, positions) in old.items():
+            stats = new_stats.get(term)
+            if stats is None:
+                continue
+            if stats["tf"] != tf or stats["positions"] != self._decode_positions(positions):
+                changed[term] = term_id
+            else:
+                unchanged += 1
+        added = [term for term in new_stats if term not in old]
+        
+        term_ids = {term: entry[0] for term, entry in old.items() if term in new_stats}
+        if added:
+            term_ids.update(await self.term_dictionary.resolve(added, session))
+        
+        # term 统计差值：消失的 term 扣减，变化的按词频差调整，新 term 增加
+        term_deltas: Dict[int, List[int]] = {}
+        for term, (term_id, tf, _) in removed.items():
+            term_deltas[term_id] = [-1, -tf]
+        for term, term_id in changed.items():
+            term_deltas[term_id] = [0, new_stats[term]["tf"] - old[term][1]]
+        for term in added:
+            term_deltas[term_ids[term]] = [1, new_stats[term]["tf"]]
+        
+        stale_ids = [entry[0] for entry in removed.values()] + list(changed.values())
+        if stale_ids:
+            await self._lock_terms(session, sorted(set(stale_ids) | set(term_deltas)))
+            await session.execute(text("""
+                DELETE FROM postings
+                WHERE document_id = :document_id AND term_id = ANY(:term_ids)
+            """), {"document_id": document_id, "term_ids": stale_ids})
+        
+        await self._copy_postings(session, (
+            (term_ids[term], document_id, new_stats[term]["tf"], len(tokens), new_stats[term]["positions"])
+            for term in list(changed) + added
+        ))
+        await self._apply_term_deltas(session, term_deltas)
+        
+        doc_delta, length_delta = await self._set_doc_lengths(session, {document_id: len(tokens)})
+        await self.doc_stats.apply_delta(session, doc_delta, length_delta)
         
+        # 未改写的 posting 也带有文档长度（BM25 不再连接 documents）
+        if doc_delta or length_delta:
+            await session.execute(text("""
+                UPDATE postings SET doc_length = :doc_length
+                WHERE document_id = :document_id AND doc_length IS DISTINCT FROM :doc_length
+            """), {"document_id": document_id, "doc_length": len(tokens)})
+        
+        # 打包的 posting 块带有文档长度：长度变化时该文档的所有 term 都要重新打包
+        if doc_delta or length_delta:
+            await self.block_store.mark_dirty(session, list(term_deltas) + list(term_ids.values()))
+        else:
+            await self.block_store.mark_dirty(session, term_deltas)
+        
+        # 事务提交后更新内存倒排索引（整篇替换）
+        if tokens:
+            indexed_terms = {
+                term: (term_ids[term], stats["tf"])
+                for term, stats in new_stats.items()
+            }
+            self.inverted_index.stage_add(session, document_id, indexed_terms, len(tokens))
+        else:
+            self.inverted_index.stage_remove(session, document_id)
+        
+        return {
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+            "unchanged": unchanged,
+        }
+    
+    async def _set_doc_lengths(self, session: AsyncSession, lengths: Dict[int, int]) -> Tuple[int, int]:
+        """
+        更新文档长度，返回全局统计的增量 (doc_delta, length_delta)
+        
+        旧长度通过自连接在同一条语句中取回
+        """
+        result = await session.execute(text("""
+            UPDATE documents AS d
+            SET doc_length = v.doc_length, updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT unnest(CAST(:ids AS integer[])) AS id,
+                       unnest(CAST(:lengths AS integer[])) AS doc_length
+            ) AS v, documents AS old
+            WHERE d.id = v.id AND old.id = v.id
+            RETURNING v.doc_length AS new_length, COALESCE(old.doc_length, 0) AS old_length
+        """), {
+            "ids": list(lengths),
+            "lengths": list(lengths.values())
+        })
+        doc_delta, length_delta = 0, 0
+        for row in result:
+            doc_delta += (row.new_length > 0) - (row.old_length > 0)
+            length_delta += row.new_length - row.old_length
+        return doc_delta, length_delta
+    
+    async def _copy_postings(self, session: AsyncSession, rows):
+        """COPY (term_id, document_id, term_frequency, doc_length, positions) 行到 postings"""
+        # term id 由 TermDictionary.resolve 在本事务中锁定，孤立 term 清理不会删掉它们
+        format_positions = await self._positions_formatter(session)
+        await copy_rows(
+            session,
+            "postings",
+            ["term_id", "document_id", "term_frequency", "doc_length", "positions"],
+            (
+                (term_id, document_id, tf, doc_length, format_positions(positions))
+                for term_id, document_id, tf, doc_length, positions in rows
+            )
+        )
+    
+    async def _apply_term_deltas(self, session: AsyncSession, term_deltas: Dict[int, List[int]]):
+        """按 {term_id: [df_delta, tf_delta]} 调整 term 统计（一条语句）"""
+        if not term_deltas:
+            return
+        term_id_list = sorted(term_deltas)
+        await self._lock_terms(session, term_id_list)
+        await session.execute(text("""
+            UPDATE terms AS t
+            SET doc_frequency = GREATEST(t.doc_frequency + v.df, 0),
+                total_frequency = GREATEST(t.total_frequency + v.tf, 0)
+            FROM (
+                SELECT unnest(CAST(:term_ids AS integer[])) AS term_id,
+                       unnest(CAST(:dfs AS integer[])) AS df,
+                       unnest(CAST(:tfs AS bigint[])) AS tf
+            ) AS v
+            WHERE t.id = v.term_id
+        """), {
+            "term_ids": term_id_list,
+            "dfs": [term_deltas[term_id][0] for term_id in term_id_list],
+            "tfs": [term_deltas[term_id][1] for term_id in term_id_list]
+        })
+    
+    @staticmethod
+    def _decode_positions(positions) -> Optional[List[int]]:
+        """读取 positions 列（BYTEA 为编码字节，INTEGER[] 为 list，JSON 为字符串）"""
+        if isinstance(positions, (bytes, memoryview)):
+            return positions_codec.decode_list(bytes(positions))
+        if isinstance(positions, str):
+            return json.loads(positions)
+        return list(positions) if positions is not None else None
+    
+    @staticmethod
+    def _term_stats(tokens: List[str]) -> Dict[str, Dict]:
+        """计算词频和位置: {term: {"tf": count, "positions": [pos1, pos2, ...]}}"""
+        term_stats = {}
         for pos, token in enumerate(tokens):
             if token not in term_stats:
                 term_stats[token] = {"tf": 0, "positions": []}
             term_stats[token]["tf"] += 1
             term_stats[token]["positions"].append(pos)
+        return term_stats
+    
+    async def _positions_formatter(self, session: AsyncSession):
+        """
+        postings.positions 的 COPY 文本格式
         
-        # 更新文档长度
-        doc_length = len(tokens)
-        update_doc_query = text("""
-            UPDATE documents SET doc_length = :doc_length WHERE id = :doc_id
-        """)
-        await session.execute(update_doc_query, {
-            "doc_length": doc_length,
-            "doc_id": document_id
-        })
-        
-        # 为每个词创建或更新term，并创建posting
-        for term, stats in term_stats.items():
-            # 获取或创建term
-            term_id = await self._get_or_create_term(term, session)
-            
-            # 创建posting
-            await self._create_posting(
-                term_id=term_id,
-                document_id=document_id,
-                term_frequency=stats["tf"],
-                positions=stats["positions"],
-                session=session
-            )
+        BYTEA 写入 delta varint 编码（见 positions_codec）；尚未运行
+        migrate_positions.py 的旧库（INTEGER[] / JSON）按原格式写入
+        """
+        if self._positions_type is None:
+            result = await session.execute(text("""
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'postings' AND column_name = 'positions'
+            """))
+            self._positions_type = result.scalar()
         
-        # 更新文档统计信息
-        await self._update_doc_stats(session)
+        if self._positions_type == "bytea":
+            return lambda positions: "\\x" + positions_codec.encode(positions).hex()
+        if self._positions_type == "ARRAY":
+            return lambda positions: "{" + ",".join(map(str, positions)) + "}"
+        return json.dumps
     
-    async def _get_or_create_term(self, term: str, session: AsyncSession) -> int:
+    async def _lock_terms(self, session: AsyncSession, term_ids: List[int]):
         """
-        获取或创建term，返回term_id
+        按 id 顺序锁定 terms 行，并发事务以相同顺序加锁，避免死锁
         
-        使用 ON CONFLICT DO NOTHING 避免并发插入同一个 term 时的死锁
+        FOR NO KEY UPDATE 不与 resolve / posting 外键检查持有的 FOR KEY SHARE 冲突
+        （两个事务都持有 KEY SHARE 后再升级为 FOR UPDATE 会互相等待）
         """
-        # 方案：先尝试插入，如果冲突则查询
-        # 这样避免了 SELECT-then-INSERT 的竞态条件
-        
-        insert_query = text("""
-            INSERT INTO terms (term, doc_frequency, total_frequency)
-            VALUES (:term, 0, 0)
-            ON CONFLICT (term) DO NOTHING
-            RETURNING id
-        """)
-        
-        result = await session.execute(insert_query, {"term": term})
-        await session.flush()  # 确保插入完成
-        row = result.first()
-        
-        if row:
-            # 插入成功，返回新 ID
-            return row[0]
-        
-        # 插入冲突（term 已存在），查询现有 ID
-        select_query = text("SELECT id FROM terms WHERE term = :term")
-        result = await session.execute(select_query, {"term": term})
-        row = result.first()
-        
-        if row:
-            return row[0]
-        
-        # 理论上不应该到这里，但以防万一
-        raise Exception(f"Failed to get or create term: {term}")
+        if term_ids:
+            await session.execute(text("""
+                SELECT id FROM terms WHERE id = ANY(:term_ids) ORDER BY id FOR NO KEY UPDATE
+            """), {"term_ids": term_ids})
     
-    async def _create_posting(
-        self,
-        term_id: int,
-        document_id: int,
-        term_frequency: int,
-        positions: List[int],
-        session: AsyncSession
-    ):
-        """创建posting记录"""
-        import json
-        
-        # 插入posting
-        insert_query = text("""
-            INSERT INTO postings (term_id, document_id, term_frequency, positions)
-            VALUES (:term_id, :document_id, :term_frequency, :positions)
-            ON CONFLICT (term_id, document_id) 
-            DO UPDATE SET term_frequency = :term_frequency, positions = :positions
-        """)
-        await session.execute(insert_query, {
-            "term_id": term_id,
-            "document_id": document_id,
-            "term_frequency": term_frequency,
-            "positions": json.dumps(positions)  # 转换为 JSON 字符串
-        })
+    async def cleanup_orphan_terms(self, session: AsyncSession) -> int:
+        """
+        删除没有任何 posting 的孤立 terms（后台任务）
         
-        # ========== 移除实时统计更新，避免死锁 ==========
-        # 统计信息将通过独立的后台任务定期批量更新
-        # 见: backend/python/update_term_stats.py
-        # 
-        # 原代码（已注释，避免死锁）：
-        # update_df_query = text("""
-        #     UPDATE terms 
-        #     SET doc_frequency = (
-        #         SELECT COUNT(DISTINCT document_id) 
-        #         FROM postings 
-        #         WHERE term_id = :term_id
-        #     ),
-        #     total_frequency = (
-        #         SELECT COALESCE(SUM(term_frequency), 0)
-        #         FROM postings
-        #         WHERE term_id = :term_id
-        #     )
-        #     WHERE id = :term_id
-        # """)
-        # await session.execute(update_df_query, {"term_id": term_id})
+        SKIP LOCKED 跳过正被写入事务引用的 term，返回删除数量
+        """
+        result = await session.execute(text("""
+            DELETE FROM terms
+            WHERE id IN (
+                SELECT t.id FROM terms t
+                WHERE t.doc_frequency = 0
+                  AND NOT EXISTS (SELECT 1 FROM postings p WHERE p.term_id = t.id)
+                FOR UPDATE SKIP LOCKED
+            )
+            -- NOT EXISTS 基于语句快照；快照之后提交的写入方同时增加了 doc_frequency，
+            -- READ COMMITTED 会用最新行版本重新检查这个条件，不会删掉刚被引用的 term
+            AND doc_frequency = 0
+            RETURNING term
+        """))
+        deleted = [row.term for row in result]
+        await session.commit()
+        self.term_dictionary.discard(deleted)
+        return len(deleted)
     
-    async def _update_doc_stats(self, session: AsyncSession):
-        """更新全局文档统计信息"""
-        # 计算总文档数和平均文档长度
-        stats_query = text("""
-            SELECT 
-                COUNT(*) as total_docs,
-                COALESCE(AVG(doc_length), 0) as avg_doc_length
-            FROM documents
-            WHERE doc_length > 0
-        """)
-        result = await session.execute(stats_query)
-        row = result.first()
-        
-        if row:
-            total_docs, avg_doc_length = row[0], row[1]
-            
-            # 更新doc_stats表
-            update_query = text("""
-                INSERT INTO doc_stats (id, total_docs, avg_doc_length, updated_at)
-                VALUES (1, :total_docs, :avg_doc_length, CURRENT_TIMESTAMP)
-                ON CONFLICT (id) 
-                DO UPDATE SET 
-                    total_docs = :total_docs,
-                    avg_doc_length = :avg_doc_length,
-                    updated_at = CURRENT_TIMESTAMP
-            """)
-            await session.execute(update_query, {
-                "total_docs": total_docs,
-                "avg_doc_length": avg_doc_length
-            })
+    def start_orphan_cleanup(self, session_factory, interval: Optional[int] = None):
+        """Start the periodic orphan-term cleanup task"""
+        interval = interval or settings.ORPHAN_TERM_CLEANUP_INTERVAL
+        
+        async def _loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    async with session_factory() as session:
+                        deleted = await self.cleanup_orphan_terms(session)
+                    if deleted:
+                        print(f"🧹 Removed {deleted} orphan terms")
+                except Exception as e:
+                    print(f"⚠ Orphan term cleanup failed: {e}")
+        
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(_loop())
     
     async def delete_posting_list(self, document_id: int, session: AsyncSession):
         """删除文档的posting list"""
-        # 删除posting记录
-        delete_postings_query = text("""
-            DELETE FROM postings WHERE document_id = :document_id
-        """)
-        await session.execute(delete_postings_query, {"document_id": document_id})
-        
-        # 更新所有受影响的terms的统计信息
-        update_terms_query = text("""
-            UPDATE terms
-            SET doc_frequency = (
-                SELECT COUNT(DISTINCT document_id)
-                FROM postings
-                WHERE term_id = terms.id
+        await self.delete_posting_lists([document_id], session)
+    
+    async def delete_posting_lists(self, document_ids: List[int], session: AsyncSession):
+        """批量删除多个文档的posting list（统计信息只更新一次）"""
+        if not document_ids:
+            return
+        
+        # 先按 id 顺序锁定受影响的 terms，避免并发事务交叉加锁死锁
+        await session.execute(text("""
+            SELECT id FROM terms
+            WHERE id IN (SELECT term_id FROM postings WHERE document_id = ANY(:document_ids))
+            ORDER BY id
+            FOR NO KEY UPDATE
+        """), {"document_ids": list(document_ids)})
+        
+        # 删除posting记录，并按旧posting扣减这些 term 的统计
+        # （孤立 term 由后台 cleanup_orphan_terms 清理）
+        result = await session.execute(text("""
+            WITH removed AS (
+                DELETE FROM postings
+                WHERE document_id = ANY(:document_ids)
+                RETURNING term_id, term_frequency
             ),
-            total_frequency = (
-                SELECT COALESCE(SUM(term_frequency), 0)
-                FROM postings
-                WHERE term_id = terms.id
+            delta AS (
+                SELECT term_id, COUNT(*) AS df, SUM(term_frequency) AS tf
+                FROM removed
+                GROUP BY term_id
             )
-        """)
-        await session.execute(update_terms_query)
+            UPDATE terms AS t
+            SET doc_frequency = GREATEST(t.doc_frequency - delta.df, 0),
+                total_frequency = GREATEST(t.total_frequency - delta.tf, 0)
+            FROM delta
+            WHERE t.id = delta.term_id
+            RETURNING t.id
+        """), {"document_ids": list(document_ids)})
+        await self.block_store.mark_dirty(session, [row.id for row in result])
         
-        # 删除没有posting的terms
-        cleanup_terms_query = text("""
-            DELETE FROM terms WHERE doc_frequency = 0
-        """)
-        await session.execute(cleanup_terms_query)
+        # 文档长度清零，按旧长度增量更新全局统计
+        result = await session.execute(text("""
+            UPDATE documents AS d
+            SET doc_length = 0
+            FROM documents AS old
+            WHERE d.id = ANY(:document_ids) AND old.id = d.id AND old.doc_length > 0
+            RETURNING old.doc_length AS old_length
+        """), {"document_ids": list(document_ids)})
+        old_lengths = [row.old_length for row in result]
+        await self.doc_stats.apply_delta(session, -len(old_lengths), -sum(old_lengths))
         
-        # 更新文档统计
-        await self._update_doc_stats(session)
+        # 事务提交后从内存倒排索引中移除
+        for document_id in document_ids:
+            self.inverted_index.stage_remove(session, document_id)
 
 # 全局posting list管理器
 posting_list_manager = None
@@ -0,0 +1,125 @@
+"""
+Index-generation-aware search result cache
+
+Caches the fused [(document_id, score), ...] list per (normalized query,
+fusion weights, candidate-pool size). Every key embeds the current index
+generation, a monotonically increasing counter in Redis that IndexService
+bumps after each committed write. A write therefore makes all earlier
+entries unreachable, so the cache never serves results from before it.
+"""
+import hashlib
+import json
+import re
+from typing import Optional, List, Dict, Any
+import redis
+from config import settings
+
+GENERATION_KEY = "verdant:index:generation"
+
+
+class ResultCache:
+    """Redis-backed fused result cache keyed by index generation"""
+
+    def __init__(self):
+        self.enabled = settings.ENABLE_CACHE and settings.ENABLE_RESULT_CACHE
+        self.ttl = settings.RESULT_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self.redis_client = None
+
+        if self.enabled:
+            try:
+                self.redis_client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                    decode_responses=True,
+                    socket_connect_timeout=1,
+                    socket_timeout=0.2
+                )
+                self.redis_client.ping()
+            except Exception as e:
+                print(f"⚠ Result cache: Redis unavailable ({e}), result caching disabled")
+                self.enabled = False
+                self.redis_client = None
+
+    def get_generation(self) -> Optional[int]:
+        """Current index generation (None when the cache is unavailable)"""
+        if not self.enabled:
+            return None
+        try:
+            return int(self.redis_client.get(GENERATION_KEY) or 0)
+        except Exception as e:
+            print(f"Result cache generation read error: {e}")
+            return None
+
+    def bump_generation(self) -> Optional[int]:
+        """Advance the index generation (call after a write has committed)"""
+        if not self.enabled:
+            return None
+        try:
+            return self.redis_client.incr(GENERATION_KEY)
+        except Exception as e:
+            print(f"Result cache generation bump error: {e}")
+            return None
+
+    def _key(self, generation: int, query: str, pool_size: int) -> str:
+        normalized = re.sub(r"\s+", " ", query).strip().lower()
+        content = f"{normalized}|{settings.VECTOR_WEIGHT}|{settings.BM25_WEIGHT}|{pool_size}"
+        digest = hashlib.md5(content.encode("utf-8")).hexdigest()
+        return f"verdant:results:{generation}:{digest}"
+
+    def get(self, query: str, pool_size: int, generation: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """Get cached fused results for the given (current) generation"""
+        if not self.enabled or generation is None:
+            return None
+        try:
+            key = self._key(generation, query, pool_size)
+            cached = self.redis_client.get(key)
+            if cached:
+                self.hits += 1
+                return [
+                    {"document_id": doc_id, "score": score}
+                    for doc_id, score in json.loads(cached)
+                ]
+        except Exception as e:
+            print(f"Result cache get error: {e}")
+        self.misses += 1
+        return None
+
+    def set(self, query: str, pool_size: int, results: List[Dict[str, Any]], generation: Optional[int]):
+        """
+        Cache fused results under the generation read before the search started
+
+        Storing under the earlier generation means a write that lands while
+        the search runs can never leave its result behind in a newer entry.
+        """
+        if not self.enabled or generation is None:
+            return
+        try:
+            key = self._key(generation, query, pool_size)
+            payload = json.dumps([[r["document_id"], r["score"]] for r in results])
+            self.redis_client.setex(key, self.ttl, payload)
+        except Exception as e:
+            print(f"Result cache set error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current generation"""
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generation": self.get_generation(),
+        }
+
+
+# Global result cache instance
+result_cache = None
+
+def get_result_cache() -> ResultCache:
+    """Get or create result cache singleton"""
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache()
+    return result_cache
@@ -5,8 +5,13 @@ from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import Document, DocumentEmbedding, ImageEmbedding
 from embedding_service import get_embedding_service
+from embedding_batcher import get_embedding_batcher
+from embedding_cache import get_embedding_cache
+from result_cache import get_result_cache
 from tokenizer_service import get_tokenizer_service
+from database import AsyncSessionLocal
 from config import settings
+import asyncio
 import redis
 import json
 import time
@@ -17,6 +22,9 @@ class SearchService:
     
     def __init__(self):
         self.embedding_service = get_embedding_service()
+        self.embedding_batcher = get_embedding_batcher()
+        self.embedding_cache = get_embedding_cache()
+        self.result_cache = get_result_cache()
         self.tokenizer_service = get_tokenizer_service()
         self.redis_client = redis.Redis(
             host=settings.REDIS_HOST,
@@ -70,6 +78,9 @@ class SearchService:
         """
         Hybrid search combining BM25 and vector similarity
         
+        Vector and BM25 branches run concurrently, each on its own pooled
+        connection, so the given session is not used for retrieval.
+        
         Args:
             query: Search query text (will be tokenized)
             session: Database session
@@ -84,18 +95,52 @@ class SearchService:
         # Tokenize query for BM25
         tokenized_query = self.preprocess_query(query)
         
-        # Get query embedding (use original query for semantic search)
-        query_embedding = self.embedding_service.encode_text(query)[0]
-        
-        # 1. Vector search using HNSW index
-        vector_results = await self._vector_search(query_embedding, session, top_k * 2)
+        # 结果缓存：键包含索引版本号，任何写入后旧结果自动失效（同步 Redis 调用，放到线程中执行）
+        generation, cached_results = await asyncio.to_thread(self._lookup_result_cache, query, top_k)
+        if cached_results is not None:
+            self._log_search_trace({
+                "query": query,
+                "timestamp": time.time(),
+                "tokens": tokenized_query.split(" "),
+                "vector_results_count": 0,
+                "bm25_results_count": 0,
+                "vector_top_5": {},
+                "bm25_top_5": {},
+                "final_results": cached_results,
+                "weights": {
+                    "vector": settings.VECTOR_WEIGHT,
+                    "bm25": settings.BM25_WEIGHT
+                },
+                "result_cache": "hit",
+                "index_generation": generation
+            })
+            return cached_results
         
-        # 2. BM25 full-text search (with tokenized query)
-        bm25_results = await self._bm25_search(tokenized_query, session, top_k * 2)
+        # 两路检索并行执行，各自使用独立的连接池连接和超时
+        # BM25 分支不依赖向量，在 CLIP 编码查询的同时就开始
+        branches = {}
+        vector_task = asyncio.create_task(self._run_branch(
+            "vector",
+            self._vector_branch(query, top_k * 2),
+            settings.VECTOR_SEARCH_TIMEOUT,
+            branches
+        ))
+        bm25_task = asyncio.create_task(self._run_branch(
+            "bm25",
+            self._bm25_branch(tokenized_query, top_k * 2),
+            settings.BM25_SEARCH_TIMEOUT,
+            branches
+        ))
+        vector_results, bm25_results = await asyncio.gather(vector_task, bm25_task)
         
-        # 3. Combine and re-rank results
+        # Combine and re-rank results (partial if a branch was late)
         combined_results = self._hybrid_rerank(vector_results, bm25_results, top_k)
         
+        # 部分结果不缓存
+        partial = any(b["status"] != "ok" for b in branches.values())
+        if not partial:
+            await asyncio.to_thread(self.result_cache.set, query, top_k, combined_results, generation)
+        
         # Log trace data
         self._log_search_trace({
             "query": query,
@@ -109,11 +154,20 @@ class SearchService:
             "weights": {
                 "vector": settings.VECTOR_WEIGHT,
                 "bm25": settings.BM25_WEIGHT
-            }
+            },
+            "branches": branches,
+            "partial": partial,
+            "result_cache": "miss",
+            "index_generation": generation
         })
         
         return combined_results
     
+    def _lookup_result_cache(self, query: str, top_k: int):
+        """(index generation, cached results or None) in one worker-thread hop"""
+        generation = self.result_cache.get_generation()
+        return generation, self.result_cache.get(query, top_k, generation)
+    
     async def search_by_image(
         self,
         image_base64: str,
@@ -124,8 +178,13 @@ class SearchService:
         Search for documents using an image (Image-to-Text/Document search via CLIP)
         """
         try:
-            # 1. Generate image embedding
-            image_embedding = self.embedding_service.encode_image_base64(image_base64)
+            # 1. Generate image embedding (cache lookups and encoding off the event loop)
+            image_embedding = await asyncio.to_thread(self.embedding_cache.get, image_base64, "image")
+            if image_embedding is None:
+                image_embedding = await asyncio.to_thread(
+                    self.embedding_service.encode_image_base64, image_base64
+                )
+                await asyncio.to_thread(self.embedding_cache.set, image_base64, image_embedding, "image")
             
             # 2. Vector search in document_embeddings 
             # (Find documents whose textual content matches the image content)
@@ -155,6 +214,51 @@ class SearchService:
             traceback.print_exc()
             return []
     
+    async def _run_branch(
+        self,
+        name: str,
+        coro,
+        timeout: float,
+        branches: Dict[str, Dict[str, Any]]
+    ) -> Dict[int, float]:
+        """
+        Run one retrieval branch with its own timeout
+        
+        A late branch yields an empty result (the fusion becomes partial)
+        instead of failing the request; its status is recorded in branches.
+        """
+        start = time.time()
+        try:
+            results = await asyncio.wait_for(coro, timeout=timeout)
+            status = "ok"
+        except asyncio.TimeoutError:
+            print(f"⚠ {name} search timed out after {timeout}s, returning partial results")
+            results = {}
+            status = "timeout"
+        branches[name] = {
+            "status": status,
+            "latency_ms": round((time.time() - start) * 1000, 2),
+            "results_count": len(results)
+        }
+        return results
+    
+    async def _vector_branch(self, query: str, limit: int) -> Dict[int, float]:
+        """Encode the query off the event loop, then run vector search on its own connection"""
+        # Get query embedding (use original query for semantic search)
+        # 缓存的 L2 层是同步 Redis 调用，放到线程中执行
+        query_embedding = await asyncio.to_thread(self.embedding_cache.get, query)
+        if query_embedding is None:
+            query_embedding = await self.embedding_batcher.encode_text(query)
+            await asyncio.to_thread(self.embedding_cache.set, query, query_embedding)
+        
+        async with AsyncSessionLocal() as session:
+            return await self._vector_search(query_embedding, session, limit)
+    
+    async def _bm25_branch(self, query: str, limit: int) -> Dict[int, float]:
+        """Run BM25 search on its own connection"""
+        async with AsyncSessionLocal() as session:
+            return await self._bm25_search(query, session, limit)
+    
     async def _vector_search(
         self,
         query_embedding: np.ndarray,
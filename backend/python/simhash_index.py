@@ -0,0 +1,258 @@
+"""
+Near-duplicate detection with SimHash
+
+Mirrors, pagination and tracking-parameter variants of the same page carry
+almost the same text. IndexService fingerprints every new or changed
+document and, when an indexed document is within SIMHASH_MAX_DISTANCE bits,
+stores it as a lightweight row pointing at that canonical document
+(documents.duplicate_of) instead of tokenizing, embedding and posting it.
+
+- Fingerprint: 64-bit SimHash over character 4-gram shingles of the
+  normalized title + content (no tokenizer needed, works for CJK text)
+- Index: the fingerprint is cut into SIMHASH_MAX_DISTANCE + 1 bands; two
+  fingerprints within that distance agree exactly on at least one band
+  (pigeonhole), so only documents sharing a band are compared
+- Only canonical documents are indexed. Changes are staged on the session
+  and applied after commit, like the inverted index. Other processes'
+  writes are picked up by an incremental refresh before lookups.
+"""
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Any
+import numpy as np
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 4
+
+# session.info key used to stage fingerprint changes until commit
+PENDING_KEY = "simhash_pending"
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_PRIME = np.uint64(1099511628211)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, spreads shingle hashes over all 64 bits"""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def fingerprint(title: str, content: str) -> Optional[int]:
+    """
+    64-bit SimHash of a document (None when the text is too short to compare)
+
+    Whitespace and punctuation are dropped before shingling, so formatting
+    and boilerplate punctuation differences do not move the fingerprint.
+    """
+    normalized = _NON_WORD.sub("", f"{title} {content}".lower())
+    if len(normalized) < max(settings.SIMHASH_MIN_LENGTH, SHINGLE_SIZE):
+        return None
+
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(codes) - SHINGLE_SIZE + 1
+    shingles = np.zeros(n, dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        shingles = shingles * _PRIME + codes[i:i + n]
+
+    bits = np.unpackbits(_mix64(shingles).view(np.uint8).reshape(n, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > n
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit fingerprint -> BIGINT column value"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    """BIGINT column value -> unsigned 64-bit fingerprint"""
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimHashIndex:
+    """In-memory banded fingerprint index of canonical documents"""
+
+    def __init__(self, max_distance: Optional[int] = None):
+        self.max_distance = settings.SIMHASH_MAX_DISTANCE if max_distance is None else max_distance
+        self.bands = min(self.max_distance + 1, FINGERPRINT_BITS)
+        # 各 band 的位宽（前几个 band 多分到余数位）
+        widths = [FINGERPRINT_BITS // self.bands + (i < FINGERPRINT_BITS % self.bands) for i in range(self.bands)]
+        self._shifts = [FINGERPRINT_BITS - sum(widths[:i + 1]) for i in range(self.bands)]
+        self._masks = [(1 << w) - 1 for w in widths]
+
+        self.fingerprints: Dict[int, int] = {}
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self._refreshed_at: Optional[float] = None  # DB epoch watermark
+
+        self.checked = 0
+        self.duplicates = 0
+        self.skipped_chars = 0
+        self.skipped_images = 0
+
+    def _keys(self, value: int) -> List[int]:
+        return [(value >> shift) & mask for shift, mask in zip(self._shifts, self._masks)]
+
+    def add(self, document_id: int, value: int):
+        """Index (or re-index) a canonical document's fingerprint"""
+        self.remove(document_id)
+        self.fingerprints[document_id] = value
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(document_id)
+
+    def remove(self, document_id: int):
+        value = self.fingerprints.pop(document_id, None)
+        if value is None:
+            return
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table.get(key)
+            if bucket is None:
+                continue
+            bucket.remove(document_id)
+            if not bucket:
+                del table[key]
+
+    def candidates(self, value: int, exclude: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Indexed documents within max_distance bits, nearest first: [(document_id, distance)]"""
+        seen = set()
+        matches = []
+        for table, key in zip(self._tables, self._keys(value)):
+            for document_id in table.get(key, ()):
+                if document_id in seen or document_id == exclude:
+                    continue
+                seen.add(document_id)
+                distance = bin(self.fingerprints[document_id] ^ value).count("1")
+                if distance <= self.max_distance:
+                    matches.append((document_id, distance))
+        return sorted(matches, key=lambda m: (m[1], m[0]))
+
+    async def refresh(self, session: AsyncSession):
+        """Pick up canonical documents written since the last refresh (full load the first time)"""
+        epoch = float((await session.execute(
+            text("SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)")
+        )).scalar())
+        if self._refreshed_at is None:
+            result = await session.execute(text("""
+                SELECT id, simhash, duplicate_of FROM documents WHERE simhash IS NOT NULL
+            """))
+        else:
+            result = await session.execute(text("""
+                SELECT id, simhash, duplicate_of FROM documents
+                WHERE updated_at >= to_timestamp(:since)
+            """), {"since": self._refreshed_at - settings.INVERTED_INDEX_SYNC_LOOKBACK})
+        for document_id, value, duplicate_of in result:
+            if value is None or duplicate_of is not None:
+                self.remove(document_id)
+            else:
+                self.add(document_id, to_unsigned(value))
+        self._refreshed_at = epoch
+
+    async def find_canonical(
+        self,
+        session: AsyncSession,
+        value: Optional[int],
+        exclude: Optional[int] = None
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Nearest live canonical document for a fingerprint: (document_id, distance)
+
+        Candidates are confirmed against the documents table, so entries
+        deleted by other processes are dropped instead of being referenced.
+        """
+        return (await self.find_canonical_many(session, [(value, exclude)]))[0]
+
+    async def find_canonical_many(
+        self,
+        session: AsyncSession,
+        lookups: List[Tuple[Optional[int], Optional[int]]]
+    ) -> List[Optional[Tuple[int, int]]]:
+        """find_canonical for a batch of (fingerprint, exclude) pairs, confirmed in one query"""
+        if not settings.SIMHASH_ENABLED:
+            return [None] * len(lookups)
+        if any(value is not None for value, _ in lookups) and (
+            self._refreshed_at is None
+            or time.time() - self._refreshed_at > settings.INVERTED_INDEX_SYNC_INTERVAL
+        ):
+            await self.refresh(session)
+
+        all_matches = []
+        for value, exclude in lookups:
+            if value is None:
+                all_matches.append([])
+                continue
+            self.checked += 1
+            all_matches.append(self.candidates(value, exclude=exclude))
+
+        ids = {document_id for matches in all_matches for document_id, _ in matches}
+        if not ids:
+            return [None] * len(lookups)
+        result = await session.execute(text("""
+            SELECT id FROM documents WHERE id = ANY(:ids) AND duplicate_of IS NULL
+        """), {"ids": list(ids)})
+        live = {row.id for row in result}
+        for document_id in ids - live:
+            self.remove(document_id)
+        return [
+            next(((document_id, distance) for document_id, distance in matches if document_id in live), None)
+            for matches in all_matches
+        ]
+
+    def record_skip(self, content: str, images: Optional[List[Dict]]):
+        """Count the work saved by collapsing a near-duplicate"""
+        self.duplicates += 1
+        self.skipped_chars += len(content)
+        self.skipped_images += len((images or [])[:4])
+
+    def stage_add(self, session: AsyncSession, document_id: int, value: Optional[int]):
+        """Stage a canonical fingerprint (None removes it); applied after the session commits"""
+        session.info.setdefault(PENDING_KEY, []).append((document_id, value))
+
+    def apply_pending(self, pending: List[Tuple[int, Optional[int]]]):
+        for document_id, value in pending:
+            if value is None:
+                self.remove(document_id)
+            else:
+                self.add(document_id, value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Fingerprint index size and skip counters"""
+        return {
+            "enabled": settings.SIMHASH_ENABLED,
+            "max_distance": self.max_distance,
+            "bands": self.bands,
+            "fingerprints": len(self.fingerprints),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / self.checked if self.checked else 0.0,
+            "skipped_chars": self.skipped_chars,
+            "skipped_images": self.skipped_images,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        get_simhash_index().apply_pending(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Global SimHash index instance
+simhash_index = None
+
+def get_simhash_index() -> SimHashIndex:
+    """Get or create SimHash index singleton"""
+    global simhash_index
+    if simhash_index is None:
+        simhash_index = SimHashIndex()
+    return simhash_index
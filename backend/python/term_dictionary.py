@@ -0,0 +1,199 @@
+"""
+In-process term dictionary (term -> terms.id)
+
+A bounded LRU map shared by every indexing task in the process. Unknown
+terms are resolved with a single set-based upsert per document (or batch)
+instead of one INSERT/SELECT round trip per token.
+
+Only committed ids are shared: ids of rows that already existed are cached
+immediately, ids of rows this transaction inserted are staged in
+session.info and published after commit (dropped on rollback), so no other
+task can reference a term row that might still disappear.
+
+A cached id can still go stale: the orphan-term cleanup (in this or any
+other process) may delete the row at any time. resolve() therefore takes a
+FOR KEY SHARE lock on every id it returns. The cleanup skips locked rows
+until the transaction ends, and ids whose rows are already gone are
+resolved again, so the postings written afterwards never fail their
+foreign key.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Any, List, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from config import settings
+
+# session.info key for ids inserted by the current transaction
+PENDING_KEY = "term_dictionary_pending"
+
+
+class TermDictionary:
+    """Bounded term -> id cache with set-based resolution of misses"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.TERM_DICTIONARY_SIZE
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.statements = 0
+
+    async def resolve(self, terms: Iterable[str], session: AsyncSession) -> Dict[str, int]:
+        """
+        Map terms to term ids, creating missing terms
+
+        Misses are upserted in one statement (sorted, so concurrent writers
+        take row locks in the same order); a second SELECT is only needed for
+        terms a concurrent transaction committed while the upsert ran.
+        Returned ids are locked FOR KEY SHARE until the transaction ends
+        (one statement), so the orphan-term cleanup cannot delete them.
+
+        Returns:
+            {term: term_id} for every input term
+        """
+        pending = session.info.get(PENDING_KEY, {})
+        resolved = {}
+        cached = {}
+        missing = []
+        with self._lock:
+            for term in set(terms):
+                term_id = self._ids.get(term)
+                if term_id is not None:
+                    self._ids.move_to_end(term)
+                    cached[term] = term_id
+                elif term in pending:
+                    resolved[term] = pending[term]
+                else:
+                    missing.append(term)
+            self.hits += len(cached) + len(resolved)
+            self.misses += len(missing)
+
+        # 缓存的 id 可能已被孤立 term 清理删除：锁定仍存在的行，其余重新解析
+        stale = await self._lock_rows(cached, session)
+        if stale:
+            self.discard(stale)
+            missing.extend(stale)
+        resolved.update({term: term_id for term, term_id in cached.items() if term not in stale})
+
+        for _ in range(3):
+            if not missing:
+                break
+            existing, created = await self._upsert(missing, session)
+            # 已存在的行在 upsert 之后、加锁之前也可能被清理
+            missing = await self._lock_rows(existing, session)
+            existing = {term: term_id for term, term_id in existing.items() if term not in missing}
+
+            self._put(existing)
+            if created:
+                session.info.setdefault(PENDING_KEY, {}).update(created)
+            resolved.update(existing)
+            resolved.update(created)
+        if missing:
+            raise Exception(f"Failed to get or create terms: {missing[:10]}")
+        return resolved
+
+    async def _lock_rows(self, ids: Dict[str, int], session: AsyncSession) -> List[str]:
+        """FOR KEY SHARE-lock the term rows, return the terms whose rows no longer exist"""
+        if not ids:
+            return []
+        result = await session.execute(text("""
+            SELECT id FROM terms WHERE id = ANY(:term_ids) ORDER BY id FOR KEY SHARE
+        """), {"term_ids": list(ids.values())})
+        self.statements += 1
+        live = {row.id for row in result}
+        return [term for term, term_id in ids.items() if term_id not in live]
+
+    async def _upsert(self, missing: List[str], session: AsyncSession) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Insert missing terms in one statement: ({term: id} of existing rows, {term: id} of inserted rows)"""
+        missing = sorted(missing)
+        result = await session.execute(text("""
+            WITH input AS (
+                SELECT DISTINCT t AS term FROM unnest(CAST(:terms AS varchar[])) AS t
+            ),
+            inserted AS (
+                INSERT INTO terms (term, doc_frequency, total_frequency)
+                SELECT term, 0, 0 FROM input ORDER BY term
+                ON CONFLICT (term) DO NOTHING
+                RETURNING id, term
+            )
+            SELECT id, term, TRUE AS inserted FROM inserted
+            UNION ALL
+            SELECT terms.id, terms.term, FALSE AS inserted
+            FROM terms JOIN input ON terms.term = input.term
+        """), {"terms": missing})
+        self.statements += 1
+
+        existing, created = {}, {}
+        for row in result:
+            (created if row.inserted else existing)[row.term] = row.id
+
+        # 冲突但不在语句快照中的 term（并发事务刚提交）
+        unresolved = [term for term in missing if term not in existing and term not in created]
+        if unresolved:
+            result = await session.execute(
+                text("SELECT id, term FROM terms WHERE term = ANY(:terms)"),
+                {"terms": unresolved}
+            )
+            self.statements += 1
+            existing.update({row.term: row.id for row in result})
+            unresolved = [term for term in unresolved if term not in existing]
+            if unresolved:
+                raise Exception(f"Failed to get or create terms: {unresolved[:10]}")
+        return existing, created
+
+    def _put(self, ids: Dict[str, int]):
+        with self._lock:
+            for term, term_id in ids.items():
+                self._ids[term] = term_id
+                self._ids.move_to_end(term)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+    def discard(self, terms: Iterable[str]):
+        """Forget terms whose rows were deleted"""
+        with self._lock:
+            for term in terms:
+                self._ids.pop(term, None)
+
+    def clear(self):
+        """Drop every cached id"""
+        with self._lock:
+            self._ids.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "statements": self.statements,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    created = session.info.pop(PENDING_KEY, None)
+    if created:
+        get_term_dictionary()._put(created)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Global term dictionary instance
+term_dictionary = None
+
+def get_term_dictionary() -> TermDictionary:
+    """Get or create term dictionary singleton"""
+    global term_dictionary
+    if term_dictionary is None:
+        term_dictionary = TermDictionary()
+    return term_dictionary
@@ -4,6 +4,7 @@
 import asyncio
 from sqlalchemy import text
 from database import AsyncSessionLocal
+import positions_codec
 
 async def test_posting_list():
     """查看posting list表内容"""
@@ -46,7 +47,7 @@ async def test_posting_list():
         test_term = "learning"  # 可以改成其他词
         print(f"【4】词'{test_term}'的倒排列表:")
         result = await session.execute(text("""
-            SELECT d.id, d.title, p.term_frequency, p.positions[1:5] as positions_sample
+            SELECT d.id, d.title, p.term_frequency, p.positions
             FROM postings p
             JOIN terms t ON p.term_id = t.id
             JOIN documents d ON p.document_id = d.id
@@ -61,7 +62,7 @@ async def test_posting_list():
             print(f"  文档ID: {row.id}")
             print(f"  标题: {row.title[:60]}...")
             print(f"  词频(TF): {row.term_frequency}")
-            print(f"  位置(前5个): {row.positions_sample}")
+            print(f"  位置(前5个): {positions_codec.decode_list(bytes(row.positions))[:5] if row.positions else []}")
             print()
         
         if not found:
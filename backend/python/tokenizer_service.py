@@ -1,13 +1,22 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import jieba
 import jieba.analyse
 from typing import List, Optional
 
+# Batches smaller than this are tokenized in-process (worker round trips cost more)
+PARALLEL_MIN_TEXTS = 8
+
 class TokenizerService:
     """Service for Chinese and English text tokenization"""
     
     def __init__(self):
         # Load jieba dictionary (will be loaded on first use)
         jieba.initialize()
+        self._pool: Optional[ProcessPoolExecutor] = None
         print("Jieba tokenizer initialized")
     
     def tokenize(self, text: str, mode: str = "search") -> List[str]:
@@ -36,6 +45,40 @@ class TokenizerService:
         
         return tokens
     
+    async def tokenize_many(self, texts: List[str], mode: str = "search") -> List[List[str]]:
+        """
+        Tokenize a batch of texts in parallel worker processes
+        
+        jieba is pure Python and holds the GIL, so threads do not help;
+        the batch is split across a process pool instead.
+        
+        Returns:
+            One token list per input text, in order
+        """
+        from config import settings
+        
+        # 超过 CPU 核数的 worker 只会互相抢占，还要各自多占一份内存（见下）
+        workers = min(settings.INDEX_TOKENIZE_WORKERS, os.cpu_count() or 1)
+        if workers <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+            return [self.tokenize(text, mode) for text in texts]
+        
+        if self._pool is None:
+            # spawn: 不继承父进程的线程和锁（fork 会）。但子进程会重新导入父进程的 __main__：
+            # `uvicorn main:app` 下只是 uvicorn 的入口，`python main.py` / ingest_worker.py
+            # 下则会连带导入 torch 等依赖（模型本身按需加载，不会在 worker 里加载）
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_tokenizer_service
+            )
+        
+        chunksize = max(1, len(texts) // (workers * 4))
+        pool = self._pool
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: list(pool.map(partial(_tokenize_in_worker, mode=mode), texts, chunksize=chunksize))
+        )
+    
     def extract_keywords(self, text: str, top_k: int = 10) -> List[str]:
         """
         Extract keywords from text using TF-IDF
@@ -61,6 +104,10 @@ class TokenizerService:
         words = pseg.cut(text)
         return [(word, flag) for word, flag in words]
 
+def _tokenize_in_worker(text: str, mode: str) -> List[str]:
+    """Process pool entry point"""
+    return get_tokenizer_service().tokenize(text, mode)
+
 # Global tokenizer service instance
 tokenizer_service = None
 
@@ -17,6 +17,7 @@ import sys
 import os
 from sqlalchemy import text
 from database import AsyncSessionLocal
+from doc_stats_service import get_doc_stats_service
 
 async def update_term_stats():
     """批量更新 terms 表的统计信息"""
@@ -53,43 +54,16 @@ async def update_term_stats():
             raise
 
 async def update_doc_stats():
-    """更新全局文档统计信息"""
-    print("🔄 开始更新文档统计...")
+    """重新统计全局文档信息（纠正增量维护的漂移）"""
+    print("🔄 开始校准文档统计...")
     
     async with AsyncSessionLocal() as session:
         try:
-            # 计算总文档数和平均文档长度
-            stats_query = text("""
-                SELECT 
-                    COUNT(*) as total_docs,
-                    COALESCE(AVG(doc_length), 0) as avg_doc_length
-                FROM documents
-                WHERE doc_length > 0
-            """)
-            result = await session.execute(stats_query)
-            row = result.first()
-            
-            if row:
-                total_docs, avg_doc_length = row[0], row[1]
-                
-                # 更新 doc_stats 表
-                update_query = text("""
-                    INSERT INTO doc_stats (id, total_docs, avg_doc_length, updated_at)
-                    VALUES (1, :total_docs, :avg_doc_length, CURRENT_TIMESTAMP)
-                    ON CONFLICT (id) 
-                    DO UPDATE SET 
-                        total_docs = :total_docs,
-                        avg_doc_length = :avg_doc_length,
-                        updated_at = CURRENT_TIMESTAMP
-                """)
-                await session.execute(update_query, {
-                    "total_docs": total_docs,
-                    "avg_doc_length": avg_doc_length
-                })
-                
-                await session.commit()
-                print(f"✅ 文档统计更新: total_docs={total_docs}, avg_doc_length={avg_doc_length:.2f}")
-            
+            drift = await get_doc_stats_service().reconcile(session)
+            print(
+                f"✅ 文档统计更新: total_docs={drift['total_docs']}, total_length={drift['total_length']} "
+                f"(漂移 {drift['doc_drift']:+d} 文档 / {drift['length_drift']:+d} tokens)"
+            )
         except Exception as e:
             await session.rollback()
             print(f"❌ 更新文档统计失败: {e}")
@@ -101,9 +75,18 @@ async def cleanup_orphaned_terms():
     
     async with AsyncSessionLocal() as session:
         try:
+            # SKIP LOCKED: 跳过正被索引事务引用的 term
             cleanup_query = text("""
-                DELETE FROM terms 
-                WHERE id NOT IN (SELECT DISTINCT term_id FROM postings)
+                DELETE FROM terms
+                WHERE id IN (
+                    SELECT t.id FROM terms t
+                    WHERE t.doc_frequency = 0
+                      AND NOT EXISTS (SELECT 1 FROM postings p WHERE p.term_id = t.id)
+                    FOR UPDATE SKIP LOCKED
+                )
+                -- NOT EXISTS 基于语句快照；快照之后提交的写入方同时增加了 doc_frequency，
+                -- READ COMMITTED 会用最新行版本重新检查这个条件，不会删掉刚被引用的 term
+                AND doc_frequency = 0
             """)
             result = await session.execute(cleanup_query)
             deleted_count = result.rowcount
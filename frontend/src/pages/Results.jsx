@@ -257,7 +257,7 @@ const Results = () => {
                                                     <Box
                                                         key={idx}
                                                         component="img"
-                                                        src={img.base64_data ? `data:image/jpeg;base64,${img.base64_data}` : img.url}
+                                                        src={img.src ? `http://localhost:8001${img.src}?variant=thumb` : (img.base64_data ? `data:image/jpeg;base64,${img.base64_data}` : img.url)}
                                                         alt={img.alt_text || 'Result image'}
                                                         title={img.alt_text}
                                                         sx={{
@@ -10,14 +10,28 @@ CREATE TABLE IF NOT EXISTS documents (
     id SERIAL PRIMARY KEY,
     title TEXT NOT NULL,
     content TEXT NOT NULL,
+    content_hash VARCHAR(64),            -- 标题+内容的SHA-256，重新抓取时跳过未变化的文档
     url TEXT,
     source_type VARCHAR(50),
     doc_metadata JSONB,
     doc_length INTEGER DEFAULT 0,  -- 文档长度（分词后的token数）
+    simhash BIGINT,                -- 标题+内容的 64 位 SimHash（有符号存储）
+    duplicate_of INTEGER REFERENCES documents(id) ON DELETE SET NULL,  -- 近似重复文档指向的规范文档（自身没有 posting 和向量）
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed image store (图片按SHA-256去重存储，文档只保存引用)
+CREATE TABLE IF NOT EXISTS image_store (
+    hash VARCHAR(64) PRIMARY KEY,
+    mime_type VARCHAR(50),
+    width INTEGER,
+    height INTEGER,
+    size_bytes INTEGER,
+    data BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Terms table (词项表)
 CREATE TABLE IF NOT EXISTS terms (
     id SERIAL PRIMARY KEY,
@@ -33,15 +47,59 @@ CREATE TABLE IF NOT EXISTS postings (
     term_id INTEGER NOT NULL REFERENCES terms(id) ON DELETE CASCADE,
     document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
     term_frequency INTEGER NOT NULL,     -- 该词在文档中的词频(TF)
-    positions INTEGER[],                 -- 词在文档中的位置（可选，用于短语查询）
+    doc_length INTEGER,                  -- 文档长度（documents.doc_length 的副本，BM25 无需连接 documents）
+    positions BYTEA,                     -- 词在文档中的位置，delta varint 编码（用于短语查询）
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(term_id, document_id)
 );
 
+-- Block-packed posting lists (按块打包的倒排列表，BM25_STRATEGY=blocks 使用)
+-- 每个 term 少量几行，每行最多 64 个块，每块 128 个 posting（varint 编码）
+CREATE TABLE IF NOT EXISTS posting_blocks (
+    term_id INTEGER NOT NULL REFERENCES terms(id) ON DELETE CASCADE,
+    chunk_no INTEGER NOT NULL,               -- term 内的行号
+    posting_count INTEGER NOT NULL,
+    block_last_doc INTEGER[] NOT NULL,       -- 每块最后一个文档ID（跳块索引）
+    block_max_tf INTEGER[] NOT NULL,         -- 每块最大词频
+    block_min_doc_length INTEGER[] NOT NULL, -- 每块最短文档长度（与最大词频一起给出块内最大得分上界）
+    block_offsets INTEGER[] NOT NULL,        -- 每块在 data 中的字节偏移
+    data BYTEA NOT NULL,                     -- 每块：文档ID差值 | 词频 | 文档长度
+    PRIMARY KEY (term_id, chunk_no)
+);
+
+-- 待重新打包的 term（写入事务中登记，后台任务处理）
+CREATE TABLE IF NOT EXISTS posting_blocks_dirty (
+    term_id INTEGER PRIMARY KEY,
+    marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Quantized impact-ordered postings (量化的 BM25 impact，BM25_STRATEGY=impact 使用)
+-- 每个 (term, impact) 一行，文档ID delta varint 编码
+CREATE TABLE IF NOT EXISTS impact_postings (
+    term_id INTEGER NOT NULL REFERENCES terms(id) ON DELETE CASCADE,
+    impact SMALLINT NOT NULL,                -- 1..255
+    doc_count INTEGER NOT NULL,
+    last_doc INTEGER NOT NULL,               -- 段内最大文档ID
+    doc_ids BYTEA NOT NULL,
+    PRIMARY KEY (term_id, impact)
+);
+
+-- impact 量化时使用的统计信息（avg_doc_length 漂移超过阈值时全量重建）
+CREATE TABLE IF NOT EXISTS impact_index_meta (
+    id INTEGER PRIMARY KEY,
+    total_docs INTEGER NOT NULL,
+    avg_doc_length FLOAT NOT NULL,
+    k1 FLOAT NOT NULL,
+    b FLOAT NOT NULL,
+    scale FLOAT NOT NULL,                    -- impact 255 对应的 BM25 分数
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Document statistics (文档统计信息，用于BM25计算)
 CREATE TABLE IF NOT EXISTS doc_stats (
     id SERIAL PRIMARY KEY,
     total_docs INTEGER DEFAULT 0,        -- 总文档数
+    total_length BIGINT DEFAULT 0,       -- 文档长度总和（增量维护）
     avg_doc_length FLOAT DEFAULT 0,      -- 平均文档长度
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -71,9 +129,12 @@ CREATE INDEX IF NOT EXISTS terms_term_idx ON terms(term);
 CREATE INDEX IF NOT EXISTS postings_term_id_idx ON postings(term_id);
 CREATE INDEX IF NOT EXISTS postings_doc_id_idx ON postings(document_id);
 CREATE INDEX IF NOT EXISTS postings_term_doc_idx ON postings(term_id, document_id);
+-- BM25 覆盖索引（index-only scan）
+CREATE INDEX IF NOT EXISTS postings_bm25_covering_idx ON postings(term_id) INCLUDE (document_id, term_frequency, doc_length);
 
 -- Index for documents
 CREATE INDEX IF NOT EXISTS documents_created_at_idx ON documents(created_at DESC);
+CREATE INDEX IF NOT EXISTS ix_documents_duplicate_of ON documents(duplicate_of);
 
 -- ========================================
 